@@ -15,14 +15,16 @@ import lorahat.sx126x
 # Local
 import constants
 import image
+from lora_frames import take_frames, MAX_DATA_SIZE
 
-MAX_DATA_SIZE = 230
 MAX_CHUNK_SIZE = 210
 
 FREQ = 868
 AIRSPEED = 62500
 MIN_SLEEP_READ = 0.05
 MIN_SLEEP_WRITE = 0.1
+READ_TIMEOUT = 0.5       # ser.read() returns after this long without data, the reader thread then loops
+PARTIAL_FRAME_TIMEOUT = 2.0  # a frame that stops arriving half way is dropped after this long
 
 hname = socket.gethostname()
 my_addr = constants.HN_ID[hname]
@@ -368,36 +370,27 @@ class RFComm:
         t2 = time.time()
         print(f"Time taken to read = {t2-t1} secs")
 
-    def _read_from_rf(self):
-        bytecount = self.loranode.ser.inWaiting()
-        if bytecount > 0:
-            t1 = time.time()
-            print(f"Reading at time {t1}")
-            time.sleep(MIN_SLEEP_READ) # Too long :-(
-            bytecount = self.loranode.ser.inWaiting()
-            print(f"Going to read {bytecount} bytes from buffer")
-            r_buff = b''
-            if bytecount < 4:
-                r_buff = self.loranode.ser.read(bytecount)
-                print(f"Reading too few bytes, seems like an error : {r_buff}")
-                return
-            else:
-                r_buff = self.loranode.ser.read(4)
-                sender_addr = int(r_buff[0]<<8) + int(r_buff[1])
-                payload_len = int(r_buff[3])
-                r_buff = self.loranode.ser.read(payload_len)
-                msgstr = r_buff.decode()
-                if bytecount > payload_len + 4:
-                    print(f" ===========> We seem to have dangling data of size : {bytecount - payload_len - 4}")
-                    self.loranode.ser.read(bytecount - payload_len - 4)
-                    self.loranode.ser.cancel_read()
-                    self.loranode.ser.reset_input_buffer()
+    def _read_from_rf(self, buf):
+        # Blocks in ser.read() until data comes in or READ_TIMEOUT, no spinning on inWaiting().
+        # Returns True if anything was read.
+        with self.loranode_read_lock:
+            ser = self.loranode.ser
+            if ser.timeout != READ_TIMEOUT:
+                ser.timeout = READ_TIMEOUT
+            data = ser.read(max(1, ser.in_waiting))
+        if not data:
+            return False
+        buf.extend(data)
+        for sender_addr, payload, rssi in take_frames(buf, self.loranode.rssi, self.loranode.offset_freq):
+            try:
+                msgstr = payload.decode()
+            except UnicodeDecodeError as e:
+                logger.error(f"Dropping undecodable frame of {len(payload)} bytes from @{sender_addr}: {e}")
+                continue
             self.last_receive_ts = time.time()
-            printstr = f"## Received ## ## From @{sender_addr} : Msg = {msgstr}##"
-            print(printstr)
+            print(f"## Received ## ## From @{sender_addr} : Msg = {msgstr}##")
             self.mq.put(msgstr)
-            t2 = time.time()
-            print(f"Time taken to read = {t2-t1} secs")
+        return True
 
     def _keep_processing(self):
         while True:
@@ -426,16 +419,20 @@ class RFComm:
             self.mq.task_done()
 
     def _keep_reading_from_rf(self):
+        # Frames are parsed from buf as the bytes come in, back to back frames of one read stay intact
+        buf = bytearray()
+        last_data_ts = time.time()
         while True:
-            with self.loranode_read_lock:
-                try:
-                    self._read_from_rf()
-                except IndexError as i:
-                    print(f"[INFO ] No data received .. {i}")
-                    continue
-                except Exception as e:
-                    print(f"[ERROR] Receiving failed: {e}")
-                    continue
+            try:
+                if self._read_from_rf(buf):
+                    last_data_ts = time.time()
+                elif buf and time.time() - last_data_ts > PARTIAL_FRAME_TIMEOUT:
+                    logger.warning(f"Dropping {len(buf)} bytes of a frame that stopped arriving : {bytes(buf)}")
+                    buf.clear()
+            except Exception as e:
+                print(f"[ERROR] Receiving failed: {e}")
+                buf.clear()
+                time.sleep(MIN_SLEEP_READ)
 
     # Non blocking, background thread
     def keep_reading(self):
@@ -0,0 +1,30 @@
+# Framing of the bytes the SX126x hat hands over the serial port, kept free of
+# hardware imports so it can be tested on its own.
+#
+# Frame: sender addr (2), freq offset, payload len, payload [, rssi]
+# (dest and freq are stripped by the hat)
+
+MAX_DATA_SIZE = 230
+FRAME_HEADER_LEN = 4     # sender addr (2), freq offset, payload len
+DEFAULT_FREQ_OFFSET = 18 # 868 MHz on the 850 MHz band, what setup_rf() configures
+
+def take_frames(buf, rssi_byte=False, freq_offset=DEFAULT_FREQ_OFFSET):
+    # Cuts complete frames off the front of buf (bytearray), leaves a partial frame in it.
+    # Returns list of (sender_addr, payload bytes, rssi or None).
+    frames = []
+    tail = 1 if rssi_byte else 0
+    while len(buf) >= FRAME_HEADER_LEN:
+        payload_len = buf[3]
+        if buf[2] != freq_offset or payload_len == 0 or payload_len > MAX_DATA_SIZE:
+            # not a header, out of step with the stream: skip a byte and look again
+            del buf[0]
+            continue
+        frame_len = FRAME_HEADER_LEN + payload_len + tail
+        if len(buf) < frame_len:
+            break
+        sender_addr = (buf[0] << 8) + buf[1]
+        payload = bytes(buf[FRAME_HEADER_LEN:FRAME_HEADER_LEN + payload_len])
+        rssi = -(256 - buf[frame_len - 1]) if rssi_byte else None
+        del buf[:frame_len]
+        frames.append((sender_addr, payload, rssi))
+    return frames
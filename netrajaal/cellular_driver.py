@@ -1,91 +1,187 @@
 import time
 import json
-from machine import SPI, Pin
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
 import gc
+import sc16is750
 from logger import logger
 
-class SC16IS750:
-    """ Optimized SC16IS750 driver """
-    
-    def __init__(self, spi_bus=1, cs_pin="P3", baudrate=115200):
-        self.cs = Pin(cs_pin, Pin.OUT)
-        self.cs.value(1)
-        self.spi = SPI(spi_bus, baudrate=500000, polarity=0, phase=0)
-        self._init_uart(baudrate)
-        
-    def _init_uart(self, baudrate):
-        reg = self._read_register(0x0E)
-        self._write_register(0x0E, reg | 0x08)
-        time.sleep_ms(200)
-        
-        divisor = int(14745600 // (baudrate * 16))
-        self._write_register(0x03, 0x80)
-        time.sleep_ms(10)
-        self._write_register(0x00, divisor & 0xFF)
-        self._write_register(0x01, divisor >> 8)
-        self._write_register(0x03, 0x03)
-        time.sleep_ms(10)
-        
-        self._write_register(0x02, 0x07)
-        self._write_register(0x01, 0x00)
-        self._write_register(0x04, 0x00)
-        time.sleep_ms(100)
-        
-        while self._read_register(0x09) > 0:
-            self._read_register(0x00)
-    
-    def _write_register(self, reg, val):
-        self.cs.value(0)
-        time.sleep_us(10)
-        self.spi.write(bytearray([reg << 3]))
-        time.sleep_us(5)
-        self.spi.write(bytearray([val]))
-        time.sleep_us(10)
-        self.cs.value(1)
-        time.sleep_us(50)
-        
-    def _read_register(self, reg):
-        self.cs.value(0)
-        time.sleep_us(10)
-        self.spi.write(bytearray([0x80 | (reg << 3)]))
-        time.sleep_us(5)
-        result = self.spi.read(1)[0]
-        time.sleep_us(10)
-        self.cs.value(1)
-        time.sleep_us(50)
-        return result
-        
-    def write(self, data):
-        for char in data:
-            timeout = 1000
-            while timeout > 0 and (self._read_register(0x05) & 0x20) == 0:
-                time.sleep_us(10)
-                timeout -= 1
-            if timeout > 0:
-                self._write_register(0x00, ord(char))
-            
-    def read(self, timeout_ms=1000):
-        data = ""
-        start_time = time.ticks_ms()
-        
-        while time.ticks_diff(time.ticks_ms(), start_time) < timeout_ms:
-            if self._read_register(0x09) > 0:
-                byte_val = self._read_register(0x00)
-                if (32 <= byte_val <= 126) or byte_val in [10, 13]:
-                    data += chr(byte_val)
+if hasattr(time, "ticks_ms"):
+    ticks_ms = time.ticks_ms
+    ticks_diff = time.ticks_diff
+else:
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+AT_POLL_MS = 20                  # how often the async AT channel checks the bridge FIFO when idle
+AT_WRITE_CHUNK = 256             # bytes written to the bridge between yields to the event loop
+HTTP_ACTION_TIMEOUT_MS = 60000   # max wait for the +HTTPACTION URC after AT+HTTPACTION
+HTTP_READ_TIMEOUT_MS = 10000
+MAX_PENDING_URCS = 20
+
+# Unsolicited result codes, they can show up in the middle of any command response
+URC_PREFIXES = ("+HTTPACTION:", "+HTTP_PEER_CLOSED", "+HTTP_NONET_EVENT", "+CGEV:", "+CPIN:", "RDY", "+CMTI:", "+CRING:")
+# URCs after which the HTTP session has to be set up again
+HTTP_RESET_URCS = ("+HTTP_PEER_CLOSED", "+HTTP_NONET_EVENT", "+CGEV: NW PDN DEACT", "+CGEV: ME PDN DEACT", "RDY")
+
+
+def starts_with_any(line, prefixes):
+    # str.startswith() with a tuple is not available on MicroPython
+    for p in prefixes:
+        if line.startswith(p):
+            return True
+    return False
+
+class SC16IS750(sc16is750.SC16IS750):
+    """ SC16IS750 bridge to the cellular modem, see sc16is750.py """
+
+    def __init__(self, spi_bus=1, cs_pin="P3", baudrate=115200, irq_pin=None):
+        super().__init__(spi_bus, cs_pin, baudrate=baudrate, irq_pin=irq_pin)
+
+class ATChannel:
+    """ Async AT command channel, URCs are picked out of the stream as lines arrive """
+
+    def __init__(self, uart, poll_ms=AT_POLL_MS):
+        # uart: anything with read_available(n) and write(data), e.g. SC16IS750;
+        # wait_readable() / write_async() are used when the bridge driver has them
+        self.uart = uart
+        self.poll_ms = poll_ms
+        self.rx = b""
+        self.lines = []      # response lines not consumed yet
+        self.urcs = []       # URC lines not consumed yet
+        self.lock = asyncio.Lock()
+
+    def _pump(self):
+        got = False
+        while True:
+            data = self.uart.read_available(64)  # one FIFO burst, b"" once the FIFO is empty
+            if not data:
+                return got
+            self.rx += data
+            got = True
+
+    def _split_lines(self):
+        while True:
+            i = self.rx.find(b"\n")
+            if i < 0:
+                return
+            raw = self.rx[:i].strip()
+            self.rx = self.rx[i + 1:]
+            if not raw:
+                continue
+            try:
+                line = raw.decode()
+            except Exception:
+                logger.warning(f"[CELL] dropping undecodable line {raw}")
+                continue
+            if starts_with_any(line, URC_PREFIXES):
+                logger.debug("[CELL] URC %s", line)
+                self.urcs.append(line)
+                if len(self.urcs) > MAX_PENDING_URCS:
+                    self.urcs.pop(0)
             else:
-                time.sleep_ms(10)
-                
-        return data.strip()
+                self.lines.append(line)
+
+    def poll(self):
+        # Input: None; Output: None (takes in whatever the bridge has, without waiting)
+        self._pump()
+        self._split_lines()
+
+    async def _wait_data(self):
+        if not self._pump():
+            if hasattr(self.uart, "wait_readable"):
+                await self.uart.wait_readable(self.poll_ms)  # IRQ wakeup when the bridge has one
+            else:
+                await asyncio.sleep(self.poll_ms / 1000)
+            self._pump()
+        self._split_lines()
+
+    async def write(self, data):
+        # Input: data: str or bytes; Output: int bytes written, short if the bridge stopped taking data
+        # (yields to the event loop between chunks)
+        if hasattr(self.uart, "write_async"):
+            return await self.uart.write_async(data)
+        sent = 0
+        for i in range(0, len(data), AT_WRITE_CHUNK):
+            chunk = data[i:i + AT_WRITE_CHUNK]
+            n = self.uart.write(chunk)
+            sent += len(chunk) if n is None else n
+            if n is not None and n < len(chunk):
+                break
+            await asyncio.sleep(0)
+        return sent
+
+    async def command(self, cmd, timeout_ms=5000, prompt=None):
+        # Input: cmd: str without CRLF (None to only wait), prompt: str e.g. "DOWNLOAD"
+        # Output: tuple(success: bool, lines: list of str), returns as soon as OK / ERROR / prompt arrives
+        self.lines = []
+        if cmd:
+            self.uart.write(cmd + "\r\n")
+        collected = []
+        start = ticks_ms()
+        while ticks_diff(ticks_ms(), start) < timeout_ms:
+            while self.lines:
+                line = self.lines.pop(0)
+                if line == cmd:
+                    continue  # echo
+                collected.append(line)
+                if prompt and line.startswith(prompt):
+                    return True, collected
+                if line == "OK":
+                    return prompt is None, collected
+                if line.startswith("ERROR") or line.startswith("+CME ERROR"):
+                    return False, collected
+            await self._wait_data()
+        logger.warning(f"[CELL] timeout waiting for response to {cmd}")
+        return False, collected
+
+    async def collect_until(self, prefix, timeout_ms):
+        # Input: prefix: str; Output: list of lines up to and including the one starting with prefix, None on timeout
+        collected = []
+        start = ticks_ms()
+        while ticks_diff(ticks_ms(), start) < timeout_ms:
+            while self.lines:
+                line = self.lines.pop(0)
+                collected.append(line)
+                if line.startswith(prefix):
+                    return collected
+            await self._wait_data()
+        return None
+
+    async def wait_urc(self, prefix, timeout_ms):
+        # Input: prefix: str; Output: str URC line or None on timeout
+        start = ticks_ms()
+        while True:
+            for i in range(len(self.urcs)):
+                if self.urcs[i].startswith(prefix):
+                    return self.urcs.pop(i)
+            if ticks_diff(ticks_ms(), start) >= timeout_ms:
+                return None
+            await self._wait_data()
+
+    def pop_urcs(self, prefixes):
+        # Input: prefixes: tuple of str; Output: list of matching URC lines (removed)
+        found = [u for u in self.urcs if starts_with_any(u, prefixes)]
+        if found:
+            self.urcs = [u for u in self.urcs if not starts_with_any(u, prefixes)]
+        return found
+
 
 class Cellular:
     """cellular system - initialize once, use continuously"""
     
-    def __init__(self):
-        self.uart = SC16IS750()
+    def __init__(self, uart=None):
+        self.uart = uart if uart is not None else SC16IS750()
+        self.at = ATChannel(self.uart)
         self.connected = False
         self.ip_address = None
         self.http_initialized = False
+        self.http_params = {}  # HTTPPARA name -> value currently set on the modem
         self.working_apn = None
         self.upload_count = 0
         
@@ -280,6 +376,8 @@ class Cellular:
                 data_payload['upload_id'] = self.upload_count
                 data_payload['timestamp'] = time.ticks_ms()
                 json_data = json.dumps(data_payload)
+            elif isinstance(data_payload, (list, tuple)):
+                json_data = json.dumps(data_payload) # batched uplink, JSON array
             else:
                 json_data = str(data_payload)
             
@@ -369,6 +467,160 @@ class Cellular:
             logger.error(f"Upload error: {e}")
             return None
     
+    # ------------------------------------------------------------------
+    # Async HTTP, keeps the HTTP session open between uploads
+    # ------------------------------------------------------------------
+
+    async def _ensure_http_async(self):
+        # Input: None; Output: bool indicating the HTTP session is ready
+        self.at.poll()  # URCs that arrived since the last command
+        reset = self.at.pop_urcs(HTTP_RESET_URCS)
+        if reset:
+            logger.warning(f"[CELL] HTTP session lost ({reset[-1]}), setting it up again")
+            self.http_initialized = False
+        if self.http_initialized:
+            return True
+        await self.at.command("AT+HTTPTERM")
+        success, _ = await self.at.command("AT+HTTPINIT")
+        if not success:
+            logger.error("[CELL] HTTP init failed")
+            return False
+        self.http_params = {}
+        await self._set_http_param("CID", "1")
+        await self._set_http_param("REDIR", "1")
+        self.http_initialized = True
+        return True
+
+    async def _set_http_param(self, name, value):
+        # Input: name: str, value: str; Output: bool, AT+HTTPPARA is only sent when the value changed
+        if self.http_params.get(name) == value:
+            return True
+        if name in ("CID", "REDIR"):
+            cmd = f'AT+HTTPPARA="{name}",{value}'
+        else:
+            cmd = f'AT+HTTPPARA="{name}","{value}"'
+        success, _ = await self.at.command(cmd)
+        if success:
+            self.http_params[name] = value
+        else:
+            self.http_params.pop(name, None)
+        return success
+
+    async def http_post(self, url, body, content_type="application/json", action_timeout_ms=HTTP_ACTION_TIMEOUT_MS):
+        # Input: url: str, body: str or bytes, content_type: str
+        # Output: tuple(status_code: int, response_text: str) or (None, None) if the request could not be made
+        async with self.at.lock:
+            if not await self._ensure_http_async():
+                return None, None
+            if not await self._set_http_param("URL", url):
+                logger.error("[CELL] Failed to set URL")
+                return None, None
+            if not await self._set_http_param("CONTENT", content_type):
+                logger.error("[CELL] Failed to set content type")
+                return None, None
+
+            if isinstance(body, str):
+                body = body.encode() # HTTPDATA wants bytes, not characters
+            success, _ = await self.at.command(f"AT+HTTPDATA={len(body)},20000", prompt="DOWNLOAD")
+            if not success:
+                logger.warning("[CELL] No DOWNLOAD prompt")
+                self.http_initialized = False
+                return None, None
+            if await self.at.write(body) < len(body):
+                logger.error("[CELL] bridge stopped taking data, upload aborted")
+                self.http_initialized = False
+                return None, None
+            success, _ = await self.at.command(None, timeout_ms=max(5000, len(body) // 2))
+            if not success:
+                logger.error("[CELL] Data upload failed")
+                return None, None
+
+            success, _ = await self.at.command("AT+HTTPACTION=1")
+            if not success:
+                logger.error("[CELL] POST execution failed")
+                return None, None
+            # +HTTPACTION: <method>,<status>,<datalen>
+            urc = await self.at.wait_urc("+HTTPACTION:", action_timeout_ms)
+            if urc is None:
+                logger.error("[CELL] no +HTTPACTION result")
+                self.http_initialized = False
+                return None, None
+            try:
+                parts = urc.split(":", 1)[1].strip().split(",")
+                status_code = int(parts[1])
+                response_length = int(parts[2])
+            except Exception:
+                logger.error(f"[CELL] unparsable {urc}")
+                return None, None
+            if status_code >= 600:
+                # 6xx / 7xx are modem side network errors, start a fresh session next time
+                self.http_initialized = False
+
+            response_text = ""
+            if response_length > 0:
+                response_text = await self._http_read(response_length)
+            return status_code, response_text
+
+    async def _http_read(self, length):
+        # Input: length: int; Output: str response body ("" if it could not be read)
+        success, lines = await self.at.command(f"AT+HTTPREAD=0,{length}", timeout_ms=HTTP_READ_TIMEOUT_MS)
+        if not success:
+            return ""
+        # OK comes first, then "+HTTPREAD: DATA,<len>", the body and "+HTTPREAD: 0"
+        rest = await self.at.collect_until("+HTTPREAD: 0", HTTP_READ_TIMEOUT_MS)
+        if rest is None:
+            rest = []
+        body = []
+        in_data = False
+        for line in lines + rest:
+            if line.startswith("+HTTPREAD:"):
+                in_data = "DATA" in line
+                continue
+            if in_data:
+                body.append(line)
+        return "\n".join(body)
+
+    async def upload_data_async(self, data_payload, url):
+        """Upload data without blocking the event loop, same result dict as upload_data()"""
+        if not url:
+            logger.error("URL is not passed, failed to upload data cellular_driver.upload_data_async")
+            return None
+        if not self.connected:
+            logger.error("System not initialized, failed to upload data cellular_driver.upload_data_async")
+            return None
+        try:
+            self.upload_count += 1
+            logger.info(f"=== Upload #{self.upload_count} ===")
+            if isinstance(data_payload, dict):
+                data_payload['upload_id'] = self.upload_count
+                data_payload['timestamp'] = ticks_ms()
+                json_data = json.dumps(data_payload)
+            elif isinstance(data_payload, (list, tuple)):
+                json_data = json.dumps(data_payload) # batched uplink, JSON array
+            else:
+                json_data = str(data_payload)
+            data_size = len(json_data)
+            upload_start = ticks_ms()
+            status_code, response_data = await self.http_post(url, json_data)
+            upload_time = ticks_diff(ticks_ms(), upload_start) / 1000
+            if status_code is None:
+                return None
+            logger.info(f"Server response: HTTP {status_code} in {upload_time:.2f}s ({data_size} bytes)")
+            if status_code == 200:
+                logger.info(f"SUCCESS: Upload #{self.upload_count}")
+            else:
+                logger.warning(f"HTTP {status_code}: Upload #{self.upload_count}")
+            return {
+                'status_code': status_code,
+                'text': response_data,
+                'upload_time': upload_time,
+                'data_size': data_size,
+                'upload_id': self.upload_count
+            }
+        except Exception as e:
+            logger.error(f"Upload error: {e}")
+            return None
+
     def check_connection(self):
         """Check if connection is still active"""
         try:
@@ -379,6 +631,20 @@ class Cellular:
         except:
             return False
     
+    async def probe_async(self):
+        """Check over the async AT channel that the modem answers and still has its IP"""
+        try:
+            async with self.at.lock: # waits for an http_post in flight, command() would take its lines
+                ok, lines = await self.at.command("AT+CGPADDR=1", 3000)
+        except Exception:
+            return False
+        if not ok:
+            return False
+        for line in lines:
+            if line.startswith("+CGPADDR:") and (not self.ip_address or self.ip_address in line):
+                return True
+        return False
+
     def reconnect(self):
         """Reconnect if connection is lost"""
         logger.info("=== Reconnecting ===")
@@ -0,0 +1,98 @@
+import gc
+try:
+    from utime import ticks_ms, ticks_us, ticks_diff
+except ImportError:
+    from taskprof import ticks_us, ticks_diff
+
+    def ticks_ms():
+        return ticks_us() // 1000
+from logger import logger
+import taskprof
+
+# ---------------------------------------------------------------------------
+# Garbage collection policy
+# ---------------------------------------------------------------------------
+# A gc.collect() stops everything for tens of ms on a full heap; a packet
+# that arrives meanwhile can overflow the radio buffer and a chunk is lost.
+# So collections are moved to points where nothing is arriving:
+#
+#   gc.threshold()   set to a share of the heap at setup(): the allocator
+#                    collects on its own only after that much allocation,
+#                    and every idle collection starts the count again
+#   request()        code that just dropped big buffers asks for a
+#                    collection instead of running one
+#   maybe_collect()  runs the requested (or due) collection, but only when
+#                    idle: no TRANS MODE and no packet for idle_ms
+#   collect()        right now, for a buffer that does not fit otherwise
+#
+# Every collection is timed; stats() has the pauses (see taskprof.TaskStats).
+
+THRESHOLD_MIN = 16 * 1024     # never let the allocator collect more often than this
+
+
+class GcPolicy:
+    def __init__(self, threshold_fraction, interval_ms, idle_ms, busy_fn=None):
+        # threshold_fraction: share of the heap allocated between automatic collections,
+        # interval_ms: collect at the first idle point this long after the previous collection,
+        # idle_ms: quiet radio time that counts as idle, busy_fn: () -> bool, True while a transfer runs
+        self.threshold_fraction = threshold_fraction
+        self.interval_ms = interval_ms
+        self.idle_ms = idle_ms
+        self.busy_fn = busy_fn
+        self.threshold = -1
+        self.pending = None           # reason of the first request since the last collection
+        self.deferred = 0             # checks that found a pending collection but no idle point
+        self.last_collect = ticks_ms()
+        self.last_activity = self.last_collect
+        self.pauses = taskprof.TaskStats("gc")
+
+    def setup(self):
+        # Input: None; Output: None (sets gc.threshold() from the heap size)
+        try:
+            heap = gc.mem_free() + gc.mem_alloc()
+            self.threshold = max(THRESHOLD_MIN, int(heap * self.threshold_fraction))
+            gc.threshold(self.threshold)
+            logger.info(f"[GC] heap {heap // 1024}KB, collect after {self.threshold // 1024}KB allocated or at idle points")
+        except AttributeError as e:
+            logger.warning(f"[GC] no heap figures, automatic collection unchanged: {e}")
+
+    def note_activity(self):
+        # Input: None; Output: None (a packet came in, the radio is not idle)
+        self.last_activity = ticks_ms()
+
+    def request(self, reason):
+        # Input: reason: str; Output: None (collect at the next idle point)
+        if self.pending is None:
+            self.pending = reason
+
+    def is_idle(self):
+        if self.busy_fn is not None and self.busy_fn():
+            return False
+        return ticks_diff(ticks_ms(), self.last_activity) >= self.idle_ms
+
+    def collect(self, reason):
+        # Input: reason: str; Output: int pause in ms
+        t0 = ticks_us()
+        gc.collect()
+        pause = ticks_diff(ticks_us(), t0)
+        self.pauses.record(pause)
+        self.last_collect = ticks_ms()
+        self.pending = None
+        logger.debug("[GC] collected (%s) in %sms", reason, pause // 1000)
+        return pause // 1000
+
+    def maybe_collect(self):
+        # Input: None; Output: bool True if it collected
+        due = ticks_diff(ticks_ms(), self.last_collect) >= self.interval_ms
+        if self.pending is None and not due:
+            return False
+        if not self.is_idle():
+            self.deferred += 1
+            return False
+        self.collect(self.pending or "interval")
+        return True
+
+    def stats(self):
+        # Input: None; Output: str collections, pause times and deferrals
+        threshold = f"{self.threshold // 1024}KB" if self.threshold > 0 else "default"
+        return f"{self.pauses.describe()}, deferred {self.deferred}, threshold {threshold}"
@@ -1,70 +1,18 @@
 import time
-from machine import SPI, Pin
+import sc16is750
 from logger import logger
 
-class SC16IS750:
-    """SC16IS750 UART bridge driver"""
-
-    def __init__(self, spi_bus, cs_pin):
-        self.cs = Pin(cs_pin, Pin.OUT)
-        self.cs.value(1)
-        self.spi = SPI(spi_bus, baudrate=500000, polarity=0, phase=0)
-
-    def _write_register(self, reg, val):
-        self.cs.value(0)
-        time.sleep_us(10)
-        self.spi.write(bytearray([reg << 3]))
-        time.sleep_us(5)
-        self.spi.write(bytearray([val]))
-        time.sleep_us(10)
-        self.cs.value(1)
-        time.sleep_us(50)
-
-    def _read_register(self, reg):
-        self.cs.value(0)
-        time.sleep_us(10)
-        self.spi.write(bytearray([0x80 | (reg << 3)]))
-        time.sleep_us(5)
-        result = self.spi.read(1)[0]
-        time.sleep_us(10)
-        self.cs.value(1)
-        time.sleep_us(50)
-        return result
+GPS_BAUDRATE = 9600
+
+class SC16IS750(sc16is750.SC16IS750):
+    """SC16IS750 bridge to the GPS, see sc16is750.py"""
+
+    def __init__(self, spi_bus, cs_pin, irq_pin=None):
+        super().__init__(spi_bus, cs_pin, irq_pin=irq_pin)
 
     def init_gps(self):
         """Initialize for GPS at 9600 baud"""
-        # Reset
-        reg = self._read_register(0x0E)
-        self._write_register(0x0E, reg | 0x08)
-        time.sleep_ms(200)
-
-        # Set 9600 baud
-        divisor = 96  # 14745600 / (9600 * 16)
-        self._write_register(0x03, 0x80)  # Enable divisor access
-        time.sleep_ms(10)
-        self._write_register(0x00, divisor & 0xFF)  # DLL
-        self._write_register(0x01, divisor >> 8)    # DLH
-        self._write_register(0x03, 0x03)  # 8N1
-        time.sleep_ms(10)
-
-        # Setup UART
-        self._write_register(0x02, 0x07)  # Reset & enable FIFO
-        self._write_register(0x01, 0x00)  # Disable interrupts
-        self._write_register(0x04, 0x00)  # Normal operation
-        time.sleep_ms(100)
-
-        # Clear buffer
-        while self._read_register(0x09) > 0:
-            self._read_register(0x00)
-
-    def read_data(self):
-        """Read available GPS data"""
-        data = ""
-        while self._read_register(0x09) > 0:  # bytes available
-            byte_val = self._read_register(0x00)
-            if (32 <= byte_val <= 126) or byte_val in [10, 13]:
-                data += chr(byte_val)
-        return data
+        self.init(GPS_BAUDRATE)
 
 class GPS:
     """GPS coordinate extractor - clean output"""
@@ -0,0 +1,199 @@
+import struct
+
+# ---------------------------------------------------------------------------
+# Binary heartbeat
+# ---------------------------------------------------------------------------
+# Replaces the colon joined text heartbeat so it always fits one RSA block
+# (117 bytes) with room for telemetry. Used on the nodes (encode) and on the
+# computer side, util/decode_uplink.py (decode).
+#
+# Version 1, little endian:
+#   B   version (HB_VERSION; text heartbeats start with an ASCII digit)
+#   B   node addr
+#   I   uptime (sec)
+#   H   photos taken            H  events seen
+#   i   lat * 1e6               i  lon * 1e6        (NO_GPS for both without a fix)
+#   I   gps staleness (sec, as in the text heartbeat), NO_TIME if unknown
+#   B   images queued to send   B  unacked messages
+#   H   free memory (KB)
+#   varint count, then per neighbour: varint addr, B link quality (0..254, 255 unknown), b RSSI (dBm, NO_RSSI if unknown)
+#   varint count, then varint addr per hop of the shortest path
+#   optional: H worst loop lag (ms), H longest task step (ms) since the last
+#             heartbeat, see taskprof.py (decoders that stop after the path ignore it)
+
+HB_VERSION = 1
+HB_HEADER = "<BBIHHiiIBBH"
+HB_HEADER_SIZE = struct.calcsize(HB_HEADER)
+GPS_SCALE = 1000000
+NO_GPS = -0x80000000
+NO_TIME = 0xFFFFFFFF
+NO_RSSI = -128
+LOOP_STATS = "<HH"
+LOOP_STATS_SIZE = struct.calcsize(LOOP_STATS)
+MAX_BLOCK = 117              # RSA PKCS#1 v1.5 limit with a 1024 bit key
+
+
+def _clamp(v, lo, hi):
+    return lo if v < lo else hi if v > hi else v
+
+
+def _put_varint(out, v):
+    while True:
+        b = v & 0x7F
+        v >>= 7
+        if v:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return
+
+
+def _get_varint(buf, pos):
+    v = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        v |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return v, pos
+        shift += 7
+
+
+def is_binary(msg):
+    # Input: msg: bytes cleartext heartbeat; Output: bool True if it is the binary format
+    return len(msg) > 0 and msg[0] == HB_VERSION
+
+
+def encode(addr, uptime_sec, total_images, person_images, lat, lon, gps_staleness,
+           queued_images, unacked, free_kb, neighbours, shortest_path, loop_stats=None):
+    # Input: lat/lon: float or None, gps_staleness: int sec or -1,
+    #        neighbours: list of tuple(addr, quality 0..1 or None, rssi dBm or None), shortest_path: list of int,
+    #        loop_stats: tuple(lag ms, step ms) or None
+    # Output: bytes, neighbours are cut off if needed to stay within MAX_BLOCK
+    if lat is None or lon is None:
+        lat_i = lon_i = NO_GPS
+    else:
+        lat_i = int(round(lat * GPS_SCALE))
+        lon_i = int(round(lon * GPS_SCALE))
+    header = struct.pack(HB_HEADER, HB_VERSION, addr & 0xFF, _clamp(uptime_sec, 0, 0xFFFFFFFF),
+                         _clamp(total_images, 0, 0xFFFF), _clamp(person_images, 0, 0xFFFF),
+                         lat_i, lon_i, NO_TIME if gps_staleness < 0 else _clamp(gps_staleness, 0, NO_TIME - 1),
+                         _clamp(queued_images, 0, 0xFF), _clamp(unacked, 0, 0xFF), _clamp(free_kb, 0, 0xFFFF))
+    tail = bytearray()
+    _put_varint(tail, len(shortest_path))
+    for a in shortest_path:
+        _put_varint(tail, a)
+    if loop_stats is not None:
+        tail.extend(struct.pack(LOOP_STATS, _clamp(loop_stats[0], 0, 0xFFFF), _clamp(loop_stats[1], 0, 0xFFFF)))
+    room = MAX_BLOCK - len(header) - len(tail) - 1
+    nbytes = bytearray()
+    count = 0
+    for a, quality, rssi in neighbours:
+        entry = bytearray()
+        _put_varint(entry, a)
+        entry.append(255 if quality is None else _clamp(int(quality * 254), 0, 254))
+        entry.append((NO_RSSI if rssi is None else _clamp(int(rssi), -127, 127)) & 0xFF)
+        if len(nbytes) + len(entry) > room:
+            break
+        nbytes.extend(entry)
+        count += 1
+    out = bytearray(header)
+    _put_varint(out, count)
+    out.extend(nbytes)
+    out.extend(tail)
+    return bytes(out)
+
+
+def decode(msg):
+    # Input: msg: bytes binary heartbeat; Output: dict, same keys as the text heartbeat plus telemetry
+    if not is_binary(msg):
+        raise ValueError(f"not a binary heartbeat (version byte {msg[0] if msg else None})")
+    if len(msg) < HB_HEADER_SIZE:
+        raise ValueError(f"binary heartbeat too short ({len(msg)} bytes)")
+    (_, addr, uptime, total_images, person_images, lat_i, lon_i, gps_staleness,
+     queued, unacked, free_kb) = struct.unpack(HB_HEADER, msg[:HB_HEADER_SIZE])
+    pos = HB_HEADER_SIZE
+    count, pos = _get_varint(msg, pos)
+    neighbours = []
+    links = []
+    for _ in range(count):
+        a, pos = _get_varint(msg, pos)
+        quality = msg[pos]
+        rssi = msg[pos + 1]
+        pos += 2
+        if rssi > 127:
+            rssi -= 256
+        neighbours.append(a)
+        links.append({"addr": a, "quality": None if quality == 255 else round(quality / 254, 2),
+                      "rssi": None if rssi == NO_RSSI else rssi})
+    count, pos = _get_varint(msg, pos)
+    path = []
+    for _ in range(count):
+        a, pos = _get_varint(msg, pos)
+        path.append(a)
+    loop_stats = None
+    if pos + LOOP_STATS_SIZE <= len(msg):
+        loop_stats = struct.unpack(LOOP_STATS, msg[pos:pos + LOOP_STATS_SIZE])
+    no_gps = lat_i == NO_GPS or lon_i == NO_GPS
+    return {
+        "node": addr,
+        "uptime_sec": uptime,
+        "total_images": total_images,
+        "person_images": person_images,
+        "lat": None if no_gps else lat_i / GPS_SCALE,
+        "lon": None if no_gps else lon_i / GPS_SCALE,
+        "gps_staleness": -1 if gps_staleness == NO_TIME else gps_staleness,
+        "neighbours": neighbours,
+        "shortest_path": path,
+        "queued_images": queued,
+        "unacked_msgs": unacked,
+        "free_kb": free_kb,
+        "links": links,
+        "loop_lag_ms": loop_stats[0] if loop_stats else None,
+        "max_task_step_ms": loop_stats[1] if loop_stats else None,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Heartbeat bundle
+# ---------------------------------------------------------------------------
+# Relays collect heartbeats of other nodes for a short window and send them
+# upstream as one chunked transfer (kind "g") instead of one acked "H" each.
+# Every heartbeat stays encrypted for the CC as sent by its creator.
+#
+#   B   BUNDLE_VERSION
+#   B   count
+#   count times: B creator addr, H length, <length> bytes heartbeat as sent
+
+BUNDLE_VERSION = 1
+BUNDLE_ITEM_HEADER = "<BH"
+BUNDLE_ITEM_HEADER_SIZE = struct.calcsize(BUNDLE_ITEM_HEADER)
+
+
+def pack_bundle(items):
+    # Input: items: list of tuple(creator: int, msgbytes: bytes), at most 255; Output: bytes
+    out = bytearray([BUNDLE_VERSION, len(items)])
+    for creator, msgbytes in items:
+        out.extend(struct.pack(BUNDLE_ITEM_HEADER, creator & 0xFF, len(msgbytes)))
+        out.extend(msgbytes)
+    return bytes(out)
+
+
+def unpack_bundle(data):
+    # Input: data: bytes; Output: list of tuple(creator: int, msgbytes: bytes)
+    if len(data) < 2 or data[0] != BUNDLE_VERSION:
+        raise ValueError(f"not a heartbeat bundle (version byte {data[0] if data else None})")
+    count = data[1]
+    pos = 2
+    items = []
+    for _ in range(count):
+        if pos + BUNDLE_ITEM_HEADER_SIZE > len(data):
+            raise ValueError(f"heartbeat bundle cut short after {len(items)} of {count} items")
+        creator, length = struct.unpack(BUNDLE_ITEM_HEADER, data[pos:pos + BUNDLE_ITEM_HEADER_SIZE])
+        pos += BUNDLE_ITEM_HEADER_SIZE
+        if pos + length > len(data):
+            raise ValueError(f"heartbeat bundle cut short after {len(items)} of {count} items")
+        items.append((creator, bytes(data[pos:pos + length])))
+        pos += length
+    return items
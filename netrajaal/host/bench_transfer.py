@@ -0,0 +1,237 @@
+"""
+`bench_transfer.py`
+===================================================================
+
+Image transfer benchmark: runs the B/I/E transfer of the unmodified main.py
+(send_msg_big, add_chunk, end_chunk, ack_time) on the host runtime over a
+chain of nodes, and sweeps image size, loss, hop count, CHUNK_SLEEP and
+ACK_SLEEP.
+
+For every combination a fresh field is booted (CC 219, relays from
+CHAIN_ADDRS). Once the nodes are up, an image of random bytes goes on the SD
+card of the last node and into its send queue, as a captured image does.
+Every node forwards it the way it forwards any image (image_sending_loop,
+send_msg_big, retries after a failure). The run ends when end_chunk() at the
+CC returns the whole image, or at --timeout.
+
+Reported per run (JSON):
+    transfer_sec, goodput_bps      first B sent by the source to image complete at the CC
+    sec_per_kb_per_hop             the number to compare
+    hop_sec                        completion time at every hop
+    retransmit_ratio               chunks sent again / chunks needed
+    frames                         B/I/E/A frames sent during the transfer
+    cpu_ms_per_chunk               host CPU time of the whole run per chunk sent
+    peak_heap_kb                   peak Python heap during the transfer (tracemalloc)
+
+Virtual time and seeded randomness make the numbers repeatable: the same
+commit gives the same result, and the commit id is in the output.
+
+This script is designed to run on a computer, NOT on the OpenMV board.
+
+Usage:
+    python host/bench_transfer.py
+    python host/bench_transfer.py --sizes 10,40 --loss 0,0.05,0.1 --hops 1,2,3 --json bench.json
+    python host/bench_transfer.py --chunk-sleep 0.05,0.1,0.2 --ack-sleep 0.1,0.2 --hops 2
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+if HOST_DIR not in sys.path:
+    sys.path.insert(0, HOST_DIR)
+
+import runtime
+from medium import Medium
+from server import VirtualServer
+
+CC_ADDR = 219
+CHAIN_ADDRS = [225, 221, 223]   # relays, nearest to the CC first (unit boards main.py knows)
+WARMUP_SEC = 30                 # nodes boot and init LoRa before the image goes out
+STEP_SEC = 1                    # how often the run checks whether the CC has the image
+QUIET_OVERRIDES = {"HB_WAIT": 10**6, "VALIDATE_WAIT_SEC": 10**6}   # no heartbeats in the way of the image
+FRAME_TYPES = "BIEA"
+
+
+def git_commit():
+    # Input: None; Output: str short commit id of the tree, or None
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=runtime.NETRAJAAL_DIR,
+                             capture_output=True, text=True, timeout=10)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--", "."], cwd=runtime.NETRAJAAL_DIR,
+                               capture_output=True, text=True, timeout=10).stdout.strip()
+        return out.stdout.strip() + ("-dirty" if dirty else "") if out.returncode == 0 else None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def instrument(node, probe):
+    # Input: node: runtime.Node, probe: dict shared by the run; Output: None
+    # wraps main.py globals, process_message() looks them up on every call
+    m = node.main
+    real_radio_send = m.radio_send
+    real_end_chunk = m.end_chunk
+
+    def radio_send(dest, data, msg_uid):
+        if probe["armed"]:
+            typ = chr(msg_uid[0])
+            if probe["start"] is None and typ == "B" and node.addr == probe["src"]:
+                probe["start"] = node.now
+            if typ in FRAME_TYPES:
+                probe["frames"][typ] += 1
+        return real_radio_send(dest, data, msg_uid)
+
+    def end_chunk(msg_uid, msg):
+        result = real_end_chunk(msg_uid, msg)
+        # only the benchmark image: not heartbeat bundles, not before it went out
+        if (result and result[0] and result[3] and probe["start"] is not None and node.addr not in probe["done"]
+                and m.get_chunk_kind(result[2]) == m.IMG_KIND_FULL):
+            probe["done"][node.addr] = node.now
+            probe["received_bytes"][node.addr] = len(result[3])
+        return result
+
+    m.radio_send = radio_send
+    m.end_chunk = end_chunk
+
+
+def run_one(cfg, args, index):
+    # Input: cfg: dict size_kb/loss/hops/chunk_sleep/ack_sleep, index: int; Output: dict result
+    hops = cfg["hops"]
+    chain = [CC_ADDR] + CHAIN_ADDRS[:hops]      # chain[i+1] sends to chain[i]
+    src = chain[-1]
+    size = int(cfg["size_kb"] * 1024)
+    seed = args.seed + index
+    out_dir = os.path.join(args.out, str(index))
+    shutil.rmtree(out_dir, ignore_errors=True)
+
+    random.seed(seed)
+    medium = Medium(random.Random(seed + 1))
+    server = VirtualServer(random.Random(seed + 2))
+    emu = runtime.Emulator(medium, server, out_dir)
+    common = dict(QUIET_OVERRIDES)
+    common.update(args.overrides)
+    common.update({"CHUNK_SLEEP": cfg["chunk_sleep"], "ACK_SLEEP": cfg["ack_sleep"], "COMMAN_CENTER_ADDRS": [CC_ADDR]})
+    boot_rng = random.Random(seed + 3)
+    for i, addr in enumerate(chain):
+        overrides = dict(common)
+        overrides["shortest_path_to_cc"] = chain[:i][::-1]
+        emu.add_node(addr, overrides=overrides, boot_at=boot_rng.uniform(0, 2))
+    for a, b in zip(chain, chain[1:]):
+        medium.link(a, b, loss=cfg["loss"])
+
+    payload = random.Random(seed + 4).randbytes(size)
+    probe = {"src": src, "armed": False, "start": None, "done": {}, "received_bytes": {}, "frames": {t: 0 for t in FRAME_TYPES}}
+    chunks = len(range(0, size, 200))
+
+    def inject():
+        # as if the camera had just saved an encrypted image: on the SD card and in the send queue
+        m = emu.nodes[src].main
+        epoch_ms = m.get_epoch_ms()
+        path = m.img_filepath(src, epoch_ms, m.IMG_KIND_FULL)
+        with open(path, "wb") as f:
+            f.write(payload)
+        probe["armed"] = True
+        if args.tracemalloc:
+            tracemalloc.start()
+        m.queue_img_to_send(src, epoch_ms, path, m.IMG_KIND_FULL)
+
+    wall = time.monotonic()
+    cpu = time.process_time()
+    emu.start()
+    try:
+        for addr in chain:
+            instrument(emu.nodes[addr], probe)
+        emu.at(WARMUP_SEC, src, inject)
+        t = 0
+        while t < WARMUP_SEC + args.timeout and CC_ADDR not in probe["done"]:
+            t += STEP_SEC
+            emu.run(t)
+    finally:
+        peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        emu.stop()
+    cpu = time.process_time() - cpu
+    wall = time.monotonic() - wall
+
+    start = probe["start"]
+    done_at = probe["done"].get(CC_ADDR)
+    ok = done_at is not None and probe["received_bytes"].get(CC_ADDR) == size
+    transfer = done_at - start if done_at is not None and start is not None else None
+    needed = chunks * hops
+    sent_i = probe["frames"]["I"]
+    result = dict(cfg)
+    result.update({
+        "completed": ok,
+        "chunks": chunks,
+        "transfer_sec": round(transfer, 3) if transfer else None,
+        "goodput_bps": round(size / transfer, 1) if ok and transfer else None,
+        "sec_per_kb_per_hop": round(transfer / (size / 1024) / hops, 4) if ok and transfer else None,
+        "hop_sec": [round(probe["done"][a] - start, 3) if a in probe["done"] else None for a in reversed(chain[:-1])],
+        "retransmit_ratio": round(max(0, sent_i - needed) / needed, 4) if needed else None,
+        "frames": probe["frames"],
+        "cpu_ms_per_chunk": round(cpu * 1000 / sent_i, 3) if sent_i else None,
+        "peak_heap_kb": round(peak / 1024, 1) if peak is not None else None,
+        "airtime_ms": medium.stats()["airtime_ms"],
+        "wall_sec": round(wall, 2),
+        "errors": [f"{a}: {n.error!r}" for a, n in emu.nodes.items() if n.error],
+    })
+    return result
+
+
+def floats(text):
+    return [float(x) for x in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="B/I/E image transfer benchmark on the host runtime")
+    parser.add_argument("--sizes", default="10,30", help="image sizes in KB")
+    parser.add_argument("--loss", default="0,0.1", help="loss rates per packet on every link")
+    parser.add_argument("--hops", default="1,2", help=f"hop counts, 1-{len(CHAIN_ADDRS)}")
+    parser.add_argument("--chunk-sleep", default="0.1", help="CHUNK_SLEEP values (sec)")
+    parser.add_argument("--ack-sleep", default="0.2", help="ACK_SLEEP values (sec)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per combination, with different seeds")
+    parser.add_argument("--timeout", type=float, default=900, help="virtual sec for one transfer")
+    parser.add_argument("--set", action="append", metavar="NAME=VALUE", help="override a main.py global on every node")
+    parser.add_argument("--no-tracemalloc", dest="tracemalloc", action="store_false", help="skip peak heap (faster)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="/tmp/netrajaal-bench", help="node directories go here")
+    parser.add_argument("--json", help="write the results here as well")
+    args = parser.parse_args()
+
+    import emulator
+    args.overrides = emulator.parse_overrides(args.set)
+    hops = [int(h) for h in args.hops.split(",")]
+    if any(h < 1 or h > len(CHAIN_ADDRS) for h in hops):
+        parser.error(f"--hops must be within 1-{len(CHAIN_ADDRS)}")
+
+    configs = []
+    for size_kb, loss, h, chunk_sleep, ack_sleep in itertools.product(
+            floats(args.sizes), floats(args.loss), hops, floats(args.chunk_sleep), floats(args.ack_sleep)):
+        for _ in range(args.repeat):
+            configs.append({"size_kb": size_kb, "loss": loss, "hops": h, "chunk_sleep": chunk_sleep, "ack_sleep": ack_sleep})
+
+    results = []
+    for i, cfg in enumerate(configs):
+        res = run_one(cfg, args, i)
+        results.append(res)
+        print(f"info - {i+1}/{len(configs)} {cfg} -> completed={res['completed']} transfer={res['transfer_sec']}s "
+              f"s/KB/hop={res['sec_per_kb_per_hop']} retx={res['retransmit_ratio']} ({res['wall_sec']}s wall)", file=sys.stderr)
+
+    report = {"commit": git_commit(), "seed": args.seed, "overrides": args.overrides, "results": results}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+`emulator.py`
+===================================================================
+
+Runs N unmodified netrajaal/main.py nodes on a computer over a virtual LoRa
+medium, on virtual time (see runtime.py, medium.py). An hour of the field
+takes seconds to minutes depending on traffic.
+
+Nodes are picked by address, they must be ones main.py knows a board id for.
+Links default to the pairs of fakelayout.py among the chosen nodes.
+Console output of every node is in <out>/<addr>/console.log, its SD card in
+<out>/<addr>/sdcard. A JSON summary (radio counters per node, uploads at the
+virtual server) is printed at the end.
+
+This script is designed to run on a computer, NOT on the OpenMV board.
+
+Usage:
+    python host/emulator.py --duration 1800
+    python host/emulator.py --nodes 219,225,221 --loss 0.1 --pir-every 300 --json out.json
+    python host/emulator.py --links 221-225,225-219 --set AIR_SPEED=9600 --set HB_WAIT=120 --echo
+"""
+import argparse
+import ast
+import json
+import os
+import random
+import sys
+import time
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+if HOST_DIR not in sys.path:
+    sys.path.insert(0, HOST_DIR)
+
+import runtime
+from medium import Medium
+from server import VirtualServer
+
+DEFAULT_NODES = "219,225,221"   # CC, relay, camera: the fixed shortest paths in main.py
+PIR_PIN = "P13"                 # detect.PIR_PIN
+
+
+def default_links(addrs):
+    # Input: addrs: list of int; Output: list of tuple(a, b) from fakelayout.py
+    sys.path.insert(0, runtime.NETRAJAAL_DIR)
+    try:
+        import fakelayout
+    finally:
+        sys.path.remove(runtime.NETRAJAAL_DIR)
+    return [(a, b) for a, b in fakelayout.FakeNeighbours if a in addrs and b in addrs]
+
+
+def parse_pairs(text, sep="-"):
+    out = []
+    for item in text.split(","):
+        a, b = item.split(sep)
+        out.append((int(a), float(b) if sep == "@" else int(b)))
+    return out
+
+
+def parse_overrides(items):
+    out = {}
+    for item in items or []:
+        key, _, value = item.partition("=")
+        try:
+            out[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            out[key] = value
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run netrajaal nodes on a virtual LoRa medium")
+    parser.add_argument("--nodes", default=DEFAULT_NODES, help="comma separated node addresses")
+    parser.add_argument("--links", help="a-b,... links (default: fakelayout.py pairs)")
+    parser.add_argument("--loss", type=float, default=0.0, help="loss rate per packet on every link")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="extra latency per link")
+    parser.add_argument("--rssi", type=int, default=-80, help="RSSI of every link (dBm)")
+    parser.add_argument("--capture-db", type=float, help="a reception this much stronger survives a collision")
+    parser.add_argument("--duration", type=float, default=600, help="virtual seconds to run")
+    parser.add_argument("--pir", help="addr@sec,... PIR triggers")
+    parser.add_argument("--pir-every", type=float, help="PIR trigger on every node this often (sec)")
+    parser.add_argument("--no-wifi", action="store_true", help="WiFi never connects (uploads are spooled)")
+    parser.add_argument("--server-latency-ms", type=float, default=300)
+    parser.add_argument("--server-fail-rate", type=float, default=0.0)
+    parser.add_argument("--set", action="append", metavar="NAME=VALUE", help="override a main.py global on every node")
+    parser.add_argument("--boot-jitter", type=float, default=10.0, help="nodes power on at random times within this (sec)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="/tmp/netrajaal-host", help="node directories go here")
+    parser.add_argument("--echo", action="store_true", help="node console on the terminal too")
+    parser.add_argument("--json", help="write the summary here as well")
+    args = parser.parse_args()
+
+    addrs = [int(a) for a in args.nodes.split(",")]
+    links = parse_pairs(args.links) if args.links else default_links(addrs)
+    overrides = parse_overrides(args.set)
+
+    random.seed(args.seed)  # the firmware's message ids and jitter
+    medium = Medium(random.Random(args.seed + 1), args.capture_db)
+    server = VirtualServer(random.Random(args.seed + 2), args.server_latency_ms, args.server_fail_rate)
+    emu = runtime.Emulator(medium, server, args.out, echo=args.echo)
+    boot_rng = random.Random(args.seed + 3)
+    for addr in addrs:
+        emu.add_node(addr, wifi=not args.no_wifi, overrides=overrides, boot_at=boot_rng.uniform(0, args.boot_jitter))
+    for a, b in links:
+        medium.link(a, b, loss=args.loss, latency_ms=args.latency_ms, rssi=args.rssi)
+    if args.pir:
+        for addr, t in parse_pairs(args.pir, "@"):
+            emu.trigger_pin(t, addr, PIR_PIN)
+    if args.pir_every:
+        t = args.pir_every
+        while t < args.duration:
+            for addr in addrs:
+                emu.trigger_pin(t, addr, PIR_PIN)
+            t += args.pir_every
+
+    print(f"info - {len(addrs)} nodes {addrs}, links {links}, {args.duration}s virtual, output in {args.out}", file=sys.stderr)
+    wall = time.monotonic()
+    emu.start()
+    try:
+        emu.run(args.duration)
+    finally:
+        emu.stop()
+    summary = emu.summary()
+    summary["wall_sec"] = round(time.monotonic() - wall, 2)
+    text = json.dumps(summary, indent=2)
+    print(text)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+`medium.py`
+===================================================================
+
+Virtual LoRa medium for the host runtime (runtime.py).
+
+Every node gets an E22Modem on UART 1: a stand-in for the Waveshare SX1262
+HAT (Ebyte E22) that the unmodified sx1262.py driver configures and talks to
+over the UART, with the same framing as the module in fixed transmission mode:
+
+    host writes   [target H][target L][channel][payload ... \\n]
+    air carries   [payload ... \\n]   (payload starts with the sender address and channel)
+    peers read    [payload ... \\n]   if the target is their address or 0xFFFF
+
+Links are explicit (Medium.link) with a loss rate, a latency and an RSSI.
+A transmission takes airtime at the air data rate the driver configured
+(AIR_SPEED in main.py); the sender's module queues frames while it is on the
+air. Receptions that overlap at a receiver collide (both lost, unless
+capture_db is set and one is that much stronger), a node does not hear
+anything while it transmits.
+"""
+import math
+
+AIR_SPEEDS = {1: 1200, 2: 2400, 3: 4800, 4: 9600, 5: 19200, 6: 38400, 7: 62500}  # UART+air register, low 3 bits
+SUBPACKET_BYTES = 240      # the module splits longer writes into packets of this size
+AIR_OVERHEAD_BYTES = 12    # preamble, header and CRC per packet, in byte times
+TX_SETUP_MS = 8            # module wake up before each packet
+UART_BAUD = 115200
+CFG_HEADERS = (0xC0, 0xC2)
+RSSI_CMD = bytes([0xC0, 0xC1, 0xC2, 0xC3, 0x00, 0x02])
+BROADCAST = 0xFFFF
+KEEP_TX_LOG_SEC = 10       # transmissions kept for half duplex checks
+
+
+class Link:
+    def __init__(self, loss=0.0, latency_ms=0, rssi=-80):
+        self.loss = loss
+        self.latency_ms = latency_ms
+        self.rssi = rssi
+
+
+class Reception:
+    __slots__ = ("start", "end", "src", "target", "payload", "rssi", "lost")
+
+    def __init__(self, start, end, src, target, payload, rssi):
+        self.start = start
+        self.end = end
+        self.src = src
+        self.target = target
+        self.payload = payload
+        self.rssi = rssi
+        self.lost = None       # None, "loss", "collision" or "half-duplex"
+
+
+def _overlap(a0, a1, b0, b1):
+    return a0 < b1 and b0 < a1
+
+
+class E22Modem:
+    def __init__(self, medium, node):
+        self.medium = medium
+        self.node = node
+        self.addr = node.addr
+        self.channel = 18              # 868 MHz, what main.py asks for
+        self.air_speed = 2400
+        self.packet_rssi = False
+        self.busy_until = 0.0
+        self.tx_log = []               # [(start, end)] own transmissions
+        self.receptions = []           # on the air towards this modem, not yet read
+        self.rx_buf = bytearray()
+        self.counts = {"tx_frames": 0, "tx_bytes": 0, "airtime_ms": 0.0, "rx_frames": 0, "rx_bytes": 0,
+                       "lost": 0, "collision": 0, "half-duplex": 0, "not_for_me": 0, "config_writes": 0}
+
+    def _config_mode(self):
+        st = self.node.pins.get("P7")   # M1 high, M0 low
+        return st is not None and st.value == 1
+
+    def _configure(self, data):
+        if data[1] != 0 or len(data) < 12:
+            return
+        self.addr = (data[3] << 8) | data[4]
+        self.air_speed = AIR_SPEEDS.get(data[6] & 0x07, self.air_speed)
+        self.channel = data[8]
+        self.packet_rssi = bool(data[9] & 0x80)
+        self.counts["config_writes"] += 1
+
+    def _pump(self):
+        now = self.node.now
+        if not self.receptions:
+            return
+        keep = []
+        for rec in sorted(self.receptions, key=lambda r: r.end):
+            if rec.end > now:
+                keep.append(rec)
+            elif rec.lost:
+                self.counts["lost" if rec.lost == "loss" else rec.lost] += 1
+            elif rec.target != self.addr and rec.target != BROADCAST:
+                self.counts["not_for_me"] += 1
+            else:
+                self.rx_buf += rec.payload
+                if self.packet_rssi:
+                    self.rx_buf.append(max(0, min(255, 256 + rec.rssi)))
+                self.counts["rx_frames"] += 1
+                self.counts["rx_bytes"] += len(rec.payload)
+        self.receptions = keep
+
+    # ---- UART side, called by the machine.UART shim ----
+
+    def any(self):
+        self._pump()
+        return len(self.rx_buf)
+
+    def read(self, n=None):
+        self._pump()
+        if not self.rx_buf:
+            return None
+        n = len(self.rx_buf) if n is None else min(n, len(self.rx_buf))
+        data = bytes(self.rx_buf[:n])
+        del self.rx_buf[:n]
+        return data
+
+    def readline(self):
+        self._pump()
+        if not self.rx_buf:
+            return None
+        i = self.rx_buf.find(b"\n")
+        return self.read(len(self.rx_buf) if i < 0 else i + 1)
+
+    def write(self, data):
+        if self._config_mode():
+            if data.startswith(RSSI_CMD):
+                self.rx_buf += bytes([0xC1, 0x00, 0x02, 0xB0, 0xB0])
+            elif len(data) >= 3 and data[0] in CFG_HEADERS:
+                self._configure(data)
+                self.rx_buf += bytes([0xC1]) + data[1:]
+            return len(data)
+        if data.startswith(RSSI_CMD):
+            self.rx_buf += bytes([0xC1, 0x00, 0x02, 0xB0, 0xB0])
+            return len(data)
+        if len(data) > 3:
+            self.medium.transmit(self, (data[0] << 8) | data[1], data[2], data[3:], len(data))
+        return len(data)
+
+    def stats(self):
+        out = dict(self.counts)
+        out["airtime_ms"] = round(out["airtime_ms"], 1)
+        out["air_speed"] = self.air_speed
+        return out
+
+
+class Medium:
+    def __init__(self, rng, capture_db=None):
+        # rng: random.Random, loss draws come from it so a seed replays the same run
+        self.rng = rng
+        self.capture_db = capture_db
+        self.modems = {}       # addr -> E22Modem
+        self.links = {}        # (src, dst) -> Link
+
+    def add_node(self, node):
+        # Input: node: runtime.Node; Output: E22Modem for its UART 1
+        modem = E22Modem(self, node)
+        self.modems[node.addr] = modem
+        return modem
+
+    def link(self, a, b, loss=0.0, latency_ms=0, rssi=-80, symmetric=True):
+        # Input: a, b: int node addr; Output: None (b hears a, and a hears b if symmetric)
+        self.links[(a, b)] = Link(loss, latency_ms, rssi)
+        if symmetric:
+            self.links[(b, a)] = Link(loss, latency_ms, rssi)
+
+    def airtime(self, length, air_speed):
+        # Input: length: int bytes, air_speed: int bps; Output: float sec on the air
+        packets = max(1, math.ceil(length / SUBPACKET_BYTES))
+        return packets * TX_SETUP_MS / 1000 + (length + packets * AIR_OVERHEAD_BYTES) * 8 / air_speed
+
+    def transmit(self, modem, target, channel, payload, uart_len):
+        # Input: modem: sending E22Modem, target: int addr, channel: int, payload: bytes; Output: None
+        now = modem.node.now
+        start = max(now + uart_len * 10 / UART_BAUD, modem.busy_until)
+        end = start + self.airtime(len(payload), modem.air_speed)
+        modem.busy_until = end
+        modem.tx_log = [(s, e) for s, e in modem.tx_log if e > now - KEEP_TX_LOG_SEC]
+        modem.tx_log.append((start, end))
+        modem.counts["tx_frames"] += 1
+        modem.counts["tx_bytes"] += len(payload)
+        modem.counts["airtime_ms"] += (end - start) * 1000
+        for rec in modem.receptions:
+            if not rec.lost and _overlap(rec.start, rec.end, start, end):
+                rec.lost = "half-duplex"
+        packets = max(1, math.ceil(len(payload) / SUBPACKET_BYTES))
+        for (src, dst), link in self.links.items():
+            if src != modem.node.addr or dst not in self.modems:
+                continue
+            peer = self.modems[dst]
+            if peer.channel != channel:
+                continue
+            lat = link.latency_ms / 1000
+            rec = Reception(start + lat, end + lat, src, target, bytes(payload), link.rssi)
+            if link.loss and self.rng.random() >= (1 - link.loss) ** packets:
+                rec.lost = "loss"
+            elif any(_overlap(s, e, rec.start, rec.end) for s, e in peer.tx_log):
+                rec.lost = "half-duplex"
+            for other in peer.receptions:
+                if not _overlap(other.start, other.end, rec.start, rec.end):
+                    continue
+                if self.capture_db is not None and abs(other.rssi - rec.rssi) >= self.capture_db:
+                    weaker = rec if rec.rssi < other.rssi else other
+                    weaker.lost = weaker.lost or "collision"
+                else:
+                    rec.lost = rec.lost or "collision"
+                    other.lost = other.lost or "collision"
+            peer.receptions.append(rec)
+
+    def stats(self):
+        # Input: None; Output: dict totals over all modems
+        total = {}
+        for modem in self.modems.values():
+            for key, value in modem.counts.items():
+                total[key] = total.get(key, 0) + value
+        total["airtime_ms"] = round(total.get("airtime_ms", 0), 1)
+        return total
@@ -0,0 +1,301 @@
+"""
+`replay.py`
+===================================================================
+
+Replays captured LoRa traffic through process_message() of the unmodified
+main.py on the host runtime, to profile the receive path against real
+traffic and to reproduce field bugs deterministically.
+
+Logs understood (the format is detected per line, several files are merged
+into one timeline):
+
+    main.py, older builds (center_log.txt, unit_log.txt), whole frames:
+        00:47:17,667 - INFO - [RECV : 135 bytes, rssi : -27] b"H\\xdd..." at 13736
+        00:47:18,166 - INFO - [SENT 15 bytes to 221] b'A\\xdb...' at 15236
+    main.py, current builds, uid and size only (payload synthesised, see SYNTH_TYPES):
+        00:12:50,390 - INFO - [⬇ RECV from 225, rssi: -80] [***] 52 bytes, MSG_UID = b'A\\xdb...'
+        00:12:50,390 - INFO - [⮕ SENT to 225] [***] 52 bytes, MSG_UID = b'I\\xdd...'
+    lora_comm.py rf_comm.log (text protocol, MSDIII;payload):
+        2025-05-20 10:00:00,123 [INFO] N67001;7 is a broadcast
+        2025-05-20 10:00:00,123 [INFO] Processing incoming message : <payload>
+
+Every received frame of the timeline becomes a call of process_message() on
+one emulated node (the address from "MyAddr = N" in the logs, or --addr) at
+its log time, compressed by --speed. Frames of the rf_comm.log text protocol
+are rewritten to the binary header main.py expects. The node's own sends go
+on the air of an empty medium.
+
+Reported (JSON): CPU time of process_message() per message type (host
+thread CPU, count / mean / p50 / p95 / max in microseconds), frames that
+raised (with the log line they came from), task exceptions asyncio reported,
+and the ERROR lines of the node.
+
+This script is designed to run on a computer, NOT on the OpenMV board.
+
+Usage:
+    python host/replay.py center_log.txt
+    python host/replay.py unit_log.txt --timeline
+    python host/replay.py center_log.txt unit_log.txt --addr 219 --speed 10 --loop 20 --json replay.json
+    python host/replay.py rf_comm.log --addr 221 --raise
+"""
+import argparse
+import ast
+import json
+import os
+import random
+import re
+import sys
+import time
+import traceback
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+if HOST_DIR not in sys.path:
+    sys.path.insert(0, HOST_DIR)
+
+import runtime
+from medium import Medium
+from server import VirtualServer
+
+WARMUP_SEC = 20     # the node boots and configures LoRa before the first frame
+SYNTH_TYPES = "AHI" # uid-only frames rebuilt with a filler payload: acks match on the uid, H and I payloads are opaque bytes
+MIDLEN = 7          # main.py MIDLEN
+DAY_SEC = 86400
+
+_CLOCK = r"(?:(\d{4}-\d\d-\d\d) )?(\d\d):(\d\d):(\d\d),(\d{3})"
+OLD_RECV = re.compile(_CLOCK + r" - \w+ - \[RECV : (\d+) bytes, rssi : (-?\d+)\] (b['\"].*['\"]) at \d+\s*$")
+OLD_SENT = re.compile(_CLOCK + r" - \w+ - \[SENT (\d+) bytes to (\d+)\] (b['\"].*['\"]) at \d+\s*$")
+NEW_RECV = re.compile(_CLOCK + r" - \w+ - \[⬇ (?:RECV|BCAST) from (\d+)(?:, rssi: (-?\d+))?\] \[\**\] (\d+) bytes, MSG_UID = (b['\"].*['\"])\s*$")
+NEW_SENT = re.compile(_CLOCK + r" - \w+ - \[⮕ SENT to (\d+)\] \[\**\] (\d+) bytes, MSG_UID = (b['\"].*['\"])\s*$")
+RF_BCAST = re.compile(_CLOCK + r" \[\w+\] (\w)(\d+?)(None|\d+?)(\d{3});(.*) is a broadcast\s*$")
+RF_INCOMING = re.compile(_CLOCK + r" \[\w+\] Processing incoming message : (.*?)(?:\.\.\. of len (\d+))?\s*$")
+MY_ADDR = re.compile(r"MyAddr = (\d+)")
+
+
+class Packet:
+    __slots__ = ("t", "direction", "peer", "size", "data", "uid", "rssi", "source")
+
+    def __init__(self, t, direction, peer, size, data, uid, rssi, source):
+        self.t = t                    # sec, log wall clock
+        self.direction = direction    # "rx" or "tx"
+        self.peer = peer              # sender (rx) or destination (tx), None if unknown
+        self.size = size
+        self.data = data              # whole frame as process_message() gets it, None if only the uid is known
+        self.uid = uid                # bytes msg uid, None if unknown
+        self.rssi = rssi
+        self.source = source          # "file:line"
+
+    def msg_typ(self):
+        return chr(self.uid[0]) if self.uid else "?"
+
+
+def _clock_sec(m):
+    # Input: match with the _CLOCK groups first; Output: float sec of the day
+    return int(m.group(2)) * 3600 + int(m.group(3)) * 60 + int(m.group(4)) + int(m.group(5)) / 1000
+
+
+def _frame_from_text(msg_typ, src, dest, rid, payload, addr):
+    # Input: lora_comm.py msg id parts and payload (str); Output: bytes frame with main.py's binary header
+    src = int(src) & 0xFF
+    receiver = b"*" if dest == "None" else bytes((addr,))
+    rrr = "".join(chr(65 + int(c) % 26) for c in rid)
+    return msg_typ.encode() + bytes((src, src)) + receiver + rrr.encode() + b";" + payload.encode()
+
+
+def parse_log(path, addr=None):
+    # Input: path: log file, addr: int replay node (for rf_comm.log frames); Output: tuple(list of Packet, int or None MyAddr of the log)
+    packets = []
+    my_addr = None
+    day = 0
+    last = None
+    name = os.path.basename(path)
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for no, line in enumerate(f, 1):
+            m = MY_ADDR.search(line)
+            if m and my_addr is None:
+                my_addr = int(m.group(1))
+            m = (OLD_RECV.match(line) or OLD_SENT.match(line) or NEW_RECV.match(line) or NEW_SENT.match(line)
+                 or RF_BCAST.match(line) or RF_INCOMING.match(line))
+            if not m:
+                continue
+            t = _clock_sec(m)
+            if last is not None and t < last - DAY_SEC / 2:
+                day += DAY_SEC      # past midnight
+            t += day
+            last = t - day
+            src = f"{name}:{no}"
+            if m.re is OLD_RECV:
+                data = ast.literal_eval(m.group(8)).replace(b"{}[]", b"\n")
+                packets.append(Packet(t, "rx", data[2] if len(data) > 2 else None, int(m.group(6)), data, data[:MIDLEN], int(m.group(7)), src))
+            elif m.re is OLD_SENT:
+                data = ast.literal_eval(m.group(8))
+                packets.append(Packet(t, "tx", int(m.group(7)), int(m.group(6)), data, data[:MIDLEN], None, src))
+            elif m.re is NEW_RECV:
+                rssi = int(m.group(7)) if m.group(7) else None
+                packets.append(Packet(t, "rx", int(m.group(6)), int(m.group(8)), None, ast.literal_eval(m.group(9)), rssi, src))
+            elif m.re is NEW_SENT:
+                packets.append(Packet(t, "tx", int(m.group(6)), int(m.group(7)), None, ast.literal_eval(m.group(8)), None, src))
+            elif m.re is RF_BCAST:
+                data = _frame_from_text(m.group(6), m.group(7), m.group(8), m.group(9), m.group(10), addr or 0)
+                packets.append(Packet(t, "rx", int(m.group(7)), len(data), data, data[:MIDLEN], None, src))
+            else:
+                # unicast of the text protocol: the log has the payload only, the type is not known
+                payload = m.group(6)
+                size = int(m.group(7)) if m.group(7) else len(payload)
+                packets.append(Packet(t, "rx", None, size, None, None, None, src))
+    return packets, my_addr
+
+
+def frame_for(p, addr, synth_types=SYNTH_TYPES):
+    # Input: p: Packet, addr: int replay node, synth_types: str; Output: bytes to hand to process_message(), None if it can not be built
+    if p.data is not None:
+        return p.data
+    if p.uid is None or len(p.uid) < MIDLEN or chr(p.uid[0]) not in synth_types:
+        return None
+    # only uid and size were logged: same header, filler payload of the logged size
+    filler = bytes((65 + (i * 7) % 26) for i in range(max(0, p.size - MIDLEN - 1)))
+    return p.uid[:MIDLEN] + b";" + filler
+
+
+def build_timeline(paths, addr=None):
+    # Input: paths: list of log files; Output: tuple(list of Packet sorted by time, int or None node address)
+    packets = []
+    found = None
+    for path in paths:
+        ps, my_addr = parse_log(path, addr)
+        packets.extend(ps)
+        found = found or my_addr
+    packets.sort(key=lambda p: p.t)
+    return packets, addr or found
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def replay(packets, addr, args):
+    # Input: packets: timeline, addr: int node, args: argparse.Namespace; Output: dict report
+    random.seed(args.seed)
+    medium = Medium(random.Random(args.seed + 1))
+    emu = runtime.Emulator(medium, VirtualServer(random.Random(args.seed + 2)), args.out)
+    node = emu.add_node(addr, wifi=not args.no_wifi, overrides=args.overrides)
+
+    rx = [p for p in packets if p.direction == "rx"]
+    frames = [(p, frame_for(p, addr, args.synth_types)) for p in rx]
+    skipped = sum(1 for _, fr in frames if fr is None)
+    frames = [(p, fr) for p, fr in frames if fr is not None]
+    if args.max_packets:
+        frames = frames[:args.max_packets]
+    cpu = {}         # msg type -> [us]
+    raised = []
+    t0 = frames[0][0].t if frames else 0
+    span = (frames[-1][0].t - t0) / args.speed + 1 if frames else 0
+    node_cpu = {}
+
+    def deliver(p, frame):
+        def fn():
+            m = node.main
+            c = time.thread_time()
+            try:
+                m.process_message(frame, p.rssi)
+            except Exception as e:
+                if args.raise_errors:
+                    raise
+                raised.append({"source": p.source, "msg_uid": repr(p.uid), "error": repr(e),
+                               "traceback": traceback.format_exc().splitlines()[-3:]})
+            cpu.setdefault(chr(frame[0]), []).append((time.thread_time() - c) * 1e6)
+        return fn
+
+    def mark(key):
+        def fn():
+            node_cpu[key] = time.thread_time()
+        return fn
+
+    for loop in range(args.loop):
+        base = WARMUP_SEC + loop * span
+        for p, frame in frames:
+            emu.at(base + (p.t - t0) / args.speed, addr, deliver(p, frame))
+    end = WARMUP_SEC + args.loop * span
+    emu.at(WARMUP_SEC - 0.001, addr, mark("start"))
+    emu.at(end + args.settle, addr, mark("end"))
+
+    wall = time.monotonic()
+    emu.start()
+    try:
+        emu.run(end + args.settle + 0.001)
+    finally:
+        emu.stop()
+    wall = time.monotonic() - wall
+
+    with open(os.path.join(node.fs_root, "console.log"), encoding="utf-8", errors="replace") as f:
+        errors = [line.rstrip() for line in f if " - ERROR - " in line or line.startswith("ERROR")]
+    by_type = {}
+    for typ, us in sorted(cpu.items()):
+        by_type[typ] = {"count": len(us), "mean_us": round(sum(us) / len(us), 1), "p50_us": round(_percentile(us, 0.5), 1),
+                        "p95_us": round(_percentile(us, 0.95), 1), "max_us": round(max(us), 1)}
+    total = [u for us in cpu.values() for u in us]
+    return {
+        "addr": addr,
+        "frames": len(total),
+        "skipped_no_payload": skipped,
+        "loops": args.loop,
+        "speed": args.speed,
+        "virtual_sec": round(end + args.settle, 3),
+        "wall_sec": round(wall, 2),
+        "process_message_cpu_us": round(sum(total), 1),
+        "node_cpu_ms": round((node_cpu["end"] - node_cpu["start"]) * 1000, 1) if len(node_cpu) == 2 else None,
+        "by_type": by_type,
+        "raised": raised,
+        "node_errors": errors[:args.max_errors],
+        "node_error_count": len(errors),
+        "task_errors": node.task_errors[:args.max_errors],
+        "task_error_count": len(node.task_errors),
+        "node_exit": repr(node.error) if node.error else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured LoRa traffic through process_message() on the host runtime")
+    parser.add_argument("logs", nargs="+", help="center_log.txt, unit_log.txt, rf_comm.log, ...")
+    parser.add_argument("--addr", type=int, help="replay node address (default: MyAddr in the logs)")
+    parser.add_argument("--timeline", action="store_true", help="print the parsed packet timeline (CSV) and stop")
+    parser.add_argument("--speed", type=float, default=1.0, help="compress the gaps between frames by this factor")
+    parser.add_argument("--loop", type=int, default=1, help="replay the timeline this many times")
+    parser.add_argument("--settle", type=float, default=30.0, help="virtual sec after the last frame (acks, tasks)")
+    parser.add_argument("--max-packets", type=int, help="only the first N received frames")
+    parser.add_argument("--synth-types", default=SYNTH_TYPES,
+                        help="message types rebuilt with a filler payload when the log has only uid and size")
+    parser.add_argument("--raise", dest="raise_errors", action="store_true", help="stop at the first frame that raises")
+    parser.add_argument("--no-wifi", action="store_true", help="WiFi never connects (CC uploads are spooled)")
+    parser.add_argument("--set", action="append", metavar="NAME=VALUE", help="override a main.py global")
+    parser.add_argument("--max-errors", type=int, default=50, help="node ERROR lines kept in the report")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="/tmp/netrajaal-replay", help="node directory goes here")
+    parser.add_argument("--json", help="write the report here as well")
+    args = parser.parse_args()
+
+    packets, addr = build_timeline(args.logs, args.addr)
+    if args.timeline:
+        print("t_sec,direction,peer,msg_typ,size,msg_uid,rssi,source")
+        for p in packets:
+            print(f"{p.t:.3f},{p.direction},{'' if p.peer is None else p.peer},{p.msg_typ()},{p.size},"
+                  f"{'' if p.uid is None else p.uid.hex()},{'' if p.rssi is None else p.rssi},{p.source}")
+        return
+    if addr is None:
+        parser.error("no MyAddr line in the logs, give --addr")
+
+    import emulator
+    args.overrides = emulator.parse_overrides(args.set)
+    print(f"info - {len(packets)} packets ({sum(1 for p in packets if p.direction == 'rx')} received) from {args.logs}, replay on node {addr}", file=sys.stderr)
+    report = replay(packets, addr, args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+"""
+`runtime.py`
+===================================================================
+
+Host runtime for the netrajaal firmware: runs unmodified `main.py` instances
+on a computer on a virtual clock.
+
+Every node runs in its own thread with its own asyncio loop whose clock is
+the node's virtual time (Node.now, seconds). Only one node runs at a time:
+the loop hands control back to the scheduler (Emulator.run) whenever it
+would wait for a timer, and the scheduler resumes the node whose next timer
+is due first. Blocking calls (time.sleep_ms() in the drivers, requests.post())
+move the clock of that node only, so a node stuck in a blocking call misses
+its timers the way it does on the board without stalling the others.
+
+While a node is loaded (main.py runs until `asyncio.run(main())`) the board
+modules resolve to the shims in host/shims, and `time`, `os` and `gc` resolve
+to stand-ins (MicroPython `time` is `utime`, paths under /sdcard and /flash go
+to a directory per node). The firmware modules a node imported are kept per
+node, so module level state (logger, queues, main.py globals) is not shared.
+
+This runs on a computer, NOT on the OpenMV board. See emulator.py.
+"""
+import asyncio
+import binascii
+import builtins
+import gc as _gc
+import importlib.util
+import os
+import re
+import selectors
+import sys
+import threading
+import types
+import warnings
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+SHIM_DIR = os.path.join(HOST_DIR, "shims")
+NETRAJAAL_DIR = os.path.dirname(HOST_DIR)
+MAIN_PATH = os.path.join(NETRAJAAL_DIR, "main.py")
+
+EPOCH_START = 1735689600      # virtual wall clock at t=0: 2025-01-01, main.py sets its RTC to this too
+HOST_MEM_FREE = 256 * 1024    # what gc.mem_free() reports on the host
+
+# stdlib modules the firmware uses, imported here so they never pick up the time / os stand-ins
+for _name in ("json", "random", "hashlib", "struct", "math", "re", "collections", "datetime", "calendar"):
+    __import__(_name)
+
+current = None   # Node that runs right now (or is being loaded), None in the scheduler
+
+_real_open = builtins.open
+_real_print = builtins.print
+
+
+class NodeExit(BaseException):
+    # Raised in a node thread to end it (end of run, machine.reset())
+    pass
+
+
+def now():
+    # Input: None; Output: float virtual time (sec) of the running node
+    return current.now if current is not None else 0.0
+
+
+def block(seconds):
+    # Input: seconds: float; Output: None (a blocking call, moves the running node's clock)
+    node = current
+    if node is not None and seconds > 0:
+        node.now += seconds
+        node.blocked_sec += seconds
+
+
+def wall_time():
+    # Input: None; Output: float epoch seconds of the running node (RTC)
+    node = current
+    if node is None:
+        return float(EPOCH_START)
+    return node.epoch_base + node.now
+
+
+def map_path(path, for_write=False):
+    # Input: path: str as the firmware sees it; Output: str host path
+    # /sdcard/... and /flash/... go to the node's directory, relative paths to its /flash
+    # (read falls back to the netrajaal directory, where the keys and models are)
+    node = current
+    if node is None or not isinstance(path, str):
+        return path
+    for mount in ("/sdcard", "/flash"):
+        if path == mount or path.startswith(mount + "/"):
+            return node.fs_root + path
+    if path.startswith("/"):
+        return path
+    local = os.path.join(node.fs_root, "flash", path)
+    if not for_write and not os.path.exists(local):
+        shipped = os.path.join(NETRAJAAL_DIR, path)
+        if os.path.exists(shipped):
+            return shipped
+    return local
+
+
+def _open(file, mode="r", *args, **kwargs):
+    return _real_open(map_path(file, any(c in mode for c in "wax+")), mode, *args, **kwargs)
+
+
+def _print(*args, **kwargs):
+    node = current
+    if node is None or "file" in kwargs:
+        return _real_print(*args, **kwargs)
+    line = kwargs.get("sep", " ").join(str(a) for a in args)
+    node.console.write(line + kwargs.get("end", "\n"))
+    if node.emulator.echo:
+        _real_print(f"[{node.addr}] {line}")
+
+
+def _make_gc():
+    # gc stand-in: MicroPython's mem_free() / mem_alloc(), collect() only does the cheap generation
+    mod = types.ModuleType("gc")
+    mod.collect = lambda: _gc.collect(0)
+    mod.mem_free = lambda: HOST_MEM_FREE
+    mod.mem_alloc = lambda: 0
+    mod.enable = _gc.enable
+    mod.disable = _gc.disable
+    mod.isenabled = _gc.isenabled
+    mod.threshold = lambda *a: None
+    return mod
+
+
+def _load_file(name, path):
+    # Input: name: str, path: str; Output: module, also found under that name by later imports
+    mod = sys.modules.get(name)
+    if mod is not None and getattr(mod, "__file__", None) == path:
+        return mod
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    if name != "requests":  # the real one may be in use by the host, the shim only goes in while a node loads
+        sys.modules[name] = mod
+    return mod
+
+
+def load_uid_table(path=MAIN_PATH):
+    # Input: path: str main.py; Output: dict addr -> uid hex str, as hard coded in main.py
+    with _real_open(path) as f:
+        src = f.read()
+    table = {}
+    for uid, addr in re.findall(r"uid\s*==\s*b'([0-9a-f]+)'\s*:\s*\n\s*my_addr\s*=\s*(\d+)", src):
+        table[int(addr)] = uid
+    return table
+
+
+class VirtualSelector(selectors.SelectSelector):
+    # Never polls: a select() is where the node gives control back to the scheduler
+    def __init__(self, node):
+        super().__init__()
+        self.node = node
+
+    def select(self, timeout=None):
+        self.node.yield_to_scheduler(timeout)
+        return []
+
+
+class NodeLoop(asyncio.SelectorEventLoop):
+    def __init__(self, node):
+        super().__init__(VirtualSelector(node))
+        self.node = node
+
+    def time(self):
+        return self.node.now
+
+    def call_exception_handler(self, context):
+        if self.node.stop:
+            return  # tasks dropped at the end of a run
+        exc = context.get("exception")
+        self.node.task_errors.append(f"{context.get('message')}: {exc!r}" if exc else context.get("message"))
+        super().call_exception_handler(context)
+
+
+def run_node_main(coro):
+    # Input: coro: main() of the firmware; Output: its result (uasyncio.run() of the shims)
+    node = current
+    if node is None:
+        raise RuntimeError("uasyncio.run() outside of a host node")
+    loop = NodeLoop(node)
+    asyncio.set_event_loop(loop)
+    node.loop = loop
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        if node.stop:
+            loop.close()   # here, not in a later __del__ outside Emulator.stop()
+            asyncio.set_event_loop(None)
+
+
+class PinState:
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+        self.handler = None
+        self.trigger = None
+
+
+class Node:
+    def __init__(self, emulator, addr, uid, fs_root, wifi=True, overrides=None, boot_at=0.0):
+        self.emulator = emulator
+        self.addr = addr
+        self.uid = uid                    # hex str, machine.unique_id() returns the bytes
+        self.fs_root = fs_root
+        self.wifi = wifi                  # network.WLAN connects
+        self.overrides = overrides or {}  # main.py globals set after loading
+        self.now = boot_at                # power on, nodes of a field do not boot in the same millisecond
+        self.wake = boot_at               # next timer (sec), None = waits for an outside event
+        self.epoch_base = float(EPOCH_START)
+        self.blocked_sec = 0.0
+        self.pins = {}
+        self.uarts = {}                   # uart number -> device (medium.E22Modem for the LoRa HAT)
+        self.modules = {}                 # firmware modules of this node, name -> module
+        self.main = None
+        self.loop = None
+        self.pending = []                 # calls the scheduler hands in on the next resume
+        self.stop = False
+        self.done = False
+        self.error = None
+        self.task_errors = []             # exceptions asyncio reported for the node's tasks
+        self._resume = threading.Semaphore(0)
+        self._yielded = threading.Semaphore(0)
+        self.thread = None
+        for sub in ("sdcard", "flash"):
+            os.makedirs(os.path.join(fs_root, sub), exist_ok=True)
+        self.console = _real_open(os.path.join(fs_root, "console.log"), "w")
+
+    def pin(self, name):
+        st = self.pins.get(name)
+        if st is None:
+            st = self.pins[name] = PinState(name)
+        return st
+
+    def uart_device(self, num):
+        return self.uarts.get(num)
+
+    def set_wall(self, epoch_sec):
+        self.epoch_base = epoch_sec - self.now
+
+    # ---- node thread side ----
+
+    def yield_to_scheduler(self, timeout):
+        self.wake = None if timeout is None else self.now + timeout
+        self._yielded.release()
+        self._resume.acquire()
+        if self.stop:
+            raise NodeExit()
+        calls, self.pending = self.pending, []
+        for fn in calls:
+            fn()
+
+    def _run(self):
+        try:
+            spec = importlib.util.spec_from_file_location("main", MAIN_PATH)
+            self.main = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(self.main)   # returns only once main() does
+        except (NodeExit, SystemExit):
+            pass
+        except BaseException as e:
+            self.error = e
+            _real_print(f"ERROR - node {self.addr} stopped: {e!r}", file=sys.stderr)
+        finally:
+            self.done = True
+            self.wake = None
+            self._yielded.release()
+
+    # ---- scheduler side ----
+
+    def resume(self, t):
+        # Input: t: float virtual time; Output: None (runs the node until it waits again)
+        global current
+        if t > self.now:
+            self.now = t
+        current = self
+        sys.modules.update(self.modules)
+        self._resume.release()
+        self._yielded.acquire()
+        current = None
+
+
+class Emulator:
+    def __init__(self, medium, server, out_dir, echo=False):
+        self.medium = medium
+        self.server = server
+        self.out_dir = out_dir
+        self.echo = echo              # node console on the terminal too (always in <out_dir>/<addr>/console.log)
+        self.nodes = {}
+        self.events = []              # [(t, seq, node, fn)] calls into nodes at a virtual time
+        self._seq = 0
+        self.now = 0.0
+        self.uids = load_uid_table()
+        self._shims = {}
+
+    def add_node(self, addr, wifi=True, overrides=None, boot_at=0.0):
+        # Input: addr: int, one of the addresses main.py knows, boot_at: float sec; Output: Node
+        if addr not in self.uids:
+            raise ValueError(f"main.py has no board id for address {addr} (known: {sorted(self.uids)})")
+        node = Node(self, addr, self.uids[addr], os.path.join(self.out_dir, str(addr)), wifi, overrides, boot_at)
+        node.uarts[1] = self.medium.add_node(node)
+        self.nodes[addr] = node
+        return node
+
+    def at(self, t, addr, fn):
+        # Input: t: float sec, addr: int, fn: callable run in the node at t; Output: None
+        self._seq += 1
+        self.events.append((t, self._seq, self.nodes[addr], fn))
+        self.events.sort(key=lambda e: (e[0], e[1]))
+
+    def trigger_pin(self, t, addr, pin):
+        # Input: t: float sec, addr: int, pin: str e.g. "P13"; Output: None (rising edge, fires the IRQ handler)
+        def rise():
+            st = self.nodes[addr].pin(pin)
+            st.value = 1
+            if st.handler is not None:
+                st.handler(None)
+            st.value = 0
+        self.at(t, addr, rise)
+
+    def _install(self):
+        builtins.open = _open
+        builtins.print = _print
+
+    def _uninstall(self):
+        builtins.open = _real_open
+        builtins.print = _real_print
+
+    def _load(self, node):
+        # main.py runs up to asyncio.run(main()), the node's board modules are kept aside for it
+        global current
+        stand_ins = {"time": self._shims["utime"], "os": self._shims["vfs"], "gc": _make_gc(),
+                     "json": self._shims["ujson"], "requests": self._shims["requests"]}
+        saved = {name: sys.modules.get(name) for name in stand_ins}
+        sys.modules.update(stand_ins)
+        current = node
+        try:
+            node.thread = threading.Thread(target=node._run, name=f"node-{node.addr}", daemon=True)
+            node.thread.start()
+            node._yielded.acquire()
+        finally:
+            current = None
+            for name, mod in saved.items():
+                if mod is None:
+                    sys.modules.pop(name, None)
+                else:
+                    sys.modules[name] = mod
+        for name, mod in list(sys.modules.items()):
+            f = getattr(mod, "__file__", None)
+            if f and os.path.abspath(f).startswith(NETRAJAAL_DIR + os.sep) and not os.path.abspath(f).startswith(HOST_DIR + os.sep):
+                node.modules[name] = mod
+                del sys.modules[name]
+        if node.main is not None:
+            for key, value in node.overrides.items():
+                setattr(node.main, key, value)
+
+    def start(self):
+        # Input: None; Output: None (loads every node, in address order)
+        for p in (NETRAJAAL_DIR, HOST_DIR, SHIM_DIR):
+            if p in sys.path:
+                sys.path.remove(p)
+        sys.path[0:0] = [SHIM_DIR, HOST_DIR, NETRAJAAL_DIR]
+        self._shims = {name: _load_file(name, os.path.join(SHIM_DIR if name != "vfs" else HOST_DIR, name + ".py"))
+                       for name in ("utime", "ujson", "requests", "vfs")}
+        self._install()
+        for addr in sorted(self.nodes):
+            self._load(self.nodes[addr])
+
+    def run(self, until):
+        # Input: until: float virtual sec; Output: None (runs all nodes up to that time)
+        while True:
+            node, t = None, None
+            for n in self.nodes.values():
+                if not n.done and n.wake is not None and (t is None or n.wake < t):
+                    node, t = n, n.wake
+            if self.events and (t is None or self.events[0][0] <= t):
+                t, _, node, fn = self.events[0]
+                if t > until:
+                    break
+                self.events.pop(0)
+                if node.done:
+                    continue
+                node.pending.append(fn)
+            elif t is None or t > until:
+                break
+            self.now = max(self.now, t)
+            node.resume(t)
+        self.now = until
+
+    def stop(self):
+        # Input: None; Output: None (ends the node threads, main.py's finally closes its logger)
+        with warnings.catch_warnings():
+            # coroutines a node created but never got to run before the end of the run
+            warnings.simplefilter("ignore", RuntimeWarning)
+            for node in self.nodes.values():
+                if not node.done:
+                    node.stop = True
+                    node.resume(node.now)
+            for node in self.nodes.values():
+                node.loop = None
+            _gc.collect()
+        self._uninstall()
+        for node in self.nodes.values():
+            node.console.close()
+
+    def node_summary(self, node):
+        # Input: node: Node; Output: dict of what the node did
+        m = node.main
+        out = {"addr": node.addr, "now_sec": round(node.now, 3), "blocked_sec": round(node.blocked_sec, 3),
+               "error": repr(node.error) if node.error else None}
+        if m is not None:
+            for key in ("sent_count", "person_image_count", "total_image_count"):
+                out[key] = getattr(m, key, None)
+            for key in ("msgs_sent", "msgs_recd", "msgs_unacked", "imgpaths_to_send", "events_to_send"):
+                v = getattr(m, key, None)
+                out[key] = len(v) if v is not None else None
+        out["radio"] = self.medium.modems[node.addr].stats()
+        return out
+
+    def summary(self):
+        # Input: None; Output: dict, JSON friendly
+        return {
+            "virtual_sec": round(self.now, 3),
+            "nodes": [self.node_summary(self.nodes[a]) for a in sorted(self.nodes)],
+            "medium": self.medium.stats(),
+            "server": self.server.stats(),
+        }
+
+
+def unique_id():
+    # machine.unique_id() of the running node
+    return binascii.unhexlify(current.uid)
@@ -0,0 +1,52 @@
+"""
+`server.py`
+===================================================================
+
+Virtual cloud server for the host runtime: the requests shim posts here.
+JSON posts to the detect URL are accepted (a batch is a JSON array), the
+resumable upload endpoint answers 404 so the CC falls back to one JSON upload
+per image, as it does against a server without that endpoint.
+"""
+import json
+
+UPLOAD_PATH = "/watchmen-upload"
+
+
+class VirtualServer:
+    def __init__(self, rng, latency_ms=300, fail_rate=0.0):
+        # rng: random.Random for fail_rate draws
+        self.rng = rng
+        self.latency_ms = latency_ms
+        self.fail_rate = fail_rate
+        self.posts = []          # [(virtual sec, node addr, message_type, bytes)]
+        self.failed = 0
+        self.not_found = 0
+
+    def handle(self, node, method, url, body, headers):
+        # Input: node: runtime.Node, body: str / bytes / None; Output: tuple(status or None, text, latency sec)
+        latency = self.latency_ms / 1000
+        if self.fail_rate and self.rng.random() < self.fail_rate:
+            self.failed += 1
+            return None, "", latency
+        if UPLOAD_PATH in url:
+            self.not_found += 1
+            return 404, "", latency
+        size = len(body) if body is not None else 0
+        try:
+            payload = json.loads(body) if body else None
+        except ValueError:
+            return 400, "", latency
+        items = payload if isinstance(payload, list) else [payload]
+        for p in items:
+            msg_typ = p.get("message_type") if isinstance(p, dict) else None
+            self.posts.append((round(node.now, 3), node.addr, msg_typ, size // max(1, len(items))))
+        return 200, "{}", latency
+
+    def stats(self):
+        # Input: None; Output: dict counts and bytes per message_type
+        by_type = {}
+        for _, _, msg_typ, size in self.posts:
+            entry = by_type.setdefault(str(msg_typ), {"count": 0, "bytes": 0})
+            entry["count"] += 1
+            entry["bytes"] += size
+        return {"posts": len(self.posts), "failed": self.failed, "not_found": self.not_found, "by_type": by_type}
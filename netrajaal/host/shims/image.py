@@ -0,0 +1,67 @@
+"""
+OpenMV `image` on the host: frames without pixels. to_jpeg() returns
+deterministic random bytes whose size follows frame area, scale, ROI and
+quality, so the transfer budget code sees realistic sizes.
+"""
+import random as _random
+
+JPEG_BYTES_PER_PIXEL = 0.035   # at quality 50, ~32 KB for a HD frame
+SNAPSHOT_MS = 60               # blocking capture time
+
+BICUBIC = 1
+BILINEAR = 2
+
+
+class Image:
+    def __init__(self, w, h, seed=0):
+        self._w = w
+        self._h = h
+        self._seed = seed
+
+    def width(self):
+        return self._w
+
+    def height(self):
+        return self._h
+
+    def copy(self, *args, **kwargs):
+        return Image(self._w, self._h, self._seed)
+
+    def to_grayscale(self, x_scale=1.0, y_scale=1.0, copy=False, **kwargs):
+        return Image(max(1, int(self._w * x_scale)), max(1, int(self._h * y_scale)), self._seed)
+
+    def difference(self, other, *args, **kwargs):
+        return self
+
+    def find_blobs(self, *args, **kwargs):
+        return []
+
+    def to_jpeg(self, quality=90, x_scale=1.0, y_scale=1.0, roi=None, copy=False, **kwargs):
+        w, h = (roi[2], roi[3]) if roi else (self._w, self._h)
+        w = max(1, int(w * x_scale))
+        h = max(1, int(h * y_scale))
+        size = max(600, int(w * h * JPEG_BYTES_PER_PIXEL * (quality / 50) ** 0.7))
+        return JpegImage(w, h, size, self._seed * 131 + quality)
+
+    def compress(self, quality=90, **kwargs):
+        return self.to_jpeg(quality=quality)
+
+
+class JpegImage(Image):
+    def __init__(self, w, h, size, seed):
+        super().__init__(w, h, seed)
+        self._size = size
+        self._data = None
+
+    def size(self):
+        return self._size
+
+    def bytearray(self):
+        if self._data is None:
+            rng = _random.Random(self._seed)
+            self._data = bytearray(b"\xff\xd8" + rng.randbytes(self._size - 4) + b"\xff\xd9")
+        return self._data
+
+    def save(self, path, **kwargs):
+        with open(path, "wb") as f:
+            f.write(self.bytearray())
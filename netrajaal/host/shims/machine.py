@@ -0,0 +1,183 @@
+"""
+MicroPython `machine` on the host. Pins keep their state per node, UART 1 is
+the node's virtual LoRa HAT (medium.E22Modem), other buses read nothing.
+"""
+import runtime
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_NONE = None
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self._state = runtime.current.pin(id)
+        if value is not None:
+            self._state.value = 1 if value else 0
+
+    def value(self, v=None):
+        if v is None:
+            return self._state.value
+        self._state.value = 1 if v else 0
+
+    def __call__(self, v=None):
+        return self.value(v)
+
+    def on(self):
+        self._state.value = 1
+
+    def off(self):
+        self._state.value = 0
+
+    high = on
+    low = off
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def irq(self, handler=None, trigger=IRQ_RISING, **kwargs):
+        self._state.handler = handler
+        self._state.trigger = trigger
+
+    def __str__(self):
+        return f"Pin({self.id})"
+
+    __repr__ = __str__
+
+
+class _NoDevice:
+    def any(self):
+        return 0
+
+    def read(self, n=None):
+        return None
+
+    def readline(self):
+        return None
+
+    def write(self, data):
+        return len(data)
+
+
+class UART:
+    def __init__(self, id, baudrate=9600, *args, **kwargs):
+        self.id = id
+        self.baudrate = baudrate
+        self._dev = runtime.current.uart_device(id) or _NoDevice()
+
+    def init(self, baudrate=9600, *args, **kwargs):
+        self.baudrate = baudrate
+
+    def deinit(self):
+        pass
+
+    def any(self):
+        return self._dev.any()
+
+    def read(self, n=None):
+        return self._dev.read(n)
+
+    def readline(self):
+        return self._dev.readline()
+
+    def readinto(self, buf, n=None):
+        data = self._dev.read(len(buf) if n is None else n)
+        if not data:
+            return None
+        buf[:len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        return self._dev.write(bytes(data))
+
+
+class SPI:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def deinit(self):
+        pass
+
+    def write(self, data):
+        pass
+
+    def read(self, n, write=0x00):
+        return bytes(n)
+
+    def readinto(self, buf, write=0x00):
+        for i in range(len(buf)):
+            buf[i] = 0
+
+    def write_readinto(self, wbuf, rbuf):
+        self.readinto(rbuf)
+
+
+class RTC:
+    def datetime(self, dt=None):
+        # (year, month, day, weekday, hours, minutes, seconds, subseconds)
+        import calendar
+        if dt is not None:
+            runtime.current.set_wall(calendar.timegm((dt[0], dt[1], dt[2], dt[4], dt[5], dt[6], 0, 0, 0)))
+            return None
+        import utime
+        t = runtime.wall_time()
+        y, mo, d, h, mi, s, wd, _ = utime.gmtime(int(t))
+        return (y, mo, d, wd, h, mi, s, int((t % 1) * 1000000))
+
+
+class LED:
+    def __init__(self, name):
+        self.name = name
+
+    def on(self):
+        pass
+
+    def off(self):
+        pass
+
+    def toggle(self):
+        pass
+
+
+class WDT:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def feed(self):
+        pass
+
+
+def unique_id():
+    return runtime.unique_id()
+
+
+def reset():
+    raise runtime.NodeExit()
+
+
+soft_reset = reset
+
+
+def freq():
+    return 600000000
+
+
+def idle():
+    pass
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state=0):
+    pass
@@ -0,0 +1,9 @@
+"""OpenMV `ml` on the host: no model runs, predict() finds nothing."""
+
+
+class Model:
+    def __init__(self, path=None, *args, **kwargs):
+        self.path = path
+
+    def predict(self, inputs, *args, **kwargs):
+        return []
@@ -0,0 +1,43 @@
+"""
+MicroPython `network` on the host. WLAN connects straight away on nodes
+added with wifi=True (the CC by default), never on the others.
+"""
+import runtime
+
+
+class WLAN:
+    IF_STA = 0
+    IF_AP = 1
+    STAT_IDLE = 0
+    STAT_CONNECTING = 1
+    STAT_WRONG_PASSWORD = -3
+    STAT_NO_AP_FOUND = -2
+    STAT_CONNECT_FAIL = -1
+    STAT_GOT_IP = 3
+
+    def __init__(self, interface=IF_STA):
+        self._node = runtime.current
+        self._active = False
+        self._connected = False
+
+    def active(self, state=None):
+        if state is None:
+            return self._active
+        self._active = bool(state)
+        if not self._active:
+            self._connected = False
+
+    def connect(self, ssid=None, key=None, *args, **kwargs):
+        self._connected = self._active and self._node.wifi
+
+    def disconnect(self):
+        self._connected = False
+
+    def isconnected(self):
+        return self._connected and self._node.wifi
+
+    def status(self, *args):
+        return self.STAT_GOT_IP if self.isconnected() else self.STAT_CONNECTING
+
+    def ifconfig(self, *args):
+        return (f"10.0.0.{self._node.addr % 250 + 2}", "255.255.255.0", "10.0.0.1", "8.8.8.8")
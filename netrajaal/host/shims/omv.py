@@ -0,0 +1,14 @@
+"""OpenMV `omv` on the host."""
+import runtime
+
+
+def board_id():
+    return runtime.current.uid.upper()
+
+
+def arch():
+    return "HOST"
+
+
+def board_type():
+    return "HOST"
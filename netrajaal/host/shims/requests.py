@@ -0,0 +1,39 @@
+"""
+MicroPython `requests` on the host: posts go to the emulator's virtual server
+(server.py) and block the node for the server latency.
+"""
+import ujson as _json
+
+import runtime
+
+
+class Response:
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode()
+
+    def json(self):
+        return _json.loads(self.text)
+
+    def close(self):
+        pass
+
+
+def request(method, url, data=None, json=None, headers=None, **kwargs):
+    if json is not None:
+        data = _json.dumps(json)
+    node = runtime.current
+    status, text, latency = node.emulator.server.handle(node, method, url, data, headers or {})
+    runtime.block(latency)
+    if status is None:
+        raise OSError("connection failed")
+    return Response(status, text)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
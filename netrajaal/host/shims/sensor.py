@@ -0,0 +1,73 @@
+"""OpenMV `sensor` on the host: snapshot() returns a synthetic frame (image.py)."""
+import image
+import runtime
+
+RGB565 = 1
+GRAYSCALE = 2
+BAYER = 3
+JPEG = 4
+
+QQVGA = 0
+QVGA = 1
+VGA = 2
+SVGA = 3
+XGA = 4
+HD = 5
+FHD = 6
+WQXGA2 = 7
+
+FRAME_SIZES = {QQVGA: (160, 120), QVGA: (320, 240), VGA: (640, 480), SVGA: (800, 600),
+               XGA: (1024, 768), HD: (1280, 720), FHD: (1920, 1080), WQXGA2: (2592, 1944)}
+
+_framesize = QVGA
+_shots = 0
+
+
+def reset():
+    pass
+
+
+def set_pixformat(fmt):
+    pass
+
+
+def set_framesize(size):
+    global _framesize
+    _framesize = size
+
+
+def skip_frames(n=None, time=None):
+    if time is not None:
+        runtime.block(time / 1000)
+
+
+def set_auto_gain(*args, **kwargs):
+    pass
+
+
+def set_auto_whitebal(*args, **kwargs):
+    pass
+
+
+def set_auto_exposure(*args, **kwargs):
+    pass
+
+
+def set_windowing(*args, **kwargs):
+    pass
+
+
+def width():
+    return FRAME_SIZES[_framesize][0]
+
+
+def height():
+    return FRAME_SIZES[_framesize][1]
+
+
+def snapshot():
+    global _shots
+    _shots += 1
+    runtime.block(image.SNAPSHOT_MS / 1000)
+    w, h = FRAME_SIZES[_framesize]
+    return image.Image(w, h, seed=(runtime.current.addr << 20) + _shots)
@@ -0,0 +1,31 @@
+"""
+MicroPython `uasyncio` on the host: CPython asyncio, run() starts the node's
+virtual clock loop (see runtime.py).
+"""
+from asyncio import *
+import asyncio as _asyncio
+
+import runtime
+
+
+def run(coro):
+    return runtime.run_node_main(coro)
+
+
+async def sleep_ms(ms):
+    await _asyncio.sleep(ms / 1000)
+
+
+class ThreadSafeFlag:
+    def __init__(self):
+        self._event = _asyncio.Event()
+
+    def set(self):
+        self._event.set()
+
+    def clear(self):
+        self._event.clear()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
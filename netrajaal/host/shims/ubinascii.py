@@ -0,0 +1,2 @@
+"""MicroPython `ubinascii` on the host."""
+from binascii import *
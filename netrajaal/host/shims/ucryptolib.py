@@ -0,0 +1,162 @@
+"""
+MicroPython `ucryptolib` on the host: AES ECB (mode 1) / CBC (mode 2).
+Uses the `cryptography` package when it is installed, a small pure Python
+AES otherwise.
+"""
+MODE_ECB = 1
+MODE_CBC = 2
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
+
+
+def _xtime(a):
+    a <<= 1
+    return (a ^ 0x11B) if a & 0x100 else a
+
+
+def _mul(a, b):
+    r = 0
+    while b:
+        if b & 1:
+            r ^= a
+        a = _xtime(a)
+        b >>= 1
+    return r
+
+
+def _make_sbox():
+    sbox = [0] * 256
+    p = q = 1
+    while True:
+        p = p ^ _xtime(p)                # p * 3
+        q ^= q << 1                      # q / 3
+        q ^= q << 2
+        q ^= q << 4
+        q &= 0xFF
+        if q & 0x80:
+            q ^= 0x09
+        x = q
+        for s in (1, 2, 3, 4):
+            x ^= ((q << s) | (q >> (8 - s))) & 0xFF
+        sbox[p] = x ^ 0x63
+        if p == 1:
+            break
+    sbox[0] = 0x63
+    return sbox
+
+
+SBOX = _make_sbox()
+INV_SBOX = [0] * 256
+for _i, _v in enumerate(SBOX):
+    INV_SBOX[_v] = _i
+M2, M3, M9, M11, M13, M14 = ([_mul(i, k) for i in range(256)] for k in (2, 3, 9, 11, 13, 14))
+
+
+def _expand_key(key):
+    nk = len(key) // 4
+    if nk not in (4, 6, 8):
+        raise ValueError("AES key must be 16, 24 or 32 bytes")
+    nr = nk + 6
+    words = [list(key[4 * i:4 * i + 4]) for i in range(nk)]
+    rcon = 1
+    for i in range(nk, 4 * (nr + 1)):
+        t = list(words[i - 1])
+        if i % nk == 0:
+            t = [SBOX[t[1]] ^ rcon, SBOX[t[2]], SBOX[t[3]], SBOX[t[0]]]
+            rcon = _xtime(rcon)
+        elif nk > 6 and i % nk == 4:
+            t = [SBOX[b] for b in t]
+        words.append([a ^ b for a, b in zip(words[i - nk], t)])
+    return [sum(words[4 * r:4 * r + 4], []) for r in range(nr + 1)]
+
+
+def _encrypt_block(rks, block):
+    s = [b ^ k for b, k in zip(block, rks[0])]
+    nr = len(rks) - 1
+    for r in range(1, nr + 1):
+        s = [SBOX[s[(i + 4 * (i % 4)) % 16]] for i in range(16)]   # SubBytes + ShiftRows
+        if r != nr:
+            t = []
+            for c in range(0, 16, 4):
+                a0, a1, a2, a3 = s[c:c + 4]
+                t += [M2[a0] ^ M3[a1] ^ a2 ^ a3, a0 ^ M2[a1] ^ M3[a2] ^ a3,
+                      a0 ^ a1 ^ M2[a2] ^ M3[a3], M3[a0] ^ a1 ^ a2 ^ M2[a3]]
+            s = t
+        s = [b ^ k for b, k in zip(s, rks[r])]
+    return bytes(s)
+
+
+def _decrypt_block(rks, block):
+    nr = len(rks) - 1
+    s = [b ^ k for b, k in zip(block, rks[nr])]
+    for r in range(nr - 1, -1, -1):
+        s = [INV_SBOX[s[(i - 4 * (i % 4)) % 16]] for i in range(16)]   # InvShiftRows + InvSubBytes
+        s = [b ^ k for b, k in zip(s, rks[r])]
+        if r != 0:
+            t = []
+            for c in range(0, 16, 4):
+                a0, a1, a2, a3 = s[c:c + 4]
+                t += [M14[a0] ^ M11[a1] ^ M13[a2] ^ M9[a3], M9[a0] ^ M14[a1] ^ M11[a2] ^ M13[a3],
+                      M13[a0] ^ M9[a1] ^ M14[a2] ^ M11[a3], M11[a0] ^ M13[a1] ^ M9[a2] ^ M14[a3]]
+            s = t
+    return bytes(s)
+
+
+class aes:
+    def __init__(self, key, mode, iv=None):
+        if mode not in (MODE_ECB, MODE_CBC):
+            raise ValueError(f"unsupported AES mode {mode}")
+        self.mode = mode
+        self.iv = bytes(iv) if iv is not None else bytes(16)
+        self.key = bytes(key)
+        self._rks = None
+        self._enc = None
+        self._dec = None
+
+    def _check(self, data):
+        if len(data) % 16:
+            raise ValueError("AES data must be a multiple of 16 bytes")
+
+    def encrypt(self, data):
+        self._check(data)
+        if Cipher is not None:
+            if self._enc is None:
+                m = modes.ECB() if self.mode == MODE_ECB else modes.CBC(self.iv)
+                self._enc = Cipher(algorithms.AES(self.key), m).encryptor()
+            return self._enc.update(bytes(data))
+        if self._rks is None:
+            self._rks = _expand_key(self.key)
+        out = bytearray()
+        prev = self.iv
+        for i in range(0, len(data), 16):
+            block = data[i:i + 16]
+            if self.mode == MODE_CBC:
+                block = bytes(a ^ b for a, b in zip(block, prev))
+            prev = _encrypt_block(self._rks, block)
+            out += prev
+        self.iv = prev
+        return bytes(out)
+
+    def decrypt(self, data):
+        self._check(data)
+        if Cipher is not None:
+            if self._dec is None:
+                m = modes.ECB() if self.mode == MODE_ECB else modes.CBC(self.iv)
+                self._dec = Cipher(algorithms.AES(self.key), m).decryptor()
+            return self._dec.update(bytes(data))
+        if self._rks is None:
+            self._rks = _expand_key(self.key)
+        out = bytearray()
+        prev = self.iv
+        for i in range(0, len(data), 16):
+            block = bytes(data[i:i + 16])
+            plain = _decrypt_block(self._rks, block)
+            if self.mode == MODE_CBC:
+                plain = bytes(a ^ b for a, b in zip(plain, prev))
+            prev = block
+            out += plain
+        self.iv = prev
+        return bytes(out)
@@ -0,0 +1,23 @@
+"""
+MicroPython `ujson` (and `json`, see runtime.py) on the host.
+MicroPython serialises bytes like str, CPython refuses them: the CC puts
+base64 bytes straight into heartbeat and image payloads.
+"""
+import json as _json
+
+loads = _json.loads
+load = _json.load
+
+
+def _default(obj):
+    if isinstance(obj, (bytes, bytearray)):
+        return bytes(obj).decode("latin-1")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj, separators=None):
+    return _json.dumps(obj, separators=separators, default=_default)
+
+
+def dump(obj, stream, separators=None):
+    stream.write(dumps(obj, separators))
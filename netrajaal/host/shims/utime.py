@@ -0,0 +1,87 @@
+"""
+MicroPython `utime` (and `time`, see runtime.py) on the node's virtual clock.
+Sleeps block: they move the clock of the running node only.
+"""
+import calendar as _calendar
+import time as _time
+
+import runtime
+
+TICKS_PERIOD = 1 << 30
+
+
+def ticks_ms():
+    return int(runtime.now() * 1000) & (TICKS_PERIOD - 1)
+
+
+def ticks_us():
+    return int(runtime.now() * 1000000) & (TICKS_PERIOD - 1)
+
+
+ticks_cpu = ticks_us
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & (TICKS_PERIOD - 1)
+
+
+def ticks_diff(new, old):
+    d = (new - old) & (TICKS_PERIOD - 1)
+    if d >= TICKS_PERIOD // 2:
+        d -= TICKS_PERIOD
+    return d
+
+
+def time():
+    return int(runtime.wall_time())
+
+
+def time_ns():
+    return int(runtime.wall_time() * 1000000000)
+
+
+def monotonic():
+    return runtime.now()
+
+
+def sleep(seconds):
+    runtime.block(seconds)
+
+
+def sleep_ms(ms):
+    runtime.block(ms / 1000)
+
+
+def sleep_us(us):
+    runtime.block(us / 1000000)
+
+
+def gmtime(secs=None):
+    t = _time.gmtime(time() if secs is None else secs)
+    return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_wday, t.tm_yday)
+
+
+localtime = gmtime
+
+
+def mktime(t):
+    return _calendar.timegm((t[0], t[1], t[2], t[3], t[4], t[5], 0, 0, 0))
+
+
+class clock:
+    def __init__(self):
+        self._last = runtime.now()
+        self._fps = 0.0
+
+    def tick(self):
+        t = runtime.now()
+        if t > self._last:
+            self._fps = 1 / (t - self._last)
+        self._last = t
+
+    def fps(self):
+        return self._fps
+
+
+def __getattr__(name):
+    return getattr(_time, name)
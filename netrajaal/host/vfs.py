@@ -0,0 +1,59 @@
+"""
+`vfs.py`
+===================================================================
+
+`os` as the firmware sees it on the host (see runtime.py): paths under
+/sdcard and /flash go to the node's directory, os.sync() is free,
+os.urandom() comes from the seeded `random` so a run replays byte for byte,
+everything else is the real `os`.
+"""
+import os as _os
+import random as _random
+
+import runtime
+
+sep = "/"
+
+
+def listdir(path="."):
+    return _os.listdir(runtime.map_path(path))
+
+
+def stat(path):
+    return _os.stat(runtime.map_path(path))
+
+
+def mkdir(path, *args):
+    return _os.mkdir(runtime.map_path(path, True), *args)
+
+
+def rmdir(path):
+    return _os.rmdir(runtime.map_path(path, True))
+
+
+def remove(path):
+    return _os.remove(runtime.map_path(path, True))
+
+
+unlink = remove
+
+
+def urandom(n):
+    return _random.randbytes(n)
+
+
+def rename(old, new):
+    return _os.rename(runtime.map_path(old, True), runtime.map_path(new, True))
+
+
+def ilistdir(path="."):
+    for entry in _os.scandir(runtime.map_path(path)):
+        yield (entry.name, 0x4000 if entry.is_dir() else 0x8000, 0)
+
+
+def sync():
+    pass
+
+
+def __getattr__(name):
+    return getattr(_os, name)
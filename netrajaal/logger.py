@@ -1,4 +1,8 @@
 import os
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
 
 # Try to import RTC and utime for MicroPython
 try:
@@ -15,6 +19,9 @@ except ImportError:
 
 DEFAULT_LOG_LEVEL = "INFO"
 DEFAULT_SAVE_LOG = False # TODO, enable to save it to file
+LOG_RING_BYTES = 8192          # log lines wait here until the flush task writes them to the file
+LOG_FLUSH_INTERVAL_MS = 2000   # how often run() writes the ring buffer out
+FLUSH_NOW_LEVEL = 40           # ERROR and above are written out straight away
 
 
 # Initialize RTC if available
@@ -26,17 +33,26 @@ if RTC_AVAILABLE:
         RTC_AVAILABLE = False
 
 
+_ts_second = -1     # ticks_ms() // 1000 when _ts_prefix was made
+_ts_prefix = ""
+
+
 def get_timestamp():
     """
     Get formatted timestamp in format HH:MM:SS,mmm
-    Uses RTC for MicroPython, datetime for CPython
+    Uses RTC for MicroPython (read once per second), datetime for CPython
     """
+    global _ts_second, _ts_prefix
     if RTC_AVAILABLE and _rtc:
         try:
-            _, _, _, _, h, m, s, _ = _rtc.datetime()
             # Get milliseconds from ticks_ms (approximate, but close enough)
-            ms = utime.ticks_ms() % 1000
-            return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+            ticks = utime.ticks_ms()
+            if ticks // 1000 != _ts_second:
+                _, _, _, _, h, m, s, _ = _rtc.datetime()
+                _ts_prefix = f"{h:02d}:{m:02d}:{s:02d},"
+                _ts_second = ticks // 1000
+            ms = ticks % 1000
+            return f"{_ts_prefix}{ms:03d}"
         except:
             pass
 
@@ -173,7 +189,12 @@ class SimpleLogger:
 
         # File logging setup - open file once at initialization
         self.log_file = None
+        self.ring = None
+        self.ring_head = 0       # next write position in ring
+        self.ring_count = 0      # bytes in ring not written to the file yet
+        self.flush_count = 0
         if self.save_log:
+            self.ring = bytearray(LOG_RING_BYTES)
             self._open_log_file()
 
         SimpleLogger._initialized = True
@@ -261,72 +282,117 @@ class SimpleLogger:
             self.log_file = None
             return False
 
-    def _log(self, level, msg):
-        # Get numeric value for the message level
-        level_value = LOG_LEVELS.get(level, LOG_LEVELS["INFO"])
+    def is_enabled(self, level):
+        """True if messages of this level are logged, to guard expensive log arguments"""
+        return LOG_LEVELS.get(level, LOG_LEVELS["INFO"]) >= self.log_level_value
 
-        # Only print if message level is >= configured log level
-        # (higher number = higher priority, so we want to show it)
-        if level_value >= self.log_level_value:
-            timestamp = get_timestamp()
-            log_message = f"{timestamp} - {level} - {msg}"
+    def _log(self, level, msg, args):
+        # Level is checked by the callers, formatting happens only for lines that are logged
+        if args:
+            try:
+                msg = msg % args
+            except Exception:
+                msg = f"{msg} {args}"
+        log_message = f"{get_timestamp()} - {level} - {msg}"
+
+        # Write to terminal if enabled
+        if self.show_terminal:
+            print(log_message)
+
+        # File logging goes through the ring buffer, written out by flush()
+        if self.ring is not None:
+            self._append((log_message + "\n").encode())
+            if LOG_LEVELS.get(level, 0) >= FLUSH_NOW_LEVEL:
+                self.flush()
+
+    def _append(self, data):
+        size = len(self.ring)
+        if len(data) > size:
+            data = data[:size]
+        if self.ring_count + len(data) > size:
+            self.flush()  # ring full before the flush task came round
+        n = len(data)
+        first = min(n, size - self.ring_head)
+        self.ring[self.ring_head:self.ring_head + first] = data[:first]
+        if first < n:
+            self.ring[0:n - first] = data[first:]
+        self.ring_head = (self.ring_head + n) % size
+        self.ring_count += n
+
+    def _write_out(self, parts):
+        for part in parts:
+            self.log_file.write(part)
+        self.log_file.flush()  # file size on the card is updated, lines are safe from here on
+
+    def flush(self):
+        """Write the ring buffer to the log file"""
+        if self.ring is None or self.ring_count == 0:
+            return
+        size = len(self.ring)
+        start = (self.ring_head - self.ring_count) % size
+        mv = memoryview(self.ring)
+        if start + self.ring_count <= size:
+            parts = (mv[start:start + self.ring_count],)
+        else:
+            parts = (mv[start:], mv[:self.ring_head])
+        if self.log_file is None:
+            self.ring_count = 0  # no file to write to, keep the ring from filling up
+            return
+        try:
+            self._write_out(parts)
+            self.flush_count += 1
+        except OSError as e:
+            # EIO or other I/O errors - file handle likely invalid
+            error_code = getattr(e, 'errno', None)
+            if error_code == 5 or 'EIO' in str(e) or 'Input/output error' in str(e):
+                print(f"ERROR - Log file I/O error (EIO), attempting recovery: {e}")
+                # Attempt to reopen and retry once
+                if self._reopen_log_file():
+                    try:
+                        self._write_out(parts)
+                        print("info - ===> Log file recovered, write succeeded after reopen <===")
+                    except Exception as retry_e:
+                        print(f"WARNING - Failed to write to log file after recovery: {retry_e}")
+                else:
+                    print("WARNING - Failed to reopen log file, skipping file logging")
+            else:
+                print(f"WARNING - Failed to write to log file: {e}")
+        except Exception as e:
+            print(f"WARNING - Failed to write to log file: {e}")
+        self.ring_count = 0
 
-            # Write to terminal if enabled
-            if self.show_terminal:
-                print(log_message)
+    async def run(self, interval_ms=LOG_FLUSH_INTERVAL_MS):
+        """Flush task, start once with asyncio.create_task"""
+        while True:
+            await asyncio.sleep(interval_ms / 1000)
+            self.flush()
 
-            # Write to file if file logging is enabled
-            if self.log_file:
-                try:
-                    self.log_file.write(log_message + "\n")
-                    self.log_file.flush()  # Ensure data is written immediately
-                    # Try to sync to disk if available (MicroPython/OpenMV)
-                    try:
-                        if hasattr(self.log_file, "sync"):
-                            self.log_file.sync()
-                        else:
-                            pass  # TODO sync is not available in micropython
-                            # print("____log sync failed, not available")
-                    except (AttributeError, OSError):
-                        print("____log sync failed, AttributeError, OSError")
-                        pass
-                except OSError as e:
-                    # EIO or other I/O errors - file handle likely invalid
-                    error_code = getattr(e, 'errno', None)
-                    if error_code == 5 or 'EIO' in str(e) or 'Input/output error' in str(e):
-                        print(f"ERROR - Log file I/O error (EIO), attempting recovery: {e}")
-                        # Attempt to reopen and retry once
-                        if self._reopen_log_file():
-                            try:
-                                self.log_file.write(log_message + "\n")
-                                self.log_file.flush()
-                                print("info - ===> Log file recovered, write succeeded after reopen <===")
-                            except Exception as retry_e:
-                                print(f"WARNING - Failed to write to log file after recovery: {retry_e}")
-                        else:
-                            print("WARNING - Failed to reopen log file, skipping file logging")
-                    else:
-                        print(f"WARNING - Failed to write to log file: {e}")
-                except Exception as e:
-                    print(f"WARNING - Failed to write to log file: {e}")
+    # msg can be a %-format string with its arguments passed separately,
+    # logger.info("[LORA] got %d bytes", n), it is only formatted if the level is logged
 
-    def info(self, msg):
-        self._log("INFO", msg)
+    def info(self, msg, *args):
+        if 20 >= self.log_level_value:
+            self._log("INFO", msg, args)
 
-    def warning(self, msg):
-        self._log("WARNING", msg)
+    def warning(self, msg, *args):
+        if 30 >= self.log_level_value:
+            self._log("WARNING", msg, args)
 
-    def error(self, msg):
-        self._log("ERROR", msg)
+    def error(self, msg, *args):
+        if 40 >= self.log_level_value:
+            self._log("ERROR", msg, args)
 
-    def debug(self, msg):
-        self._log("DEBUG", msg)
+    def debug(self, msg, *args):
+        if 10 >= self.log_level_value:
+            self._log("DEBUG", msg, args)
 
-    def critical(self, msg):
-        self._log("CRITICAL", msg)
+    def critical(self, msg, *args):
+        if 50 >= self.log_level_value:
+            self._log("CRITICAL", msg, args)
 
     def close(self):
         """Close the log file if it's open - ensures proper cleanup"""
+        self.flush()
         if self.log_file:
             try:
                 # Flush and sync before closing
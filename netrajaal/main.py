@@ -9,7 +9,6 @@ from machine import RTC, UART, Pin
 import uasyncio as asyncio
 import utime
 import sensor
-import image
 import ml
 import os                   # file system access
 import time
@@ -28,11 +27,25 @@ import sx1262
 import gps_driver
 from cellular_driver import Cellular
 import detect
+import storage
+import transfer_budget
+import uplink
+import resumable_upload
+import spool
+import transport_health
+import hb_codec
+import pkttrace
+import taskprof
+import membudget
+import gcpolicy
+import ringbuf
 
 # -----------------------------------▼▼▼▼▼-----------------------------------
 # TESTING VARIABLES
 DYNAMIC_SPATH = False
 ENCRYPTION_ENABLED = True
+HB_BINARY = False            # binary heartbeat (hb_codec.py) instead of the colon joined text, needs the backend decoder
+SAVE_RAW_IMAGE = False # also keep the unencrypted jpeg ({addr}_{epoch_ms}_raw.jpg) on SD
 # -----------------------------------▲▲▲▲▲-----------------------------------
 
 
@@ -66,6 +79,29 @@ EVENT_SENDING_FAILED_PAUSE = 10
 
 GPS_WAIT_SEC = 5
 
+JPEG_QUALITY = 50  # same as img.save() default
+
+# Two tier image transfer: units send a small preview (crop / thumbnail) first,
+# the full frame stays on SD until the CC (or the cloud through the CC) asks for it with "F"
+TWO_TIER_IMAGES = True
+PREVIEW_MAX_CHUNKS = 40      # upper bound for the preview, the link budget can make it smaller
+IMG_KIND_PREVIEW = "c"
+IMG_KIND_FULL = "f"
+IMG_KIND_NAMES = {IMG_KIND_PREVIEW: "preview", IMG_KIND_FULL: "full"}
+IMG_KIND_HB_BUNDLE = "g"   # not an image: heartbeats of several nodes, see hb_codec.pack_bundle()
+
+# Relays collect heartbeats of other nodes and send them upstream as one chunked bundle
+HB_BUNDLING = True
+HB_BUNDLE_WINDOW_SEC = 30  # a forwarded heartbeat waits at most this long for others
+HB_BUNDLE_MIN = 4          # fewer go as plain "H" packets, cheaper than "B" + "I" + "E"
+HB_BUNDLE_MAX = 12         # send straight away once this many are waiting
+HB_BUNDLE_MAX_PENDING = 36 # oldest heartbeats are dropped beyond this (upstream down)
+
+# SD card write policy, see storage.py
+STORAGE_SYNC_POLICY = storage.SYNC_PER_BATCH  # SYNC_IMMEDIATE / SYNC_PER_BATCH / SYNC_TIMED
+STORAGE_SYNC_INTERVAL_MS = 5000               # only used with SYNC_TIMED
+STORAGE_SETTLE_MS = 500                       # pause after each os.sync()
+
 # Memory Management Constants
 MAX_MSGS_SENT = 500          # Maximum messages in sent buffer
 MAX_MSGS_RECD = 500          # Maximum messages in received buffer
@@ -75,11 +111,27 @@ MAX_IMAGES_SAVED_AT_CC = 200 # Maximum image filenames to track at CC
 MAX_IMAGES_TO_SEND = 50      # Maximum images in send queue
 MAX_OLD_MSG_AGE_SEC = 3600   # Age threshold (seconds) for cleaning old messages
 MEM_CLEANUP_INTERVAL_SEC = 300  # Run memory cleanup every 5 minutes
-GC_COLLECT_INTERVAL_SEC = 60    # Run garbage collection every minute
+GC_COLLECT_INTERVAL_SEC = 60    # Collect at the first idle point this long after the previous collection
+GC_CHECK_INTERVAL_SEC = 5       # how often periodic_gc() looks for an idle point
+GC_IDLE_MS = 2000               # no packet for this long (and no TRANS MODE) is an idle point
+GC_THRESHOLD_FRACTION = 0.25    # gc.threshold(): the allocator collects on its own after this share of the heap
+
+# Memory budgets per subsystem (KB), see membudget.py. Over budget a new "B" gets "W" back,
+# a capture is dropped before encryption and queues / message logs are trimmed.
+# CHUNKS and CRYPTO are sized from the largest image a node moves: an HD full frame
+# (sent after "F") at JPEG_QUALITY, encrypted. A transfer holds it twice (chunks and the
+# recompiled copy), an image that does not fit even an empty budget is dropped, not retried
+MAX_TRANSFER_KB = 160
+MEM_BUDGET_KB = {membudget.CHUNKS: 2 * MAX_TRANSFER_KB, membudget.CRYPTO: MAX_TRANSFER_KB + 8,
+                 membudget.QUEUES: 16, membudget.MSGLOG: 64}
+MEM_HEAP_RESERVE_KB = 24      # a reservation must leave this much heap free
+MSG_ENTRY_OVERHEAD = 64       # bytes of a message log entry besides its payload (tuple, uid, timestamp)
+QUEUE_ENTRY_OVERHEAD = 160    # bytes of a queued image entry besides its path (dict)
 
 MIDLEN = 7
 FLAKINESS = 0
 PACKET_PAYLOAD_LIMIT = 195 # bytes
+IMG_CHUNK_BYTES = 200      # image payload per "I" message
 
 AIR_SPEED = 19200
 
@@ -90,6 +142,21 @@ WIFI_SSID = "Airtel_anki_3363_2.4G"
 WIFI_PASSWORD = "air34854"
 WIFI_ENABLED = True
 
+# CC uploads heartbeats / event texts in batches (one JSON array POST), see uplink.py
+UPLINK_BATCHING = True
+# CC keeps what it could not upload on the SD card and replays it later, see spool.py
+UPLINK_SPOOL = True
+
+# Binary per packet event trace on SD, see pkttrace.py and util/decode_trace.py
+TRACE_ENABLED = True
+
+# Per task time between yields and event loop lag, logged with the status summary, see taskprof.py
+TASKPROF_ENABLED = True
+TASKPROF_IN_HB = False       # also send worst loop lag / longest task step since the last heartbeat
+
+TRANSPORT_CELLULAR = "cellular"
+TRANSPORT_WIFI = "wifi"
+
 cellular_system = None
 wifi_nic = None
 # -----------------------------------▲▲▲▲▲-----------------------------------
@@ -116,6 +183,7 @@ busy_devices = [] # device those are busy in sending/receiving images
 
 # SD card write lock
 lock = asyncio.Lock()
+sd_storage = storage.WriteBehindStorage(lock, STORAGE_SYNC_POLICY, STORAGE_SETTLE_MS, STORAGE_SYNC_INTERVAL_MS)
 
 my_addr = None
 shortest_path_to_cc = []
@@ -161,10 +229,9 @@ else:
 clock_start = utime.ticks_ms() # get millisecond counter
 
 def get_free_memory():
-    """Get available free memory in bytes"""
+    """Get available free memory in bytes, without a gc.collect() (garbage counts as used)"""
     try:
         # MicroPython's gc module provides mem_free()
-        gc.collect()
         return gc.mem_free()
     except AttributeError:
         # If gc.mem_free() doesn't exist, try machine.mem_free()
@@ -199,6 +266,22 @@ logger.info(f"[FS] Using FS_ROOT : {FS_ROOT}")
 MY_IMAGE_DIR = f"{FS_ROOT}/myimages"
 MY_EVENT_DIR = f"{FS_ROOT}/myevents"
 NET_IMAGE_DIR = f"{FS_ROOT}/netimages"
+SPOOL_DIR = f"{FS_ROOT}/spool"
+TRACE_DIR = f"{FS_ROOT}/trace"
+
+def file_exists(path):
+    # Input: path: str; Output: bool
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+def img_filepath(creator, epoch_ms, kind):
+    # Input: creator: int, epoch_ms: int, kind: str IMG_KIND_*; Output: str path of the encrypted image
+    if kind == IMG_KIND_FULL and TWO_TIER_IMAGES:
+        return f"{MY_IMAGE_DIR}/{creator}_{epoch_ms}_full.enc"
+    return f"{MY_IMAGE_DIR}/{creator}_{epoch_ms}.enc"
 
 def create_dir_if_not_exists(dir_path):
     try:
@@ -234,6 +317,10 @@ def create_dir_if_not_exists(dir_path):
 create_dir_if_not_exists(NET_IMAGE_DIR)
 create_dir_if_not_exists(MY_IMAGE_DIR)
 create_dir_if_not_exists(MY_EVENT_DIR)
+create_dir_if_not_exists(SPOOL_DIR)
+create_dir_if_not_exists(TRACE_DIR)
+tracer = pkttrace.Tracer(sd_storage, TRACE_DIR, my_addr, TRACE_ENABLED)
+task_profiler = taskprof.TaskProfiler(TASKPROF_ENABLED)
 
 encnode = enc.EncNode(my_addr)
 logger.info(f"[INIT] ===> MyAddr = {my_addr}, uid={uid.decode()} <===\n")
@@ -323,7 +410,7 @@ def ack_needed(msg_typ): # msg_type P is devided in (B,I,E)
     # Input: msg_typ: str; Output: bool indicating if acknowledgement required
     if msg_typ in ["A", "I", "S", "W", "N"]:
         return False
-    if msg_typ in ["H", "B", "E", "V", "C", "T"]:
+    if msg_typ in ["H", "B", "E", "V", "C", "T", "F"]:
         return True
     return False
 
@@ -337,6 +424,8 @@ recv_msg_count = {}
 
 URL_OLD = "https://n8n.vyomos.org/webhook/watchmen-detect/"
 URL = "https://hqapi.vyomos.org/watchmen-detect/"
+UPLOAD_URL = "https://hqapi.vyomos.org/watchmen-upload" # resumable image upload, see resumable_upload.py
+RESUMABLE_UPLOAD = True # CC streams images in binary parts, falls back to one JSON upload if the server has no endpoint
 
 
 # -----------------------------------▼▼▼▼▼-----------------------------------
@@ -489,53 +578,27 @@ def is_lora_ready():
 
 
 
-msgs_sent = []
-msgs_unacked = []
-msgs_recd = []
+msgs_sent = ringbuf.Ring(MAX_MSGS_SENT)
+msgs_unacked = ringbuf.Unacked(MAX_MSGS_UNACKED)
+msgs_recd = ringbuf.Ring(MAX_MSGS_RECD)
+link_stats = transfer_budget.LinkStats() # ack success / RSSI per neighbour, drives image transfer budget
+gc_policy = gcpolicy.GcPolicy(GC_THRESHOLD_FRACTION, GC_COLLECT_INTERVAL_SEC * 1000, GC_IDLE_MS,
+                             lambda: image_in_progress)
+mem_budget = membudget.MemBudget(MEM_BUDGET_KB, MEM_HEAP_RESERVE_KB, lambda: gc_policy.collect("budget"))
 
 # Memory Management Functions
 def cleanup_old_messages():
-    """Remove old messages from buffers based on age and size limits"""
-    global msgs_sent, msgs_recd, msgs_unacked
+    """Remove old messages from buffers based on age, the size limit is the capacity of the ring buffers"""
     current_time = time_msec()
     age_threshold_ms = MAX_OLD_MSG_AGE_SEC * 1000
 
-    # Clean msgs_sent - remove messages older than threshold
-    msgs_sent = [(msg_uid, msg, t) for msg_uid, msg, t in msgs_sent
-                 if (current_time - t) < age_threshold_ms]
-    # Also limit by size
-    if len(msgs_sent) > MAX_MSGS_SENT:
-        msgs_sent = msgs_sent[-MAX_MSGS_SENT:]
-        logger.info(f"[MEM] Trimmed msgs_sent to {MAX_MSGS_SENT} entries")
-
-    # Clean msgs_recd - remove messages older than threshold
-    msgs_recd = [(msg_uid, msg, t) for msg_uid, msg, t in msgs_recd
-                 if (current_time - t) < age_threshold_ms]
-    # Also limit by size
-    if len(msgs_recd) > MAX_MSGS_RECD:
-        msgs_recd = msgs_recd[-MAX_MSGS_RECD:]
-        logger.info(f"[MEM] Trimmed msgs_recd to {MAX_MSGS_RECD} entries")
-
-    # Clean msgs_unacked - remove very old unacked messages (they likely failed)
-    old_unacked = []
-    new_unacked = []
-    for msg_uid, msg, t in msgs_unacked:
-        age = current_time - t
-        if age > age_threshold_ms * 2:  # Double threshold for unacked (more lenient)
-            old_unacked.append(msg_uid)
-        else:
-            new_unacked.append((msg_uid, msg, t))
-    msgs_unacked = new_unacked
-
-    if len(old_unacked) > 0:
-        logger.info(f"[MEM] Removed {len(old_unacked)} old unacked messages")
-
-    # Also limit by size
-    if len(msgs_unacked) > MAX_MSGS_UNACKED:
-        # Remove oldest ones
-        msgs_unacked.sort(key=lambda x: x[2])  # Sort by timestamp
-        msgs_unacked = msgs_unacked[-MAX_MSGS_UNACKED:]
-        logger.info(f"[MEM] Trimmed msgs_unacked to {MAX_MSGS_UNACKED} entries")
+    # entries are in time order, only the old end is walked
+    dropped_sent = msgs_sent.drop_older(current_time - age_threshold_ms)
+    dropped_recd = msgs_recd.drop_older(current_time - age_threshold_ms)
+    # Double threshold for unacked (more lenient), they likely failed
+    dropped_unacked = msgs_unacked.drop_older(current_time - 2 * age_threshold_ms)
+    if dropped_sent or dropped_recd or dropped_unacked:
+        logger.info("[MEM] Removed old messages, sent:%s recd:%s unacked:%s", dropped_sent, dropped_recd, dropped_unacked)
 
 def cleanup_chunk_map():
     """Clean up old/incomplete chunk entries"""
@@ -547,8 +610,29 @@ def cleanup_chunk_map():
         keys_to_remove = list(chunk_map.keys())[:entries_to_remove]
         for key in keys_to_remove:
             chunk_map.pop(key)
+            mem_budget.release(membudget.CHUNKS, key)
         logger.info(f"[MEM] Cleaned {entries_to_remove} old chunk_map entries")
 
+def check_mem_budgets():
+    # Input: None; Output: None (measures queues / message logs, trims them when over budget)
+    queued = 0
+    for entry in imgpaths_to_send:
+        queued += len(entry["enc_filepath"]) + QUEUE_ENTRY_OVERHEAD
+    if mem_budget.measure(membudget.QUEUES, queued):
+        drop = len(imgpaths_to_send) // 2
+        for _ in range(drop):
+            oldest = imgpaths_to_send.pop(0) # stays on SD
+            logger.warning("[MEM] queues over budget, dropped oldest queued image %s", oldest['enc_filepath'])
+    logged = 0
+    for log in (msgs_sent, msgs_recd, msgs_unacked):
+        for _, msg, _ in log:
+            logged += len(msg) + MSG_ENTRY_OVERHEAD
+    if mem_budget.measure(membudget.MSGLOG, logged):
+        # unacked messages are still in flight, only the logs of what is done are shortened
+        msgs_sent.trim(len(msgs_sent) // 2)
+        msgs_recd.trim(len(msgs_recd) // 2)
+        logger.warning("[MEM] msglog over budget (%sKB), trimmed to sent:%s recd:%s", logged // 1024, len(msgs_sent), len(msgs_recd))
+
 
 async def periodic_memory_cleanup():
     """Periodically clean up memory buffers and run garbage collection"""
@@ -565,27 +649,31 @@ async def periodic_memory_cleanup():
             # Clean up chunk map
             cleanup_chunk_map()
             
-            # Run garbage collection
-            gc.collect()
+            # Garbage collection at the next idle point, see periodic_gc()
+            gc_policy.request("cleanup")
 
-            free_after = get_free_memory()
-            freed = free_after - free_before if free_before > 0 and free_after > 0 else 0
-            logger.info(f"[MEM] Cleanup complete (free: {free_after/1024:.1f}KB, freed: {freed/1024:.1f}KB)")
+            logger.info("[MEM] Cleanup complete, collection pending (gc: %s)", gc_policy.stats())
             logger.info(f"[MEM] Buffers - sent:{len(msgs_sent)}, recd:{len(msgs_recd)}, unacked:{len(msgs_unacked)}, chunks:{len(chunk_map)}")
 
         except Exception as e:
             logger.error(f"[MEM] error in memory cleanup: {e}")
 
 async def periodic_gc():
-    """Run garbage collection more frequently for aggressive cleanup"""
+    """Run requested / due garbage collections at idle points (gcpolicy.py), check the memory budgets"""
+    gc_policy.setup()
+    last_budget_check = time_msec()
     while True:
         try:
-            await asyncio.sleep(GC_COLLECT_INTERVAL_SEC)
-            gc.collect()
+            await asyncio.sleep(GC_CHECK_INTERVAL_SEC)
+            gc_policy.maybe_collect()
+            if time_msec() - last_budget_check >= GC_COLLECT_INTERVAL_SEC * 1000:
+                last_budget_check = time_msec()
+                check_mem_budgets()
         except Exception as e:
             logger.error(f"[MEM] error in periodic GC: {e}")
 
-# MSG TYPE = H(eartbeat), A(ck), B(egin), E(nd), C(hunk), S(hortest path)
+# MSG TYPE = H(eartbeat), A(ck), B(egin), E(nd), C(hunk), S(hortest path), F(ull frame request)
+# B with kind "g" carries a bundle of heartbeats of several nodes instead of an image
 
 def radio_send(dest, data, msg_uid):
     # Input: dest: int, data: bytes; Output: None (sends bytes via LoRa, logs send)
@@ -593,25 +681,24 @@ def radio_send(dest, data, msg_uid):
     sent_count = sent_count + 1
     lendata = len(data)
     if len(data) > 254:
-        logger.error(f"[LORA] msg too large : {len(data)}")
+        logger.error("[LORA] msg too large : %s", len(data))
     #data = lendata.to_bytes(1) + data
     data = data.replace(b"\n", b"{}[]")
     loranode.send(dest, data)
+    tracer.tx(msg_uid, dest, lendata)
     # Map 0-210 bytes to 1-10 asterisks, anything above 210 = 10 asterisks
     data_masked_log = min(10, max(1, (len(data) + 20) // 21))
-    logger.info(f"[⮕ SENT to {dest}] [{'*' * data_masked_log}] {len(data)} bytes, MSG_UID = {msg_uid}")
+    logger.info("[⮕ SENT to %s] [%s] %d bytes, MSG_UID = %s", dest, '*' * data_masked_log, len(data), msg_uid)
 
 def pop_and_get(msg_uid):
     # Input: msg_uid: bytes; Output: tuple(msg_uid, msgbytes, timestamp) removed from msgs_unacked or None
-    for i in range(len(msgs_unacked)):
-        m, d, t = msgs_unacked[i]
-        if m == msg_uid:
-            return msgs_unacked.pop(i)
-    return None
+    return msgs_unacked.pop(msg_uid)
 
 async def send_single_packet(msg_typ, creator, msgbytes, dest, retry_count = 3):
     # Input: msg_typ: str, creator: int, msgbytes: bytes, dest: int; Output: tuple(success: bool, missing_chunks: list)
     msg_uid = get_msg_uid(msg_typ, creator, dest) # TODO, msg_uid used anywhere except logging
+    if isinstance(msgbytes, str):
+        msgbytes = msgbytes.encode()  # B/E headers are built as str
     databytes = msg_uid + b";" + msgbytes
     ackneeded = ack_needed(msg_typ)
     timesent = time_msec()
@@ -626,33 +713,40 @@ async def send_single_packet(msg_typ, creator, msgbytes, dest, retry_count = 3):
     ack_msg_recheck_count = 5 # number of times we are checking if ack received or not
     for retry_i in range(retry_count):
         radio_send(dest, databytes, msg_uid)
+        trysent = time_msec()
         await asyncio.sleep(ACK_SLEEP)
         first_log_flag = True
         for i in range(ack_msg_recheck_count): # ack_msk recheck
             at, missing_chunks = ack_time(msg_uid)
             if at > 0:
-                logger.info(f"[ACK] Msg {msg_uid} : was acked in {at - timesent} msecs")
-                msgs_sent.append(pop_and_get(msg_uid))
+                logger.info("[ACK] Msg %s : was acked in %s msecs", msg_uid, at - timesent)
+                tracer.ack(msg_uid, at - trysent, retry_i + 1)
+                link_stats.record_ack(dest, True)
+                acked = pop_and_get(msg_uid)
+                if acked is not None: # None once it was pushed out of the full unacked buffer
+                    msgs_sent.append(acked)
                 return (True, missing_chunks)
             else:
                 if first_log_flag:
-                    logger.info(f"[ACK] Still waiting for ack, MSG_UID =  {msg_uid} # {i}")
+                    logger.info("[ACK] Still waiting for ack, MSG_UID =  %s # %s", msg_uid, i)
                     first_log_flag = False
                 else:
-                    logger.debug(f"[ACK] Still waiting for ack, MSG_UID = {msg_uid} # {i}")
+                    logger.debug("[ACK] Still waiting for ack, MSG_UID = %s # %d", msg_uid, i)
                 await asyncio.sleep(
                     ACK_SLEEP * min(i + 1, 3)
                 )  # progressively more sleep, capped at 3x
-        logger.warning(f"[ACK] Failed to get ack, MSG_UID = {msg_uid}, retry # {retry_i+1}/{retry_count}")
-    logger.error(f"[LORA] Failed to send message, MSG_UID = {msg_uid}")
+        logger.warning("[ACK] Failed to get ack, MSG_UID = %s, retry # %s/%s", msg_uid, retry_i+1, retry_count)
+        link_stats.record_ack(dest, False)
+    logger.error("[LORA] Failed to send message, MSG_UID = %s", msg_uid)
+    tracer.ack(msg_uid, None, retry_count)
     return (False, [])
 
 def make_chunks(msg):
-    # Input: msg: bytes; Output: list of bytes chunks up to 200 bytes each
+    # Input: msg: bytes; Output: list of bytes chunks up to IMG_CHUNK_BYTES each
     chunks = []
-    while len(msg) > 200:
-        chunks.append(msg[0:200])
-        msg = msg[200:]
+    while len(msg) > IMG_CHUNK_BYTES:
+        chunks.append(msg[0:IMG_CHUNK_BYTES])
+        msg = msg[IMG_CHUNK_BYTES:]
     if len(msg) > 0:
         chunks.append(msg)
     return chunks
@@ -664,14 +758,19 @@ def encrypt_if_needed(msg_typ, msg):
     if msg_typ in ["H", "T"]:
         # Must be less than 117 bytes
         if len(msg) > 117:
-            logger.error(f"Message {msg} is lnger than 117 bytes, cant encrypt via RSA")
+            logger.error("Message %s is lnger than 117 bytes, cant encrypt via RSA", msg)
             return msg
         msgbytes = enc.encrypt_rsa(msg, encnode.get_pub_key())
-        logger.info(f"{msg_typ} : Len msg = {len(msg)}, len msgbytes = {len(msgbytes)}")
+        logger.info("%s : Len msg = %s, len msgbytes = %s", msg_typ, len(msg), len(msgbytes))
         return msgbytes
     if msg_typ == "P":
-        msgbytes = enc.encrypt_hybrid(msg, encnode.get_pub_key())
-        logger.debug(f"{msg_typ} : Len msg = {len(msg)}, len msgbytes = {len(msgbytes)}")
+        # encrypted copy of the whole image, raises membudget.OverBudget before building it
+        mem_budget.require(membudget.CRYPTO, msg_typ, len(msg) + 1024)
+        try:
+            msgbytes = enc.encrypt_hybrid(msg, encnode.get_pub_key())
+        finally:
+            mem_budget.release(membudget.CRYPTO, msg_typ)
+        logger.debug("%s : Len msg = %d, len msgbytes = %d", msg_typ, len(msg), len(msgbytes))
         return msgbytes
     return msg
 
@@ -682,14 +781,14 @@ async def send_msg_internal(msg_typ, creator, msgbytes, dest): # all messages ex
         return False
     # Input: msg_typ: str, creator: int, msgbytes: bytes, dest: int; Output: bool success indicator
     if len(msgbytes) < PACKET_PAYLOAD_LIMIT:
-        logger.info(f"[⋙ sending....] dest={dest}, msg_typ:{msg_typ}, len:{len(msgbytes)} bytes, single packet")
+        logger.info("[⋙ sending....] dest=%s, msg_typ:%s, len:%s bytes, single packet", dest, msg_typ, len(msgbytes))
         succ, _ = await send_single_packet(msg_typ, creator, msgbytes, dest)
         return succ
     else:
-        logger.warning(f"msgbtyes size exceeds the packet payload limit, {len(msgbytes)} bytes > {PACKET_PAYLOAD_LIMIT} bytes")
+        logger.warning("msgbtyes size exceeds the packet payload limit, %s bytes > %s bytes", len(msgbytes), PACKET_PAYLOAD_LIMIT)
         return False
         
-async def send_msg_big(msg_typ, creator, msgbytes, dest, epoch_ms): # image sending
+async def send_msg_big(msg_typ, creator, msgbytes, dest, epoch_ms, kind=IMG_KIND_FULL): # image sending
     if not is_lora_ready():
         return False
     if msg_typ == "P":
@@ -698,16 +797,21 @@ async def send_msg_big(msg_typ, creator, msgbytes, dest, epoch_ms): # image send
             asyncio.create_task(keep_transmode_lock(dest, img_id))
             # sending start
             chunks = make_chunks(msgbytes)
-            logger.info(f"[⋙ sending....] dest={dest}, msg_typ:{msg_typ}, len:{len(msgbytes)} bytes, img_id:{img_id}, image_payload in {len(chunks)} chunks")
-            big_succ, _ = await send_single_packet("B", creator, f"{img_id}:{epoch_ms}:{len(chunks)}", dest)
+            logger.info("[⋙ sending....] dest=%s, msg_typ:%s, len:%s bytes, img_id:%s, kind:%s, image_payload in %s chunks", dest, msg_typ, len(msgbytes), img_id, kind, len(chunks))
+            tracer.chunk(img_id, pkttrace.CHUNK_BEGIN, len(chunks))
+            begin = f"{img_id}:{epoch_ms}:{len(chunks)}"
+            if kind != IMG_KIND_FULL:
+                begin += f":{kind}" # a full image keeps the 3 field header older receivers parse
+            big_succ, _ = await send_single_packet("B", creator, begin, dest)
             if not big_succ:
-                logger.info(f"[CHUNK] Failed sending chunk begin")
+                tracer.chunk(img_id, pkttrace.CHUNK_FAILED, len(chunks))
+                logger.info("[CHUNK] Failed sending chunk begin")
                 delete_transmode_lock(dest, img_id)
                 return False
             
             for i in range(len(chunks)):
                 if i % 10 == 0:
-                    logger.info(f"[CHUNK] Sending chunk {i}")
+                    logger.info("[CHUNK] Sending chunk %s", i)
                 await asyncio.sleep(CHUNK_SLEEP)
                 chunkbytes = img_id.encode() + i.to_bytes(2) + chunks[i]
                 _ = await send_single_packet("I", creator, chunkbytes, dest)
@@ -718,7 +822,7 @@ async def send_msg_big(msg_typ, creator, msgbytes, dest, epoch_ms): # image send
                     await asyncio.sleep(CHUNK_SLEEP)
                 succ, missing_chunks = await send_single_packet("E", creator, f"{img_id}:{epoch_ms}", dest, retry_count = 10)
                 if not succ:
-                    logger.error(f"[CHUNK] Failed sending chunk end")
+                    logger.error("[CHUNK] Failed sending chunk end")
                     break
 
                 # Treat various ACK forms as success:
@@ -729,27 +833,31 @@ async def send_msg_big(msg_typ, creator, msgbytes, dest, epoch_ms): # image send
                     or len(missing_chunks) == 0
                     or (len(missing_chunks) == 1 and missing_chunks[0] == -1)
                 ):
-                    logger.info(f"[CHUNK] Successfully sent all chunks (missing_chunks={missing_chunks})")
+                    logger.info("[CHUNK] Successfully sent all chunks (missing_chunks=%s)", missing_chunks)
+                    tracer.chunk(img_id, pkttrace.CHUNK_DONE, len(chunks))
                     delete_transmode_lock(dest, img_id)
                     return True
 
                 logger.info(
                     f"[CHUNK] Receiver still missing {len(missing_chunks)} chunks after retry {retry_i}: {missing_chunks}"
                 )
+                tracer.chunk(img_id, pkttrace.CHUNK_MISSING, len(missing_chunks))
                 if not check_transmode_lock(dest, img_id): # check old logs is still in progress or not
-                    logger.error(f"TRANS MODE ended, marking data send as failed, timeout error")
+                    logger.error("TRANS MODE ended, marking data send as failed, timeout error")
+                    tracer.chunk(img_id, pkttrace.CHUNK_FAILED, len(chunks))
                     return False
                 for mis_chunk in missing_chunks:
                     await asyncio.sleep(CHUNK_SLEEP)
                     chunkbytes = img_id.encode() + mis_chunk.to_bytes(2) + chunks[mis_chunk]
                     _ = await send_single_packet("I", creator, chunkbytes, dest)
+            tracer.chunk(img_id, pkttrace.CHUNK_FAILED, len(chunks))
             delete_transmode_lock(dest, img_id)
             return False
         else: 
-            logger.warning(f"TRANS MODE already in use, could not get lock...")
+            logger.warning("TRANS MODE already in use, could not get lock...")
             return False
     else:
-        logger.warning(f"Invalid message type: {msg_typ}")
+        logger.warning("Invalid message type: %s", msg_typ)
         return False
 
 
@@ -772,20 +880,20 @@ def ack_time(msg_uid):
                         # Format: MID:missing_ids or MID:-1
                         missing_str = msgbytes[MIDLEN+1:].decode()
                         if missing_str != "-1":
-                            logger.info(f"[ACK] Checking for missing IDs in {missing_str}")
+                            logger.info("[ACK] Checking for missing IDs in %s", missing_str)
                             try:
                                 missingids = [int(i) for i in missing_str.split(',') if i]
                             except ValueError:
-                                logger.warning(f"[ACK] Failed to parse missing IDs: {missing_str}")
+                                logger.warning("[ACK] Failed to parse missing IDs: %s", missing_str)
                                 missingids = []
-                    logger.debug(f"[ACK] Matched ACK for {msg_uid}, missing chunks: {missingids}")
+                    logger.debug("[ACK] Matched ACK for %s, missing chunks: %s", msg_uid, missingids)
                     return (t, missingids)
                 # Try match with missing last byte (workaround for truncation issue)
                 elif len(msgbytes) == MIDLEN - 1 and msg_uid[:MIDLEN-1] == msgbytes:
-                    logger.debug(f"[ACK] Matched ACK for {msg_uid} with truncated payload (missing last byte)")
+                    logger.debug("[ACK] Matched ACK for %s with truncated payload (missing last byte)", msg_uid)
                     return (t, [])
             else:
-                logger.debug(f"[ACK] ACK payload too short: {len(msgbytes)} bytes, expected at least {MIDLEN-1}")
+                logger.debug("[ACK] ACK payload too short: %d bytes, expected at least %d", len(msgbytes), MIDLEN - 1)
     return (-1, None)
 
 
@@ -796,16 +904,39 @@ chunk_map = {} # chunk ID to (expected_chunks, [(iter, chunk_data)])
 # ---------------------------------------------------------------------------
 
 def begin_chunk(msg):
-    # Input: msg: str formatted as "<type>:<chunk_id>:<num_chunks>"; Output: None (initializes chunk tracking)
+    # Input: msg: str formatted as "<img_id>:<epoch_ms>:<num_chunks>[:<kind>]"; Output: tuple(img_id, epoch_ms, numchunks)
     parts = msg.split(":")
-    if len(parts) != 3:
+    if len(parts) not in (3, 4):
         logger.error(f"[CHUNK] begin message unparsable {msg}")
         return
     img_id = parts[0]
     epoch_ms = int(parts[1])
     numchunks = int(parts[2])
-    chunk_map[img_id] = ("B", numchunks, [])
+    kind = parts[3] if len(parts) == 4 else IMG_KIND_FULL # older nodes only send full images
+    need = 2 * numchunks * IMG_CHUNK_BYTES # chunks and the recompiled copy
+    if not mem_budget.fits(membudget.CHUNKS, need):
+        raise membudget.TooLarge(f"{membudget.CHUNKS} budget, {need} bytes for {img_id}")
+    if not mem_budget.reserve(membudget.CHUNKS, img_id, need):
+        drop_stale_chunks()
+        mem_budget.require(membudget.CHUNKS, img_id, need) # raises membudget.OverBudget
+    chunk_map[img_id] = (kind, numchunks, [])
     return (img_id, epoch_ms, numchunks)
+
+def drop_stale_chunks():
+    # Input: None; Output: None (drops incoming transfers that ended without "E", only one runs in TRANS MODE)
+    stale = [img_id for img_id in chunk_map if not (image_in_progress and img_id == data_id)]
+    for img_id in stale:
+        chunk_map.pop(img_id)
+        mem_budget.release(membudget.CHUNKS, img_id)
+    if stale:
+        logger.info("[MEM] dropped %s stale chunk transfers: %s", len(stale), stale)
+        gc_policy.request("stale chunks")
+
+def get_chunk_kind(img_id):
+    # Input: img_id: str chunk identifier; Output: str IMG_KIND_* announced in the begin message
+    if img_id in chunk_map:
+        return chunk_map[img_id][0]
+    return IMG_KIND_FULL
     
 
 def get_missing_chunks(img_id):
@@ -856,19 +987,19 @@ def recompile_msg(img_id):
     recompiled = b""
     for i in range(expected_chunks):
         recompiled += get_data_for_iter(list_chunks, i)
-    # Ignoring message type for now
     return recompiled
 
 def clear_chunkid(img_id):
     # Input: img_id: str chunk identifier; Output: None (removes chunk tracking entry)
     if img_id in chunk_map:
         entry = chunk_map.pop(img_id)
+        mem_budget.release(membudget.CHUNKS, img_id)
         # Explicitly delete chunk data to free memory
         if len(entry) > 2 and isinstance(entry[2], list):
             for _, chunk_data in entry[2]:
                 del chunk_data
         del entry
-        gc.collect()  # Help GC reclaim memory immediately
+        gc_policy.request("chunks") # collected at the next idle point, not while chunks arrive
     else:
         logger.warning(f"[CHUNK] couldn't find {img_id} in {chunk_map}")
 
@@ -924,7 +1055,7 @@ async def sim_upload_hb(heartbeat_data): # TODO will be replaced by sim_upload_p
         return False
 
     try:
-        result = cellular_system.upload_data(heartbeat_data, URL)
+        result = await cellular_system.upload_data_async(heartbeat_data, URL)
         if result and result.get('status_code') == 200:
             node_id = heartbeat_data["machine_id"]
             logger.info(f"[HB] Heartbeat from node {node_id} sent to cloud successfully")
@@ -939,31 +1070,50 @@ async def sim_upload_hb(heartbeat_data): # TODO will be replaced by sim_upload_p
         logger.error(f"[HB] error sending cellular heartbeat: {e}")
         return False
 
-async def upload_payload_to_server(payload, msg_typ, creator): # FINAL
-    # Input: heartbeat_data: dict payload; Output: bool indicating upload success
-    """Unified heartbeat upload: tries cellular first, falls back to WiFi"""
-    if not running_as_cc():
+def transport_ready(name):
+    # Input: name: str TRANSPORT_*; Output: bool True if the transport is set up (says nothing about its health)
+    if name == TRANSPORT_CELLULAR:
+        return cellular_system is not None
+    return wifi_nic is not None and wifi_nic.isconnected()
+
+async def probe_cellular():
+    # Input: None; Output: bool True if the modem answers and has its data connection
+    if not cellular_system:
         return False
+    return await cellular_system.probe_async()
 
-    if cellular_system:
-        result = await sim_upload_payload(payload, msg_typ, creator)
-        if result:
-            return True
-        logger.warning(f"msg_typ:{msg_typ} from node {creator} cellular upload failed, trying WiFi fallback...")
-    else:
-        logger.warning(f"msg_typ:{msg_typ} from node {creator} cellular system not initialized, trying WiFi fallback...")
+async def probe_wifi():
+    # Input: None; Output: bool True if WiFi is connected
+    return transport_ready(TRANSPORT_WIFI)
+
+transport_selector = transport_health.TransportSelector()
+transport_selector.add(TRANSPORT_CELLULAR, probe_cellular)
+transport_selector.add(TRANSPORT_WIFI, probe_wifi)
+
+async def upload_payload_to_server(payload, msg_typ, creator, on_response=None): # FINAL
+    # Input: payload: dict (or list of dicts for a batch); on_response: callable(dict) or None; Output: bool indicating upload success
+    """Unified upload: healthiest transport first (see transport_health.py), the other one as fallback"""
+    if not running_as_cc():
+        return False
 
-    if wifi_nic and wifi_nic.isconnected():
-        result = await wifi_upload_payload(payload, msg_typ, creator)
+    for name in transport_selector.order():
+        if not transport_ready(name):
+            logger.warning("msg_typ:%s from node %s %s not available, skipping", msg_typ, creator, name)
+            continue
+        upload_fn = sim_upload_payload if name == TRANSPORT_CELLULAR else wifi_upload_payload
+        start = time_msec()
+        result = await upload_fn(payload, msg_typ, creator, on_response)
+        transport_selector.record(name, result, time_msec() - start)
+        tracer.upload(pkttrace.UPLOAD_CELLULAR if name == TRANSPORT_CELLULAR else pkttrace.UPLOAD_WIFI, msg_typ, result, time_msec() - start)
         if result:
+            uplink_spool.kick()
             return True
-        logger.warning(f"msg_typ:{msg_typ} from node {creator} wifi upload failed, skipping upload...")
-    else:
-        logger.error(f"msg_typ:{msg_typ} from node {creator} wifi not connected, upload failed (cellular and WiFi both unavailable)")
+        logger.warning("msg_typ:%s from node %s %s upload failed, trying next transport...", msg_typ, creator, name)
 
+    logger.error("msg_typ:%s from node %s upload failed, no transport worked (%s)", msg_typ, creator, transport_selector.summary())
     return False
 
-async def sim_upload_payload(payload, msg_typ, creator): # FINAL
+async def sim_upload_payload(payload, msg_typ, creator, on_response=None): # FINAL
     # Input: payload_dict: dict payload; Output: bool indicating upload success
     """Send payload data via cellular (for command center)"""
     global cellular_system
@@ -971,9 +1121,10 @@ async def sim_upload_payload(payload, msg_typ, creator): # FINAL
         return False
 
     try:
-        result = cellular_system.upload_data(payload, URL)
+        result = await cellular_system.upload_data_async(payload, URL)
         if result and result.get('status_code') == 200:
             logger.info(f"msg_typ:{msg_typ} from node {creator} sent to cloud successfully")
+            handle_server_response(result.get('text'), on_response)
             return True
         else:
             logger.error(f"msg_typ:{msg_typ} from node {creator} failed to send to cloud via cellular")
@@ -985,7 +1136,7 @@ async def sim_upload_payload(payload, msg_typ, creator): # FINAL
         logger.error(f"msg_typ:{msg_typ} from node {creator} error sending to cloud via cellular: {e}")
         return False
 
-async def wifi_upload_payload(payload, msg_typ, creator): # FINAL
+async def wifi_upload_payload(payload, msg_typ, creator, on_response=None): # FINAL
     # Input: payload: dict payload; msg_typ: str, creator: int; Output: bool upload success
     """Send payload via WiFi"""
     global wifi_nic
@@ -1001,6 +1152,10 @@ async def wifi_upload_payload(payload, msg_typ, creator): # FINAL
                 response = requests.post(URL, data=json_payload, headers=headers)
                 if response.status_code == 200:
                     logger.info(f"msg_typ:{msg_typ} from node {creator} uploaded via WiFi successfully")
+                    try:
+                        handle_server_response(response.text, on_response)
+                    except Exception as e:
+                        logger.error("error reading server response: %s", e)
                     return True
                 else:
                     # logger.error(f"msg_typ:{msg_typ} from node {creator} upload failed: status {response.status_code}, response {str(response)}")
@@ -1028,20 +1183,191 @@ async def wifi_upload_payload(payload, msg_typ, creator): # FINAL
         logger.error(f"msg_typ:{msg_typ} from node {creator} error in wifi_upload_payload: {e}")
         return False
 
+async def http_post_to_server(url, body, content_type):
+    # Input: url: str, body: str or bytes, content_type: str; Output: tuple(status_code or None, response_text)
+    # Same transport choice as upload_payload_to_server
+    for name in transport_selector.order():
+        if name == TRANSPORT_CELLULAR and not (cellular_system and cellular_system.connected):
+            continue
+        if name == TRANSPORT_WIFI and not (transport_ready(name) and USE_REQUESTS):
+            continue
+        status, text = None, ""
+        start = time_msec()
+        try:
+            if name == TRANSPORT_CELLULAR:
+                status, text = await cellular_system.http_post(url, body, content_type)
+            else:
+                response = requests.post(url, data=body, headers={"Content-Type": content_type})
+                status = response.status_code
+                try:
+                    text = response.text
+                except Exception:
+                    text = ""
+        except Exception as e:
+            logger.error("[UPR] %s post failed: %s", name, e)
+        ok = status is not None and status < 500
+        transport_selector.record(name, ok, time_msec() - start)
+        if ok:
+            return status, text
+    return None, ""
+
+resumable_uploader = resumable_upload.ResumableUploader(UPLOAD_URL, http_post_to_server, sd_storage)
+
+async def upload_batch_to_server(payloads, on_response):
+    # Input: payloads: list of dict, on_response: callable(dict); Output: bool indicating upload success
+    return await upload_payload_to_server(payloads, "batch", my_addr, on_response)
+
+async def replay_spooled(records):
+    # Input: records: list of spool records, oldest first; Output: bool False stops the replay for now
+    if not transport_selector.order():
+        return False # every transport is marked down, images would only go round back into the spool
+    spooled = [r for r in records if r.get("m") != "image"]
+    payloads = [r["p"] for r in spooled]
+    if payloads:
+        if UPLINK_BATCHING:
+            results = []
+            def on_response(resp):
+                r = resp.get("results")
+                if isinstance(r, list):
+                    results.extend(r)
+            if not await upload_batch_to_server(payloads, on_response):
+                return False
+            for i in range(len(spooled)):
+                item_ok, err = uplink.item_result(results, i)
+                if not item_ok:
+                    # counted as replayed by the spool otherwise, and deleted with its segment
+                    logger.warning("[SPOOL] server rejected spooled msg_typ:%s from node %s: %s, spooled again", spooled[i].get("m"), spooled[i].get("c"), err)
+                    uplink_spool.put_back(spooled[i])
+        else:
+            for p in payloads:
+                if not await upload_payload_to_server(p, p.get("message_type"), p.get("machine_id")):
+                    return False
+    for r in records:
+        if r.get("m") != "image":
+            continue
+        if not file_exists(r["f"]):
+            logger.warning("[SPOOL] spooled image %s is gone, skipping", r['f'])
+            continue
+        queue_img_to_send(r["c"], r["e"], r["f"], r.get("k", IMG_KIND_FULL))
+    return True
+
+def spool_payload(payload, msg_typ, creator):
+    # Input: payload: dict, msg_typ: str, creator: int; Output: None (payload given up by the uplink, keep it on SD)
+    if UPLINK_SPOOL:
+        uplink_spool.add_payload(payload, msg_typ, creator)
+    else:
+        logger.error("msg_typ:%s from node %s could not be uploaded, dropped", msg_typ, creator)
+
+uplink_spool = spool.UplinkSpool(sd_storage, replay_spooled, SPOOL_DIR,
+                                 replay_batch=uplink.UPLINK_MAX_ITEMS if UPLINK_BATCHING else 1)
+uplink_batcher = uplink.UplinkBatcher(upload_batch_to_server, on_drop=spool_payload)
+
+async def uplink_payload(payload, msg_typ, creator):
+    # Input: payload: dict, msg_typ: str, creator: int; Output: bool (True once queued when batching)
+    # Heartbeats and event texts go through the batcher, images are uploaded on their own
+    if UPLINK_BATCHING:
+        uplink_batcher.submit(payload, msg_typ, creator)
+        return True
+    ok = await upload_payload_to_server(payload, msg_typ, creator)
+    if not ok:
+        spool_payload(payload, msg_typ, creator)
+    return ok
+
 # ---------------------------------------------------------------------------
 # Message Handlers
 # ---------------------------------------------------------------------------
 
 hb_map = {}
 
+hb_bundle_pending = []      # [(creator, msgbytes)] heartbeats waiting to go upstream in one bundle
+hb_bundle_timer = False     # a flush after HB_BUNDLE_WINDOW_SEC is scheduled
+hb_bundle_sending = False
+
+def queue_hb_for_bundle(creator, msgbytes):
+    # Input: creator: int, msgbytes: bytes heartbeat as sent by its creator; Output: None
+    hb_bundle_pending.append((creator, msgbytes))
+    while len(hb_bundle_pending) > HB_BUNDLE_MAX_PENDING:
+        dropped = hb_bundle_pending.pop(0)
+        logger.warning("[HB] bundle queue full, dropped heartbeat of node %s", dropped[0])
+    if len(hb_bundle_pending) >= HB_BUNDLE_MAX:
+        asyncio.create_task(flush_hb_bundle())
+    else:
+        arm_hb_bundle_timer()
+
+def arm_hb_bundle_timer():
+    # Input: None; Output: None (flushes the bundle HB_BUNDLE_WINDOW_SEC from now, unless already scheduled)
+    global hb_bundle_timer
+    if hb_bundle_timer:
+        return
+    hb_bundle_timer = True
+    async def flush_later():
+        global hb_bundle_timer
+        await asyncio.sleep(HB_BUNDLE_WINDOW_SEC)
+        hb_bundle_timer = False
+        await flush_hb_bundle()
+    asyncio.create_task(flush_later())
+
+async def flush_hb_bundle():
+    # Input: None; Output: bool True if the waiting heartbeats went to the next hop
+    global hb_bundle_pending, hb_bundle_sending
+    if hb_bundle_sending or not hb_bundle_pending:
+        return False
+    next_dst = next_device_in_spath()
+    if not next_dst:
+        logger.error("[HB] can't forward %s heartbeats because I dont have next device in spath yet", len(hb_bundle_pending))
+        return False
+    hb_bundle_sending = True
+    items = hb_bundle_pending[:HB_BUNDLE_MAX]
+    hb_bundle_pending = hb_bundle_pending[len(items):]
+    # a bundle needs TRANS MODE at both ends, during an image transfer it would wait for minutes
+    use_bundle = len(items) >= HB_BUNDLE_MIN and not image_in_progress and not is_device_busy(next_dst)
+    try:
+        if use_bundle:
+            bundle = hb_codec.pack_bundle(items)
+            logger.info("[HB] Propogating %s heartbeats of %s to %s in one bundle, %s bytes", len(items), [c for c, _ in items], next_dst, len(bundle))
+            if await send_msg_big("P", my_addr, bundle, next_dst, get_epoch_ms(), IMG_KIND_HB_BUNDLE):
+                items = []
+        else:
+            while items:
+                creator, msgbytes = items[0]
+                logger.info("[HB] Propogating H of %s to %s", creator, next_dst)
+                if not await send_msg("H", creator, msgbytes, next_dst):
+                    break
+                items.pop(0)
+    except Exception as e:
+        logger.error("[HB] error sending heartbeat bundle: %s", e)
+    sent_succ = not items
+    hb_bundle_sending = False
+    if not sent_succ:
+        logger.error("[HB] forwarding %s heartbeats to %s failed, keeping them for the next bundle", len(items), next_dst)
+        hb_bundle_pending = items + hb_bundle_pending
+        del hb_bundle_pending[:-HB_BUNDLE_MAX_PENDING]
+    if hb_bundle_pending:
+        arm_hb_bundle_timer()
+    return sent_succ
+
+async def hb_bundle_process(bundle):
+    # Input: bundle: bytes from a "g" chunked transfer; Output: None (each heartbeat handled as if it came in as "H")
+    try:
+        items = hb_codec.unpack_bundle(bundle)
+    except ValueError as e:
+        logger.error("[HB] bad heartbeat bundle: %s", e)
+        return
+    logger.info("[HB] Got bundle of %s heartbeats from %s", len(items), [c for c, _ in items])
+    for creator, msgbytes in items:
+        await heartbeat_received(creator, msgbytes)
+
 async def hb_process(msg_uid, msgbytes, sender):
     # Input: msg_uid: bytes, msgbytes: bytes, sender: int; Output: None (routes or logs heartbeat data)
-    creator = int(msg_uid[1])
+    await heartbeat_received(int(msg_uid[1]), msgbytes)
+
+async def heartbeat_received(creator, msgbytes):
+    # Input: creator: int, msgbytes: bytes heartbeat as sent by its creator; Output: None
     if running_as_cc():
         if creator not in hb_map:
             hb_map[creator] = 0
         hb_map[creator] += 1
-        logger.info(f"[HB] HB Counts = {hb_map}")
+        logger.info("[HB] HB Counts = %s", hb_map)
 
         # Send raw heartbeat data (encrypted or not) to cloud
         # Convert bytes to base64 for JSON transmission, same as image data
@@ -1058,23 +1384,24 @@ async def hb_process(msg_uid, msgbytes, sender):
             "epoch_ms": epoch_ms # TODO later with actual id
         }
 
-        logger.info(f"[HB] Sending raw heartbeat data of length {len(msgbytes)} bytes")
-        asyncio.create_task(upload_payload_to_server(heartbeat_payload, "heartbeat", creator))
-        if ENCRYPTION_ENABLED:
-            logger.debug(f"[HB] HB send msg = {enc.decrypt_rsa(msgbytes, encnode.get_prv_key(creator))}")
-        else:
-            logger.debug(f"[HB] HB send msg = {msgbytes.decode()}")
+        logger.info("[HB] Sending raw heartbeat data of length %s bytes", len(msgbytes))
+        asyncio.create_task(uplink_payload(heartbeat_payload, "heartbeat", creator))
+        if logger.is_enabled("DEBUG"):
+            hbmsg = enc.decrypt_rsa(msgbytes, encnode.get_prv_key(creator)) if ENCRYPTION_ENABLED else msgbytes
+            logger.debug("[HB] HB send msg = %s", hb_codec.decode(hbmsg) if hb_codec.is_binary(hbmsg) else hbmsg.decode())
         return
+    elif HB_BUNDLING:
+        queue_hb_for_bundle(creator, msgbytes)
     else:
         next_dst = next_device_in_spath()
         if next_dst:
             sent_succ = False
-            logger.info(f"[HB] Propogating H to {next_dst}")
+            logger.info("[HB] Propogating H to %s", next_dst)
             sent_succ = await send_msg("H", creator, msgbytes, next_dst)
             if not sent_succ:
-                logger.error(f"[HB] forwarding HB to {next_dst} failed")
+                logger.error("[HB] forwarding HB to %s failed", next_dst)
         else:
-            logger.error(f"[HB] can't forward HB because I dont have next device in spath yet")
+            logger.error("[HB] can't forward HB because I dont have next device in spath yet")
 
 images_saved_at_cc = []
 
@@ -1093,7 +1420,7 @@ async def event_text_process(creator, msgbytes):
             "epoch_ms": epoch_ms # TODO not actual
         }
         logger.info(f"[TXT] Sending event text data of length {len(msgbytes)} bytes")
-        asyncio.create_task(upload_payload_to_server(event_payload, "event_text", creator))
+        asyncio.create_task(uplink_payload(event_payload, "event_text", creator))
         return
     else:
         next_dst = next_device_in_spath()
@@ -1106,11 +1433,65 @@ async def event_text_process(creator, msgbytes):
         else:
             logger.error(f"[TXT] can't forward event text because I dont have next device in spath yet")
       
+downstream_routes = {} # creator -> neighbour we last heard its messages from
+
+async def full_frame_request_process(requester, msg):
+    # Input: requester: int node asking for the image, msg: str "<creator>:<epoch_ms>"; Output: None
+    # Queue the full frame if it is mine, otherwise pass the request on towards its creator
+    try:
+        parts = msg.split(":")
+        creator = int(parts[0])
+        epoch_ms = int(parts[1])
+    except Exception as e:
+        logger.error("[FULL] full frame request unparsable %s: %s", msg, e)
+        return
+    if creator == my_addr:
+        full_filepath = img_filepath(my_addr, epoch_ms, IMG_KIND_FULL)
+        if not file_exists(full_filepath):
+            # the capture fitted the budget, the image that was sent is the full frame
+            logger.warning("[FULL] no full frame %s for request from %s", full_filepath, requester)
+            return
+        logger.info("[FULL] full frame %s requested by %s, adding to send queue", full_filepath, requester)
+        queue_img_to_send(my_addr, epoch_ms, full_filepath, IMG_KIND_FULL)
+        return
+    next_hop = downstream_routes.get(creator)
+    if next_hop is None:
+        logger.error("[FULL] no route to %s, can't forward full frame request %s", creator, msg)
+        return
+    logger.info("[FULL] forwarding full frame request %s to %s", msg, next_hop)
+    sent_succ = await send_msg("F", requester, msg.encode(), next_hop)
+    if not sent_succ:
+        logger.error("[FULL] forwarding full frame request to %s failed", next_hop)
+
+async def request_full_frame(creator, epoch_ms):
+    # Input: creator: int, epoch_ms: int; Output: None (CC asks a unit for a full frame it sent a preview of)
+    await full_frame_request_process(my_addr, f"{creator}:{epoch_ms}")
+
+def handle_server_response(text, on_response=None):
+    # Input: text: str response body of an upload, on_response: callable(dict) or None; Output: None
+    # The server can ask for full frames: {"full_frame_requests": [{"machine_id": 221, "epoch_ms": 1735689600000}]}
+    if not text:
+        return
+    try:
+        resp = json.loads(text)
+    except ValueError:
+        return
+    if not isinstance(resp, dict):
+        return
+    if on_response:
+        on_response(resp)
+    for req in resp.get("full_frame_requests", []):
+        try:
+            asyncio.create_task(request_full_frame(int(req["machine_id"]), int(req["epoch_ms"])))
+        except Exception as e:
+            logger.error("[FULL] bad full frame request from server %s: %s", req, e)
+
 # ---------------------------------------------------------------------------
 # Sensor Capture and Image Transmission
 # ---------------------------------------------------------------------------
 
 imgpaths_to_send = [] # {creator, epoch_ms, enc_filepath}
+motion_roi = transfer_budget.MotionROI()
 events_to_send = [] # {creator, epoch_ms}
 detector = detect.Detector()
 
@@ -1136,6 +1517,40 @@ def pir_interrupt_handler(pin):
         pir_trigger_event.set()
         # logger.info(f"[PIR] Motion detected (interrupt)")
 
+def queue_img_to_send(creator, epoch_ms, enc_filepath, kind=IMG_KIND_FULL):
+    # Input: creator: int, epoch_ms: int, enc_filepath: str, kind: str IMG_KIND_*; Output: None
+    for entry in imgpaths_to_send:
+        if entry["enc_filepath"] == enc_filepath:
+            logger.info("[IMG] %s is already queued", enc_filepath)
+            return
+    imgpaths_to_send.append({"creator": creator, "epoch_ms": epoch_ms, "enc_filepath": enc_filepath, "kind": kind})
+    # Limit queue size to prevent memory overflow
+    if len(imgpaths_to_send) >= MAX_IMAGES_TO_SEND:
+        # Remove oldest entry
+        oldest = imgpaths_to_send.pop(0)
+        logger.info("[PIR] Queue full, removing oldest image: %s", oldest['enc_filepath'])
+
+def on_img_saved(creator, epoch_ms, enc_filepath, kind=IMG_KIND_FULL):
+    # Input: creator: int, epoch_ms: int, enc_filepath: str, kind: str; Output: callback(ok) for sd_storage.submit
+    # Image is only queued for sending once it is on the SD card
+    def done(ok):
+        if ok:
+            logger.info("[FS] Saved encrypted image: %s", enc_filepath)
+            queue_img_to_send(creator, epoch_ms, enc_filepath, kind)
+        else:
+            logger.error("[FS] encrypted image %s not saved, not sending", enc_filepath)
+    return done
+
+def on_event_saved(creator, epoch_ms, event_filepath):
+    # Input: creator: int, epoch_ms: int, event_filepath: str; Output: callback(ok) for sd_storage.submit
+    def done(ok):
+        if ok:
+            logger.info("[FS] Saved event file: %s", event_filepath)
+        else:
+            logger.error("[FS] Failed to save event file %s", event_filepath)
+        events_to_send.append({"creator": creator, "epoch_ms": epoch_ms})
+    return done
+
 async def person_detection_loop():
     # Input: None; Output: None (runs on PIR interrupt, updates counters and queue)
     global person_image_count, total_image_count, center_captured_image_count
@@ -1189,6 +1604,8 @@ async def person_detection_loop():
 
         # Motion detected - capture image
         img = None
+        full_jpg = None
+        send_jpg = None
         try:
             led.on()
             event_epoch_ms = get_epoch_ms() # epoch milisecond for event
@@ -1199,66 +1616,64 @@ async def person_detection_loop():
             # Track center's own captured images separately
             if running_as_cc():
                 center_captured_image_count += 1
-            # imgbytes = img.bytearray() # this was bigger # TODO
-            # logger.info(f"[OLD] Captured image, size: {len(imgbytes)} bytes")
-            
-            try:
-                raw_path = f"{MY_IMAGE_DIR}/{my_addr}_{event_epoch_ms}_raw.jpg"
-                logger.debug(f"Saving raw image to {raw_path} : imbytesize = {len(img.bytearray())}")
-                async with lock:
-                    img.save(raw_path)
-                    os.sync()  # Force filesystem sync to SD card
-                    utime.sleep_ms(500)
-                logger.info(f"Saved raw image: {raw_path}: raw size = {len(img.bytearray())} bytes")
-            except Exception as e:
-                logger.warning(f"[PIR] Failed to save raw image: {e}")
-                continue
-            
-            # read raw file
+
+            roi = motion_roi.update(img) # needs the uncompressed frame
+
+            # Compress to jpeg in memory, no SD round trip
             try:
-                img = image.Image(raw_path)
-                imgbytes = img.bytearray() # updated 
-                logger.info(f"[PIR] Captured image, size: {len(imgbytes)} bytes")
+                full_jpg = img.to_jpeg(quality=JPEG_QUALITY, copy=True)
+                imgbytes = full_jpg.bytearray()
+                logger.info("[PIR] Captured image, jpeg size: %s bytes (quality=%s)", len(imgbytes), JPEG_QUALITY)
             except Exception as e:
-                logger.error(f"[PIR] Failed read image file: {e}")
+                logger.error("[PIR] Failed to compress image: %s", e)
                 continue
-                
-            # Encrypt image immediately
+
+            if SAVE_RAW_IMAGE:
+                raw_path = f"{MY_IMAGE_DIR}/{my_addr}_{event_epoch_ms}_raw.jpg"
+                sd_storage.submit(raw_path, imgbytes, "wb")
+
+            # Fit the image into the LoRa transfer budget of the next hop (and the preview size
+            # with TWO_TIER_IMAGES), CC uploads the full image
+            send_jpg = full_jpg
+            if not running_as_cc():
+                try:
+                    budget = transfer_budget.chunk_budget(link_stats.quality(next_device_in_spath()), len(imgpaths_to_send))
+                    if TWO_TIER_IMAGES:
+                        budget = min(budget, PREVIEW_MAX_CHUNKS)
+                    if len(imgbytes) > transfer_budget.max_bytes_for_chunks(budget):
+                        send_jpg, desc = transfer_budget.fit_to_budget(img, budget, roi)
+                        logger.info("[BUDGET] %s bytes is over budget of %s chunks, sending %s", len(imgbytes), budget, desc)
+                except Exception as e:
+                    logger.error("[BUDGET] failed to reduce image, sending full image: %s", e)
+                    send_jpg = full_jpg
+            img_kind = IMG_KIND_FULL if send_jpg is full_jpg else IMG_KIND_PREVIEW
+
+            # Encrypt image immediately, written to SD by the write-behind task
             try:
-                enc_msgbytes = encrypt_if_needed("P", imgbytes)
+                if img_kind == IMG_KIND_PREVIEW:
+                    # full resolution image stays on SD until it is requested with "F"
+                    full_filepath = f"{MY_IMAGE_DIR}/{my_addr}_{event_epoch_ms}_full.enc"
+                    try:
+                        sd_storage.submit(full_filepath, encrypt_if_needed("P", imgbytes), "wb")
+                    except membudget.OverBudget as e:
+                        # the preview is still worth sending, only "F" for this event will fail
+                        logger.warning("[PIR] no memory to encrypt the full frame, keeping the preview only: %s", e)
+                enc_msgbytes = encrypt_if_needed("P", send_jpg.bytearray())
                 enc_filepath = f"{MY_IMAGE_DIR}/{my_addr}_{event_epoch_ms}.enc"
-                logger.debug(f"[PIR] Saving encrypted image to {enc_filepath} : encrypted size = {len(enc_msgbytes)} bytes...")
-                # Save encrypted bytes to binary file
-                async with lock:
-                    with open(enc_filepath, "wb") as f:
-                        f.write(enc_msgbytes)
-                    os.sync()  # Force filesystem sync to SD card
-                    utime.sleep_ms(500)
-                logger.info(f"[PIR] Saved encrypted image: {enc_filepath}: encrypted size = {len(enc_msgbytes)} bytes")
+                logger.debug("[PIR] Queueing encrypted image %s : encrypted size = %s bytes...", enc_filepath, len(enc_msgbytes))
+                sd_storage.submit(enc_filepath, enc_msgbytes, "wb",
+                                  on_img_saved(my_addr, event_epoch_ms, enc_filepath, img_kind))
             except Exception as e:
                 logger.error(f"[PIR] Failed to save encrypted image: {e}")
                 continue
             led.off()
-            imgpaths_to_send.append({"creator": my_addr, "epoch_ms": event_epoch_ms, "enc_filepath": enc_filepath})
 
-            # Limit queue size to prevent memory overflow
-            if len(imgpaths_to_send) >= MAX_IMAGES_TO_SEND:
-                # Remove oldest entry
-                oldest = imgpaths_to_send.pop(0)
-                logger.info(f"[PIR] Queue full, removing oldest image: {oldest['enc_filepath']}")
-                
             # Save JSON file for the event
             event_filepath = f"{MY_EVENT_DIR}/{event_epoch_ms}.json"
-            try:
-                event_data = {"epoch_ms": event_epoch_ms}
-                with open(event_filepath, "w") as f:
-                    f.write(json.dumps(event_data))
-                os.sync()  # Force filesystem sync to SD card
-                utime.sleep_ms(500)
-                logger.info(f"[PIR] Saved event file: {event_filepath}")
-            except Exception as e:
-                logger.error(f"[PIR] Failed to save event file {event_filepath}: {e}")
-            events_to_send.append({"creator": my_addr, "epoch_ms": event_epoch_ms})
+            event_data = {"epoch_ms": event_epoch_ms}
+            sd_storage.submit(event_filepath, json.dumps(event_data), "w",
+                              on_event_saved(my_addr, event_epoch_ms, event_filepath))
+            sd_storage.end_batch() # one sync for encrypted image, event file (and raw image)
             
             # logger.info(f"Saved image: {raw_path}")
             # logger.info(f"Person detected Image count: {person_image_count}")
@@ -1268,12 +1683,14 @@ async def person_detection_loop():
             logger.error(f"[PIR] unexpected error in image taking and saving: {e}")
         finally:
             # Explicitly clean up image object
+            full_jpg = None
+            send_jpg = None
             if img is not None:
                 del img
-                gc.collect()  # Help GC reclaim memory immediately
+                gc_policy.request("capture")
 
 
-async def send_img_to_nxt_dst(creator, epoch_ms, enc_msgbytes):
+async def send_img_to_nxt_dst(creator, epoch_ms, enc_msgbytes, kind=IMG_KIND_FULL):
     # Input: enc_msgbytes: bytes already encrypted image; 
     # Output: bool indicating if image was forwarded successfully to next_node of spath
     logger.info(f"[IMG] Sending image of creator={creator}, size={len(enc_msgbytes)} bytes, to the network")
@@ -1283,7 +1700,7 @@ async def send_img_to_nxt_dst(creator, epoch_ms, enc_msgbytes):
             if is_device_busy(next_dst):
                 logger.warning(f"[IMG] Device {next_dst} is busy, skipping send")
                 return False
-            sent_succ = await send_msg_big("P", creator, enc_msgbytes, next_dst, epoch_ms)
+            sent_succ = await send_msg_big("P", creator, enc_msgbytes, next_dst, epoch_ms, kind)
             if sent_succ:
                 return True
             else:
@@ -1296,6 +1713,14 @@ async def send_img_to_nxt_dst(creator, epoch_ms, enc_msgbytes):
         logger.error(f"[IMG] unexpected error sending image to next device: {e}")
         return False
 
+def requeue_failed_upload(img_entry):
+    # Input: img_entry: dict from imgpaths_to_send; Output: None
+    # At the CC the image goes to the SD spool and comes back once the uplink works again
+    if UPLINK_SPOOL:
+        uplink_spool.add_image(img_entry["creator"], img_entry["epoch_ms"], img_entry["enc_filepath"], img_entry.get("kind", IMG_KIND_FULL))
+    else:
+        imgpaths_to_send.append(img_entry) # pushed to back of queue
+
 async def image_sending_loop():
     # Input: None; Output: None (periodically sends queued images across mesh)
     global imgpaths_to_send
@@ -1326,12 +1751,41 @@ async def image_sending_loop():
             enc_filepath = img_entry["enc_filepath"]
             creator = img_entry["creator"]
             epoch_ms = img_entry["epoch_ms"]
+            kind = img_entry.get("kind", IMG_KIND_FULL)
             
             logger.debug(f"[IMG] Processing: {enc_filepath}")
             enc_msgbytes = None
             try:
+                if running_as_cc() and RESUMABLE_UPLOAD:
+                    # streamed from SD in binary parts, no base64 and no whole image in RAM
+                    transmission_start = time_msec()
+                    sent_succ = await resumable_uploader.upload_file(enc_filepath, creator, epoch_ms, IMG_KIND_NAMES.get(kind, "full"))
+                    if sent_succ is not None:
+                        tracer.upload(pkttrace.UPLOAD_RESUMABLE, "event", sent_succ, time_msec() - transmission_start)
+                    if sent_succ is False:
+                        requeue_failed_upload(img_entry) # resumes where it stopped
+                        logger.warning("[IMG] resumable upload failed, image of creator=%s, re-queued: %s", creator, enc_filepath)
+                        break
+                    if sent_succ:
+                        transmission_time = time_msec() - transmission_start
+                        logger.info("[IMG] ✔✔✔ Image upload completed in %s ms (%.4f seconds), file:%s_%s", transmission_time, transmission_time/1000, creator, epoch_ms)
+                        if len(imgpaths_to_send) > 0:
+                            await asyncio.sleep(PHOTO_SENDING_TRY_INTERVAL)
+                        continue
+                    # None: server has no resumable endpoint, single JSON upload below
+
                 # Read encrypted bytes directly from file
                 try:
+                    # the file and its chunks / base64 copy
+                    need = 2 * os.stat(enc_filepath)[6]
+                    if not mem_budget.fits(membudget.CHUNKS, need):
+                        # would be re-queued forever, the file stays on SD
+                        logger.error("[IMG] %s too large to send (%s bytes), dropped from queue", enc_filepath, need // 2)
+                        continue
+                    if not mem_budget.reserve(membudget.CHUNKS, enc_filepath, need):
+                        imgpaths_to_send.append(img_entry) # pushed to back of queue
+                        logger.warning("[IMG] no memory to send %s now, re-queued", enc_filepath)
+                        break
                     logger.debug(f"[IMG] Reading encrypted image of creator: {creator}, file: {enc_filepath}")
                     with open(enc_filepath, "rb") as f:
                         enc_msgbytes = f.read()
@@ -1350,16 +1804,17 @@ async def image_sending_loop():
                         "machine_id": creator,
                         "message_type": "event",
                         "image": imgbytes, # enc_msgbytes
+                        "image_kind": IMG_KIND_NAMES.get(kind, "full"),
                         "epoch_ms": epoch_ms,
                     }
                     sent_succ = await upload_payload_to_server(img_payload, "event", creator)
                     if not sent_succ:
-                        imgpaths_to_send.append(img_entry) # pushed to back of queue
+                        requeue_failed_upload(img_entry)
                         logger.warning(f"[IMG] upload_payload to server failed, image of creator={creator}, re-queued: {enc_filepath}")
                         break
                 else:
                     logger.info(f"[IMG] ⋙⋙⋙ sending encrypted image to {next_dst}, file:{enc_filepath}")
-                    sent_succ = await send_img_to_nxt_dst(creator, epoch_ms, enc_msgbytes)
+                    sent_succ = await send_img_to_nxt_dst(creator, epoch_ms, enc_msgbytes, kind)
                     if not sent_succ:
                         imgpaths_to_send.append(img_entry) # pushed to back of queue
                         logger.error(f"[IMG] sending image failed, re-queued: {enc_filepath}")
@@ -1386,6 +1841,7 @@ async def image_sending_loop():
                 imgpaths_to_send.append(img_entry) # TODO check this logic later
                 break
             finally:
+                mem_budget.release(membudget.CHUNKS, enc_filepath)
                 # Explicitly clean up encrypted bytes
                 # Variables are initialized before try block, so they should always exist
                 # Use try-except for safety in case of unusual scoping issues
@@ -1401,8 +1857,8 @@ async def image_sending_loop():
                     pass 
                 except:
                     pass
-                # Help GC reclaim memory
-                gc.collect()
+                # Help GC reclaim memory, between two images
+                gc_policy.request("image sent")
 
         # After processing all queued images (or queue is empty), wait longer before checking again
         # Only use long delay if queue is empty to avoid missing new images
@@ -1470,82 +1926,82 @@ def scan_process(msg_uid, msg):
     # Input: msg_uid: bytes, msg: bytes containing node address; Output: None (updates seen neighbours)
     nodeaddr = int.from_bytes(msg)
     if nodeaddr not in seen_neighbours:
-        logger.info(f"adding nodeaddr {nodeaddr} to seen_neighbours")
+        logger.info("adding nodeaddr %s to seen_neighbours", nodeaddr)
         seen_neighbours.append(nodeaddr)
 
 async def sync_and_transfer_spath(msg_uid, msg):
     # Input: msg_uid: bytes, msg: str shortest-path data; Output: None (updates shortest_path_to_cc and propagates)
     global shortest_path_to_cc
     if running_as_cc():
-        logger.debug(f"Ignoring shortest path since I am cc")
+        logger.debug("Ignoring shortest path since I am cc")
         return
     if len(msg) == 0:
-        logger.error(f"empty spath_received message received")
+        logger.error("empty spath_received message received")
         return
     spath_received = [int(x) for x in msg.split(",")]
     if my_addr in spath_received:
-        logger.debug(f"[cyclic, ignoring {my_addr} already in {spath_received}")
+        logger.debug("[cyclic, ignoring %s already in %s", my_addr, spath_received)
         return
     
     if len(shortest_path_to_cc) == 0:
         if len(seen_neighbours)>0:
-            logger.debug(f"spath_recived for first time, saving and forwarding:{spath_received}")
+            logger.debug("spath_recived for first time, saving and forwarding:%s", spath_received)
         else:
-            logger.debug(f"spath_recived for first time, saving:{spath_received}, but no 'seen_neighbour'")
+            logger.debug("spath_recived for first time, saving:%s, but no 'seen_neighbour'", spath_received)
         if DYNAMIC_SPATH:
             shortest_path_to_cc = spath_received
         for n in seen_neighbours:
             new_spath = [my_addr] + shortest_path_to_cc
             new_spath_msg = ",".join([str(x) for x in new_spath])
-            logger.debug(f"propogating new_spath:{new_spath_msg}, to dst:{n}")
+            logger.debug("propogating new_spath:%s, to dst:%s", new_spath_msg, n)
             asyncio.create_task(send_msg("S", int(msg_uid[1]), new_spath_msg.encode(), n))
         
     elif len(shortest_path_to_cc) > len(spath_received):
         if len(seen_neighbours)>0:
-            logger.debug(f"smaller spath received, so updating and forwarding:{spath_received}")
+            logger.debug("smaller spath received, so updating and forwarding:%s", spath_received)
         else:
-            logger.debug(f"smaller spath received, so saving:{spath_received}, but no 'seen_neighbour'")
+            logger.debug("smaller spath received, so saving:%s, but no 'seen_neighbour'", spath_received)
         if DYNAMIC_SPATH:
             shortest_path_to_cc = spath_received
         for n in seen_neighbours:
             new_spath = [my_addr] + shortest_path_to_cc
             new_spath_msg = ",".join([str(x) for x in new_spath])
-            logger.debug(f"propogating new_spath:{new_spath_msg}, to dst:{n}")
+            logger.debug("propogating new_spath:%s, to dst:%s", new_spath_msg, n)
             asyncio.create_task(send_msg("S", int(msg_uid[1]), new_spath_msg.encode(), n))
     elif len(shortest_path_to_cc) == len(spath_received):
         if len(seen_neighbours)>0:
-            logger.debug(f"equal spath received, so updating and forwarding: {spath_received}")
+            logger.debug("equal spath received, so updating and forwarding: %s", spath_received)
         else:
-            logger.debug(f"equal spath received, so updating: {spath_received}, but no 'seen_neighbour'")
+            logger.debug("equal spath received, so updating: %s, but no 'seen_neighbour'", spath_received)
         if DYNAMIC_SPATH:
             shortest_path_to_cc = spath_received
         for n in seen_neighbours:
             new_spath = [my_addr] + shortest_path_to_cc
             new_spath_msg = ",".join([str(x) for x in new_spath])
-            logger.debug(f"propogating new_spath:{new_spath_msg}, to dst:{n}")
+            logger.debug("propogating new_spath:%s, to dst:%s", new_spath_msg, n)
             asyncio.create_task(send_msg("S", int(msg_uid[1]), new_spath_msg.encode(), n))
     else:
-        logger.info(f"larger spath received, so ignoring it: {spath_received}")
+        logger.info("larger spath received, so ignoring it: %s", spath_received)
 
 def process_message(data, rssi=None):
     # Input: data: bytes raw LoRa payload; rssi: int or None RSSI value in dBm; Output: bool indicating if message was processed
         
     parsed = parse_header(data)
     if not parsed:
-        logger.error(f"[LORA] failure parsing incoming data : {data}")
+        logger.error("[LORA] failure parsing incoming data : %s", data)
         return False
     if random.randint(1,100) <= FLAKINESS:
-        logger.warning(f"[LORA] flakiness dropping {data}")
+        logger.warning("[LORA] flakiness dropping %s", data)
         return True
 
     msg_uid, msg_typ, creator, sender, receiver, msg = parsed
     if receiver != -1 and my_addr != receiver:
-        logger.debug(f"[LORA] skipping message as it is for dst:{receiver}, not for me (my_addr:{my_addr}), msg_uid:{msg_uid}")
+        logger.debug("[LORA] skipping message as it is for dst:%s, not for me (my_addr:%s), msg_uid:%s", receiver, my_addr, msg_uid)
         return
 
     if DYNAMIC_SPATH:
         if not flayout.is_neighbour(sender, my_addr):
-            logger.warning(f"[LORA/FAKE LAYOUT] receiving something which is beyond my range so dropping this packet {sender} : {parsed}")
+            logger.warning("[LORA/FAKE LAYOUT] receiving something which is beyond my range so dropping this packet %s : %s", sender, parsed)
             return True
 
     recv_log = ""
@@ -1555,16 +2011,20 @@ def process_message(data, rssi=None):
         recv_log = "⬇ RECV"
         
     data_masked_log = min(10, max(1, (len(data) + 20) // 21))
+    tracer.rx(msg_uid, sender, len(data), rssi)
     if rssi is not None:
-        logger.info(f"[{recv_log} from {sender}, rssi: {rssi}] [{'*' * data_masked_log}] {len(data)} bytes, MSG_UID = {msg_uid}")
+        link_stats.record_rssi(sender, rssi)
+        logger.info("[%s from %s, rssi: %s] [%s] %d bytes, MSG_UID = %s", recv_log, sender, rssi, '*' * data_masked_log, len(data), msg_uid)
     else:
-        logger.info(f"[{recv_log} from {sender}] [{'*' * data_masked_log}] {len(data)} bytes, MSG_UID = {msg_uid}")
+        logger.info("[%s from %s] [%s] %d bytes, MSG_UID = %s", recv_log, sender, '*' * data_masked_log, len(data), msg_uid)
     
-    # logger.info(f"[PARSED HEADER] msg_uid:{msg_uid}, msg_typ:{msg_typ}, creator:{creator}, sender:{sender}, receiver:{receiver}, len-msg:{len(msg)}")
+    # logger.info("[PARSED HEADER] msg_uid:%s, msg_typ:%s, creator:%s, sender:%s, receiver:%s, len-msg:%s", msg_uid, msg_typ, creator, sender, receiver, len(msg))
     if sender not in recv_msg_count:
         recv_msg_count[sender] = 0
     recv_msg_count[sender] += 1
     msgs_recd.append((msg_uid, msg, time_msec()))
+    if creator != my_addr:
+        downstream_routes[creator] = sender # for sending "F" back towards creator
     ackmessage = msg_uid
     if msg_typ == "N": # N type msg from neighbours
         scan_process(msg_uid, msg)
@@ -1596,18 +2056,34 @@ def process_message(data, rssi=None):
                 asyncio.create_task(keep_transmode_lock(sender, img_id))
                 asyncio.create_task(send_msg("A", my_addr, ackmessage, sender))
             else:
-                logger.warning(f"TRANS MODE already in use, could not get lock...")
+                logger.warning("TRANS MODE already in use, could not get lock...")
+                if not check_transmode_lock(sender, img_id):
+                    clear_chunkid(img_id) # a refused "B" holds no memory while it waits
                 asyncio.create_task(send_msg("W", my_addr, WAIT_MESSAGE, sender))
                 return False
+        except membudget.TooLarge as e:
+            # a "W" would only bring it back, no answer fails the sender's "B"
+            logger.error("[CHUNK] transfer from %s can never fit (%s), refused", sender, e)
+            return False
+        except membudget.OverBudget as e:
+            logger.warning("[CHUNK] no memory for a new transfer from %s (%s), asking it to wait", sender, e)
+            asyncio.create_task(send_msg("W", my_addr, WAIT_MESSAGE, sender))
+            return False
         except Exception as e:
-            logger.error(f"[CHUNK] decoding unicode {e} : {msg}")
+            logger.error("[CHUNK] decoding unicode %s : %s", e, msg)
             return False
+    elif msg_typ == "F":
+        asyncio.create_task(send_msg("A", my_addr, ackmessage, sender))
+        asyncio.create_task(full_frame_request_process(creator, msg.decode()))
     elif msg_typ == "I":
         add_chunk(msg)  # optional to check check_transmode_lock
     elif msg_typ == "E": # 
         alldone, missing_str, img_id, recompiled_msgbytes, epoch_ms = end_chunk(msg_uid, msg.decode()) # TODO later, check how can we validate file
         if alldone:
             delete_transmode_lock(sender, img_id)
+            img_kind = get_chunk_kind(img_id)
+            if recompiled_msgbytes:
+                tracer.chunk(img_id, pkttrace.CHUNK_RECEIVED, chunk_map[img_id][1] if img_id in chunk_map else 0)
             # also when it fails
             ackmessage += b":-1"
             # asyncio.create_task(send_msg("A", creator, ackmessage, sender))
@@ -1618,21 +2094,23 @@ def process_message(data, rssi=None):
                     if i < msg_count-1:
                         await asyncio.sleep(1)
             asyncio.create_task(send_ack_multiple())
-            if recompiled_msgbytes:
+            if recompiled_msgbytes and img_kind == IMG_KIND_HB_BUNDLE:
+                clear_chunkid(img_id) # a repeated "E" must not hand out the heartbeats again
+                asyncio.create_task(hb_bundle_process(recompiled_msgbytes))
+            elif recompiled_msgbytes:
                 try:
-                    enc_filepath = f"{MY_IMAGE_DIR}/{creator}_{epoch_ms}.enc"
-                    logger.debug(f"[PIR] Saving encrypted image to {enc_filepath} : encrypted size = {len(recompiled_msgbytes)} bytes...")
-                    with open(enc_filepath, "wb") as f:
-                        f.write(recompiled_msgbytes)
-                    os.sync()  # Force filesystem sync to SD card
-                    utime.sleep_ms(500)
-                    imgpaths_to_send.append({"creator": creator, "epoch_ms": epoch_ms, "enc_filepath": enc_filepath})
-                    logger.info(f"[CHUNK] image saved to {enc_filepath}, adding to send queue")
+                    enc_filepath = img_filepath(creator, epoch_ms, img_kind)
+                    logger.debug("[CHUNK] Queueing encrypted image %s : encrypted size = %s bytes...", enc_filepath, len(recompiled_msgbytes))
+                    # queued for sending by the callback once it is on the SD card
+                    sd_storage.submit(enc_filepath, recompiled_msgbytes, "wb",
+                                      on_img_saved(creator, epoch_ms, enc_filepath, img_kind))
+                    sd_storage.end_batch()
+                    clear_chunkid(img_id) # chunks are not needed once the image is handed to the SD writer
                 except Exception as e:
-                    logger.error(f"[CHUNK] error saving image to {enc_filepath}: {e}")
+                    logger.error("[CHUNK] error saving image to %s: %s", enc_filepath, e)
                 # asyncio.create_task(img_process(img_id, recompiled_msgbytes, creator, sender))
             else:
-                logger.warning(f"[CHUNK] img not recompiled, so not sending")
+                logger.warning("[CHUNK] img not recompiled, so not sending")
         else:
             ackmessage += b":" + missing_str.encode()
             asyncio.create_task(send_msg("A", my_addr, ackmessage, sender))
@@ -1640,9 +2118,9 @@ def process_message(data, rssi=None):
         # ACK messages are already added to msgs_recd at line 1267
         # They are matched by ack_time() function which searches msgs_recd
         # No additional processing needed for ACK messages
-        logger.debug(f"[ACK] Received ACK message: {msg_uid}, payload: {msg}")
+        logger.debug("[ACK] Received ACK message: %s, payload: %s", msg_uid, msg)
     else:
-        logger.info(f"[LORA] Unseen messages type {msg_typ} in {msg}")
+        logger.info("[LORA] Unseen messages type %s in %s", msg_typ, msg)
     return True
 
 # ---------------------------------------------------------------------------
@@ -1655,6 +2133,7 @@ async def radio_read():
     while True:
         message, rssi = loranode.receive()
         if message:
+            gc_policy.note_activity()
             message = message.replace(b"{}[]", b"\n")
             process_message(message, rssi)
         await asyncio.sleep(0.15)  # Increased from 0.1 to 0.15 to give more time between receives
@@ -1692,6 +2171,21 @@ def read_gps_from_file():
 # Network Maintenance and Heartbeats
 # ---------------------------------------------------------------------------
 
+def build_binary_heartbeat(gps_coords, gps_staleness):
+    # Input: gps_coords: str "lat,lon" or "", gps_staleness: int; Output: bytes, see hb_codec.py
+    lat = lon = None
+    if gps_coords:
+        try:
+            lat_s, lon_s = gps_coords.split(",", 1)
+            lat, lon = float(lat_s), float(lon_s)
+        except ValueError:
+            pass
+    neighbours = [(n, link_stats.quality(n), link_stats.rssi.get(n)) for n in seen_neighbours]
+    return hb_codec.encode(my_addr, time_sec(), total_image_count, person_image_count, lat, lon, gps_staleness,
+                           len(imgpaths_to_send), len(msgs_unacked), get_free_memory() // 1024,
+                           neighbours, shortest_path_to_cc,
+                           task_profiler.take_peaks() if TASKPROF_ENABLED and TASKPROF_IN_HB else None)
+
 async def send_heartbeat():
     # Input: None; Output: bool indicating whether heartbeat was successfully sent to a neighbour
     gps_coords = read_gps_from_file()
@@ -1699,7 +2193,10 @@ async def send_heartbeat():
 
     # my_addr : uptime (seconds) : photos taken : events seen : gpslat,gpslong : gps_staleness(seconds) : neighbours([221,222]) : shortest_path([221,9])
     hbmsgstr = f"{my_addr}:{time_sec()}:{total_image_count}:{person_image_count}:{gps_coords}:{gps_staleness}:{seen_neighbours}:{shortest_path_to_cc}"
-    hbmsg = hbmsgstr.encode()
+    if HB_BINARY:
+        hbmsg = build_binary_heartbeat(gps_coords, gps_staleness)
+    else:
+        hbmsg = hbmsgstr.encode()
     msgbytes = encrypt_if_needed("H", hbmsg)
     sent_succ = False
     if running_as_cc():
@@ -1717,8 +2214,12 @@ async def send_heartbeat():
                 "epoch_ms": epoch_ms # TODO not actual
             }
         logger.info(f"[HB] sending raw HB to cloud, len={len(msgbytes)}, msg:{hbmsgstr}")
-        sent_succ = await upload_payload_to_server(heartbeat_payload, "heartbeat", my_addr)
+        sent_succ = await uplink_payload(heartbeat_payload, "heartbeat", my_addr)
         return sent_succ
+    elif HB_BUNDLING and hb_bundle_pending and not hb_bundle_sending:
+        # relay with heartbeats of other nodes waiting: mine goes in the same bundle, right now
+        hb_bundle_pending.append((my_addr, msgbytes))
+        return await flush_hb_bundle()
     else:
         next_dst = next_device_in_spath()
         if next_dst:
@@ -1756,7 +2257,7 @@ async def send_event_text(epoch_ms):
         }
 
         logger.info(f"[TXT] sending raw event text to cloud, len={len(msgbytes)}, msg:{event_msgstr}")
-        sent_succ = await upload_payload_to_server(event_payload, "event_text", my_addr)
+        sent_succ = await uplink_payload(event_payload, "event_text", my_addr)
         return sent_succ
     else:        
         next_dst = next_device_in_spath()
@@ -1848,7 +2349,6 @@ async def validate_and_remove_neighbours():
         for n in seen_neighbours:
             
             # ---- waiting, just to not abort partial validation ----
-            global image_in_progress
             waiting_retry = 5
             while image_in_progress:
                 waiting_retry -= 1
@@ -1906,12 +2406,16 @@ async def print_summary_and_flush_logs():
             await asyncio.sleep(200)
             continue
         free_mem = get_free_memory()
+        tracer.mem(free_mem // 1024, len(imgpaths_to_send), len(msgs_unacked))
         mem_str = f", Free: {free_mem/1024:.1f}KB" if free_mem > 0 else ""
         log_str = f"sent: {len(msgs_sent)} Recd: {len(msgs_recd)} Unacked: {len(msgs_unacked)}{mem_str}"
         if running_as_cc():
-            logger.info(f"{log_str}, Chunks: {len(chunk_map)}, Images at CC (received): {len(images_saved_at_cc)}, Center captured: {center_captured_image_count}, Queued: {len(imgpaths_to_send)}")
+            logger.info("%s, Chunks: %s, Images at CC (received): %s, Center captured: %s, Queued: %s, Uplink: %s, Spool: %s, Net: %s", log_str, len(chunk_map), len(images_saved_at_cc), center_captured_image_count, len(imgpaths_to_send), uplink_batcher.stats(), uplink_spool.stats(), transport_selector.summary())
         else:
-            logger.info(f"{log_str}, Chunks: {len(chunk_map)}, Queued images: {len(imgpaths_to_send)}")
+            logger.info("%s, Chunks: %s, Queued images: %s, Links: %s", log_str, len(chunk_map), len(imgpaths_to_send), link_stats.summary())
+        logger.info("[MEM] %s, GC: %s", mem_budget.stats(), gc_policy.stats())
+        if TASKPROF_ENABLED:
+            logger.info("[PROF] %s", task_profiler.summary())
         #logger.info(msgs_sent)
         #logger.info(msgs_recd)
         #logger.info(msgs_unacked)
@@ -2086,12 +2590,18 @@ async def main():
     image_in_progress = False
     
     await init_lora()
-    asyncio.create_task(radio_read())
-    asyncio.create_task(print_summary_and_flush_logs())
-    asyncio.create_task(validate_and_remove_neighbours())
+    task_profiler.spawn("sd_storage", sd_storage.run())
+    task_profiler.spawn("logger", logger.run())
+    if TRACE_ENABLED:
+        task_profiler.spawn("tracer", tracer.run())
+    if TASKPROF_ENABLED:
+        asyncio.create_task(task_profiler.run())
+    task_profiler.spawn("radio_read", radio_read())
+    task_profiler.spawn("print_summary_and_flush_logs", print_summary_and_flush_logs())
+    task_profiler.spawn("validate_and_remove_neighbours", validate_and_remove_neighbours())
     # Start memory management tasks
-    asyncio.create_task(periodic_memory_cleanup())
-    asyncio.create_task(periodic_gc())
+    task_profiler.spawn("periodic_memory_cleanup", periodic_memory_cleanup())
+    task_profiler.spawn("periodic_gc", periodic_gc())
     logger.info(f"[MEM] Memory management tasks started (free: {get_free_memory()/1024:.1f}KB)\n")
     if running_as_cc():
         logger.info(f"[INIT] ===> Starting command center node <===")
@@ -2100,30 +2610,35 @@ async def main():
             await init_wifi()
 
         # await init_sim()
-        asyncio.create_task(neighbour_scan())
+        if UPLINK_BATCHING:
+            task_profiler.spawn("uplink_batcher", uplink_batcher.run())
+        if UPLINK_SPOOL:
+            task_profiler.spawn("uplink_spool", uplink_spool.run())
+        task_profiler.spawn("transport_selector", transport_selector.run())
+        task_profiler.spawn("neighbour_scan", neighbour_scan())
         await asyncio.sleep(2)
-        asyncio.create_task(initiate_spath_pings()) # TODO enable for dynamic path
+        task_profiler.spawn("initiate_spath_pings", initiate_spath_pings()) # TODO enable for dynamic path
         await asyncio.sleep(1)
-        asyncio.create_task(keep_sending_heartbeat())
+        task_profiler.spawn("keep_sending_heartbeat", keep_sending_heartbeat())
         if len(IMAGE_CAPTURING_ADDRS)==0 or my_addr in IMAGE_CAPTURING_ADDRS:
-            asyncio.create_task(person_detection_loop())
+            task_profiler.spawn("person_detection_loop", person_detection_loop())
         else:
             logger.warning(f"[INIT] ===> Command center node {my_addr} is not enabled to capture images")
-        asyncio.create_task(event_text_sending_loop())
-        asyncio.create_task(image_sending_loop())
+        task_profiler.spawn("event_text_sending_loop", event_text_sending_loop())
+        task_profiler.spawn("image_sending_loop", image_sending_loop())
     else:
         logger.info(f"[INIT] ===> Starting unit node <===")
-        asyncio.create_task(neighbour_scan())
+        task_profiler.spawn("neighbour_scan", neighbour_scan())
         await asyncio.sleep(1)
-        asyncio.create_task(keep_sending_heartbeat())
+        task_profiler.spawn("keep_sending_heartbeat", keep_sending_heartbeat())
         await asyncio.sleep(2)
-        #asyncio.create_task(keep_updating_gps())
+        #task_profiler.spawn("keep_updating_gps", keep_updating_gps())
         if len(IMAGE_CAPTURING_ADDRS)==0 or my_addr in IMAGE_CAPTURING_ADDRS:
-            asyncio.create_task(person_detection_loop())
+            task_profiler.spawn("person_detection_loop", person_detection_loop())
         else:
             logger.warning(f"[INIT] ===> Unit node {my_addr} is not enabled to capture images")
-        asyncio.create_task(event_text_sending_loop())
-        asyncio.create_task(image_sending_loop())
+        task_profiler.spawn("event_text_sending_loop", event_text_sending_loop())
+        task_profiler.spawn("image_sending_loop", image_sending_loop())
     for i in range(24*7):
         await asyncio.sleep(3600)
         logger.info(f"Finished HOUR {i}")
@@ -0,0 +1,125 @@
+import gc
+from logger import logger
+
+# ---------------------------------------------------------------------------
+# Memory budgets per subsystem
+# ---------------------------------------------------------------------------
+# Every subsystem that holds large buffers has a budget (bytes) and a
+# high-water mark. Two ways of accounting:
+#
+#   reserve() / release()  before a buffer is built, keyed (one reservation
+#                          per image transfer, capture, ...). reserve() says
+#                          no when the budget or the heap would be exceeded,
+#                          so the caller can refuse the work up front
+#                          instead of hitting a MemoryError halfway through.
+#   measure()              sampled size of a structure that grows on its own
+#                          (queues, message logs); True when over budget, the
+#                          caller trims it.
+#
+# Reading the stats never collects garbage. gc.mem_free() without a collect
+# counts garbage as used, so only a reservation that would be refused on the
+# heap reserve pays for one gc.collect() and a second look.
+
+CHUNKS = "chunks"        # incoming image chunks and their recompiled copy, outgoing image
+CRYPTO = "crypto"        # hybrid encryption of a capture
+QUEUES = "queues"        # images waiting to be sent
+MSGLOG = "msglog"        # sent / received / unacked message logs
+
+
+class OverBudget(Exception):
+    pass
+
+
+class TooLarge(OverBudget):
+    # more than the whole budget, waiting does not help
+    pass
+
+
+def heap_free():
+    # Input: None; Output: int free heap bytes without collecting, -1 if unknown
+    try:
+        return gc.mem_free()
+    except AttributeError:
+        return -1
+
+
+class MemBudget:
+    def __init__(self, budgets_kb, heap_reserve_kb, collect_fn=None):
+        # budgets_kb: dict subsystem -> KB, heap_reserve_kb: heap that must stay free after a reservation,
+        # collect_fn: () -> any, runs a collection (default gc.collect)
+        self.budget = {name: kb * 1024 for name, kb in budgets_kb.items()}
+        self.used = {name: 0 for name in self.budget}
+        self.high = {name: 0 for name in self.budget}
+        self.refused = {name: 0 for name in self.budget}
+        self.held = {}                # (subsystem, key) -> reserved bytes
+        self.heap_reserve = heap_reserve_kb * 1024
+        self.heap_low = -1            # lowest free heap seen
+        self.collect_fn = collect_fn or gc.collect
+
+    def _set_used(self, name, nbytes):
+        self.used[name] = nbytes
+        if nbytes > self.high[name]:
+            self.high[name] = nbytes
+
+    def heap_free(self):
+        # Input: None; Output: int free heap bytes (no collect), also tracks the low-water mark
+        free = heap_free()
+        if free >= 0 and (self.heap_low < 0 or free < self.heap_low):
+            self.heap_low = free
+        return free
+
+    def _heap_allows(self, nbytes):
+        free = self.heap_free()
+        if free < 0 or free - nbytes >= self.heap_reserve:
+            return True
+        self.collect_fn()
+        free = self.heap_free()
+        return free - nbytes >= self.heap_reserve
+
+    def reserve(self, name, key, nbytes):
+        # Input: name: subsystem, key: any hashable, nbytes: int; Output: bool reserved
+        # a second reserve() with the same key replaces the first one
+        old = self.held.pop((name, key), 0)
+        used = self.used[name] - old
+        if used + nbytes > self.budget[name] or not self._heap_allows(nbytes - old):
+            self.held[(name, key)] = old
+            self.refused[name] += 1
+            logger.warning(f"[MEM] {name} refused {nbytes // 1024}KB for {key}: "
+                           f"{used // 1024}/{self.budget[name] // 1024}KB used, heap free {heap_free() // 1024}KB")
+            return False
+        self.held[(name, key)] = nbytes
+        self._set_used(name, used + nbytes)
+        return True
+
+    def fits(self, name, nbytes):
+        # Input: name: subsystem, nbytes: int; Output: bool, False if it exceeds the budget even when nothing else is held
+        return nbytes <= self.budget[name]
+
+    def require(self, name, key, nbytes):
+        # Input: as reserve(); Output: None, raises OverBudget if refused
+        if not self.reserve(name, key, nbytes):
+            raise OverBudget(f"{name} budget, {nbytes} bytes for {key}")
+
+    def release(self, name, key):
+        # Input: name: subsystem, key: as given to reserve(); Output: None
+        nbytes = self.held.pop((name, key), 0)
+        if nbytes:
+            self.used[name] -= nbytes
+
+    def measure(self, name, nbytes):
+        # Input: name: subsystem, nbytes: int current size; Output: bool True if over budget
+        self._set_used(name, nbytes)
+        return nbytes > self.budget[name]
+
+    def stats(self):
+        # Input: None; Output: str used/budget and high-water per subsystem, heap free and low-water
+        parts = []
+        for name in self.budget:
+            s = f"{name} {self.used[name] // 1024}/{self.budget[name] // 1024}KB hw {self.high[name] // 1024}KB"
+            if self.refused[name]:
+                s += f" refused {self.refused[name]}"
+            parts.append(s)
+        free = self.heap_free()
+        if free >= 0:
+            parts.append(f"heap {free // 1024}KB low {self.heap_low // 1024}KB")
+        return ", ".join(parts)
@@ -0,0 +1,190 @@
+import os
+import struct
+import time
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+try:
+    from utime import ticks_ms
+except ImportError:
+    def ticks_ms():
+        return int(time.monotonic() * 1000) & 0x3FFFFFFF
+from logger import logger
+
+# ---------------------------------------------------------------------------
+# Binary event trace
+# ---------------------------------------------------------------------------
+# Fixed size little endian records, collected in RAM and appended to
+# rotating files on the SD card by a background task. Decoded on a computer
+# with util/decode_trace.py.
+#
+# Every record starts with  B type, I ticks_ms. The first record of a file
+# (and of every boot) is SYNC, which ties ticks_ms to the wall clock.
+#
+#   SYNC    I epoch sec, B node addr
+#   TX      7s msg uid, B dest, B length
+#   RX      7s msg uid, B sender, B length, b rssi (NO_RSSI if unknown)
+#   ACK     7s msg uid, H latency ms (0xFFFF = no ack), B tries
+#   CHUNK   3s img id, B event (CHUNK_*), H value (chunk count / missing chunks)
+#   MEM     H free KB, H images queued, H unacked messages
+#   UPLOAD  B transport (UPLOAD_*), B msg type (first letter), B ok, I latency ms
+
+REC_SYNC = 0
+REC_TX = 1
+REC_RX = 2
+REC_ACK = 3
+REC_CHUNK = 4
+REC_MEM = 5
+REC_UPLOAD = 6
+
+RECORD_FORMATS = {
+    REC_SYNC: "<BIIB",
+    REC_TX: "<BI7sBB",
+    REC_RX: "<BI7sBBb",
+    REC_ACK: "<BI7sHB",
+    REC_CHUNK: "<BI3sBH",
+    REC_MEM: "<BIHHH",
+    REC_UPLOAD: "<BIBBBI",
+}
+RECORD_NAMES = {
+    REC_SYNC: "sync", REC_TX: "tx", REC_RX: "rx", REC_ACK: "ack",
+    REC_CHUNK: "chunk", REC_MEM: "mem", REC_UPLOAD: "upload",
+}
+
+CHUNK_BEGIN = 0        # sender: transfer started, value = chunks
+CHUNK_MISSING = 1      # sender: receiver reported missing chunks, value = how many
+CHUNK_DONE = 2         # sender: all chunks acked, value = chunks
+CHUNK_FAILED = 3       # sender: gave up
+CHUNK_RECEIVED = 4     # receiver: all chunks in, value = chunks
+
+UPLOAD_CELLULAR = 0
+UPLOAD_WIFI = 1
+UPLOAD_RESUMABLE = 2
+
+NO_RSSI = -128
+NO_ACK = 0xFFFF
+
+TRACE_BUFFER_BYTES = 2048          # records wait here until the flush task appends them
+TRACE_FLUSH_INTERVAL_SEC = 10
+TRACE_FILE_BYTES = 256 * 1024      # start a new file beyond this
+TRACE_MAX_FILES = 16               # oldest file is deleted beyond this (~4 MB of trace)
+TRACE_PREFIX = "trace_"
+TRACE_SUFFIX = ".bin"
+
+
+def _clamp(v, lo, hi):
+    return lo if v < lo else hi if v > hi else v
+
+
+class Tracer:
+    def __init__(self, storage, trace_dir, node_addr=0, enabled=True):
+        # storage: storage.WriteBehindStorage, files are appended through its queue
+        self.storage = storage
+        self.dir = trace_dir
+        self.node_addr = node_addr
+        self.enabled = enabled
+        self.buf = bytearray(TRACE_BUFFER_BYTES)
+        self.buf_len = 0
+        self.files = []               # file numbers, oldest first
+        self.file_bytes = 0           # bytes in the newest file (including queued appends)
+        self.record_count = 0
+        self.dropped_count = 0
+        self._scan()
+        self.sync()
+
+    def _path(self, n):
+        return f"{self.dir}/{TRACE_PREFIX}{n}{TRACE_SUFFIX}"
+
+    def _scan(self):
+        try:
+            names = os.listdir(self.dir)
+        except OSError as e:
+            logger.error(f"[TRACE] can't list {self.dir}: {e}")
+            names = []
+        for name in names:
+            if name.startswith(TRACE_PREFIX) and name.endswith(TRACE_SUFFIX):
+                try:
+                    self.files.append(int(name[len(TRACE_PREFIX):-len(TRACE_SUFFIX)]))
+                except ValueError:
+                    pass
+        self.files.sort()
+        self._rotate()  # a new boot starts a new file
+
+    def _rotate(self):
+        self.files.append(self.files[-1] + 1 if self.files else 0)
+        self.file_bytes = 0
+        while len(self.files) > TRACE_MAX_FILES:
+            old = self.files.pop(0)
+            try:
+                os.remove(self._path(old))
+            except OSError:
+                pass
+
+    def stats(self):
+        return f"records:{self.record_count}, dropped:{self.dropped_count}, files:{len(self.files)}"
+
+    def _add(self, rec_type, *fields):
+        if not self.enabled:
+            return
+        fmt = RECORD_FORMATS[rec_type]
+        size = struct.calcsize(fmt)
+        if self.buf_len + size > len(self.buf):
+            self.dropped_count += 1  # flush task is behind, losing a record is better than blocking
+            return
+        struct.pack_into(fmt, self.buf, self.buf_len, rec_type, ticks_ms(), *fields)
+        self.buf_len += size
+        self.record_count += 1
+
+    def _sync_fields(self):
+        return (int(time.time()) & 0xFFFFFFFF, self.node_addr & 0xFF)
+
+    def sync(self):
+        # Input: None; Output: None (records the wall clock for the ticks_ms that follow)
+        self._add(REC_SYNC, *self._sync_fields())
+
+    def tx(self, msg_uid, dest, length):
+        self._add(REC_TX, msg_uid, dest & 0xFF, _clamp(length, 0, 255))
+
+    def rx(self, msg_uid, sender, length, rssi=None):
+        self._add(REC_RX, msg_uid, sender & 0xFF, _clamp(length, 0, 255),
+                  NO_RSSI if rssi is None else _clamp(int(rssi), -127, 127))
+
+    def ack(self, msg_uid, latency_ms, tries):
+        self._add(REC_ACK, msg_uid, NO_ACK if latency_ms is None else _clamp(latency_ms, 0, NO_ACK - 1),
+                  _clamp(tries, 0, 255))
+
+    def chunk(self, img_id, event, value=0):
+        if isinstance(img_id, str):
+            img_id = img_id.encode()
+        self._add(REC_CHUNK, img_id, event, _clamp(value, 0, 0xFFFF))
+
+    def mem(self, free_kb, queued, unacked):
+        self._add(REC_MEM, _clamp(free_kb, 0, 0xFFFF), _clamp(queued, 0, 0xFFFF), _clamp(unacked, 0, 0xFFFF))
+
+    def upload(self, transport, msg_typ, ok, latency_ms):
+        self._add(REC_UPLOAD, transport, ord(msg_typ[0]) if msg_typ else 0, 1 if ok else 0,
+                  _clamp(latency_ms, 0, 0xFFFFFFFF))
+
+    def flush(self):
+        # Input: None; Output: None (hands the buffered records to the storage queue)
+        if self.buf_len == 0:
+            return
+        data = bytes(self.buf[:self.buf_len])
+        if self.file_bytes + self.buf_len > TRACE_FILE_BYTES:
+            self._rotate()
+            # every file starts with SYNC so it can be decoded on its own
+            data = struct.pack(RECORD_FORMATS[REC_SYNC], REC_SYNC, ticks_ms(), *self._sync_fields()) + data
+        self.buf_len = 0
+        self.storage.submit(self._path(self.files[-1]), data, "ab")
+        self.file_bytes += len(data)
+
+    async def run(self):
+        # Input: None; Output: None (flush task, start once with asyncio.create_task)
+        logger.info(f"[TRACE] event trace started, file {self._path(self.files[-1])}")
+        while True:
+            await asyncio.sleep(TRACE_FLUSH_INTERVAL_SEC)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"[TRACE] flush failed: {e}")
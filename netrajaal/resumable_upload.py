@@ -0,0 +1,185 @@
+import json
+import os
+import time
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+from logger import logger
+
+# ---------------------------------------------------------------------------
+# Resumable image upload
+# ---------------------------------------------------------------------------
+# The encrypted image is streamed from SD in fixed size binary parts instead
+# of one base64 JSON payload. The server keeps the offset of every upload,
+# a failed part is retried on its own and an interrupted upload (failed
+# link, reboot) continues where the server says it stopped.
+#
+#   POST <base>/start   {"machine_id", "epoch_ms", "image_kind", "size", "part_size"}
+#                       -> {"upload_id": str, "offset": int}   (same image again -> same id, current offset)
+#   POST <base>/part?upload_id=<id>&offset=<n>    body = raw bytes
+#                       -> {"offset": int}    409 {"offset": int} when <n> is not where the server is
+#   POST <base>/finish?upload_id=<id>
+#                       -> {"ok": true}
+#
+# Progress is kept next to the image in "<enc_filepath>.up" so a restarted
+# node does not need to ask for a new upload id. It is written through the
+# write-behind storage queue (and remembered in RAM until then), so a part
+# costs no synchronous SD write.
+
+PART_SIZE = 4096              # bytes per part, one AT+HTTPDATA over cellular
+PART_RETRIES = 3              # attempts per part before the upload is given up for now
+PART_RETRY_PAUSE = 2          # seconds, doubled after every failed attempt
+REPROBE_SEC = 3600            # after a 404 on /start, try the resumable endpoint again after this
+PROGRESS_SUFFIX = ".up"
+
+
+def _time_sec():
+    return int(time.time())
+
+
+class ResumableUploader:
+    def __init__(self, base_url, post_fn, storage, part_size=PART_SIZE):
+        # post_fn: async (url, body, content_type) -> tuple(status_code or None, response_text)
+        # storage: storage.WriteBehindStorage, progress files are written through its queue
+        self.base_url = base_url.rstrip("/")
+        self.post_fn = post_fn
+        self.storage = storage
+        self.progress = {}           # enc_filepath -> last progress written, may still be in the queue
+        self.part_size = part_size
+        self.unsupported_since = None
+        self.parts_sent = 0
+        self.parts_failed = 0
+        self.bytes_sent = 0
+
+    def stats(self):
+        return f"parts:{self.parts_sent}, failed:{self.parts_failed}, bytes:{self.bytes_sent}"
+
+    def _load_progress(self, enc_filepath):
+        if enc_filepath in self.progress:
+            return self.progress[enc_filepath]
+        try:
+            with open(enc_filepath + PROGRESS_SUFFIX, "r") as f:
+                return json.loads(f.read())
+        except Exception:
+            return None
+
+    def _save_progress(self, enc_filepath, progress):
+        self.progress[enc_filepath] = progress
+        self.storage.submit(enc_filepath + PROGRESS_SUFFIX, json.dumps(progress), "w")
+
+    async def _clear_progress(self, enc_filepath):
+        self.progress.pop(enc_filepath, None)
+        await self.storage.flush()  # a progress write still in the queue would bring the file back
+        async with self.storage.lock:
+            try:
+                os.remove(enc_filepath + PROGRESS_SUFFIX)
+            except OSError:
+                pass
+
+    async def _post_json(self, url, body):
+        status, text = await self.post_fn(url, body, "application/json")
+        resp = None
+        if text:
+            try:
+                resp = json.loads(text)
+            except ValueError:
+                resp = None
+        return status, resp
+
+    async def _start(self, enc_filepath, creator, epoch_ms, image_kind, size):
+        # Output: tuple(upload_id, offset), (None, None) on failure, ("", None) if the server has no resumable endpoint
+        req = {"machine_id": creator, "epoch_ms": epoch_ms, "image_kind": image_kind,
+               "size": size, "part_size": self.part_size}
+        progress = self._load_progress(enc_filepath)
+        if progress and progress.get("size") == size:
+            req["upload_id"] = progress.get("upload_id")
+        status, resp = await self._post_json(f"{self.base_url}/start", json.dumps(req))
+        if status == 404:
+            return "", None
+        if status != 200 or not isinstance(resp, dict) or "upload_id" not in resp:
+            logger.error(f"[UPR] start failed for {enc_filepath}: HTTP {status}")
+            return None, None
+        upload_id = resp["upload_id"]
+        offset = int(resp.get("offset", 0))
+        self._save_progress(enc_filepath, {"upload_id": upload_id, "offset": offset, "size": size})
+        return upload_id, offset
+
+    async def _send_part(self, upload_id, offset, data):
+        # Output: int new server offset, or None if the part failed
+        url = f"{self.base_url}/part?upload_id={upload_id}&offset={offset}"
+        status, text = await self.post_fn(url, data, "application/octet-stream")
+        resp = None
+        if text:
+            try:
+                resp = json.loads(text)
+            except ValueError:
+                resp = None
+        if status in (200, 409) and isinstance(resp, dict) and "offset" in resp:
+            if status == 409:
+                logger.warning(f"[UPR] server is at offset {resp['offset']}, not {offset}")
+            return int(resp["offset"])
+        return None
+
+    async def upload_file(self, enc_filepath, creator, epoch_ms, image_kind="full"):
+        # Input: enc_filepath: str, creator: int, epoch_ms: int, image_kind: str
+        # Output: True uploaded, False failed (progress kept for next time), None server has no resumable endpoint
+        if self.unsupported_since is not None:
+            if _time_sec() - self.unsupported_since < REPROBE_SEC:
+                return None
+            self.unsupported_since = None
+        try:
+            size = os.stat(enc_filepath)[6]
+        except OSError as e:
+            logger.error(f"[UPR] can't stat {enc_filepath}: {e}")
+            return False
+
+        upload_id, offset = await self._start(enc_filepath, creator, epoch_ms, image_kind, size)
+        if upload_id == "":
+            logger.warning("[UPR] server has no resumable upload endpoint, using single upload")
+            self.unsupported_since = _time_sec()
+            return None
+        if upload_id is None:
+            return False
+        if offset > 0:
+            logger.info(f"[UPR] resuming {enc_filepath} at {offset}/{size} bytes")
+
+        with open(enc_filepath, "rb") as f:
+            while offset < size:
+                f.seek(offset)
+                data = f.read(self.part_size)
+                pause = PART_RETRY_PAUSE
+                new_offset = None
+                for attempt in range(PART_RETRIES):
+                    new_offset = await self._send_part(upload_id, offset, data)
+                    if new_offset is not None and new_offset != offset:
+                        break
+                    # a reply that leaves the server where it was is a failed attempt too, else the part loops
+                    reason = "failed" if new_offset is None else "made no progress"
+                    new_offset = None
+                    self.parts_failed += 1
+                    logger.warning(f"[UPR] part at {offset} of {enc_filepath} {reason}, attempt {attempt + 1}/{PART_RETRIES}")
+                    await asyncio.sleep(pause)
+                    pause *= 2
+                if new_offset is None:
+                    self._save_progress(enc_filepath, {"upload_id": upload_id, "offset": offset, "size": size})
+                    logger.error(f"[UPR] giving up on {enc_filepath} for now at {offset}/{size} bytes")
+                    return False
+                if new_offset < 0 or new_offset > size:
+                    logger.error(f"[UPR] server offset {new_offset} out of range for {enc_filepath} ({size} bytes)")
+                    await self._clear_progress(enc_filepath)
+                    return False
+                if new_offset == offset + len(data):
+                    self.parts_sent += 1
+                    self.bytes_sent += len(data)
+                offset = new_offset
+                self._save_progress(enc_filepath, {"upload_id": upload_id, "offset": offset, "size": size})
+                data = None
+
+        status, resp = await self._post_json(f"{self.base_url}/finish?upload_id={upload_id}", "{}")
+        if status != 200 or not isinstance(resp, dict) or not resp.get("ok"):
+            logger.error(f"[UPR] finish failed for {enc_filepath}: HTTP {status}")
+            return False
+        await self._clear_progress(enc_filepath)
+        logger.info(f"[UPR] uploaded {enc_filepath}, {size} bytes")
+        return True
@@ -0,0 +1,141 @@
+# ---------------------------------------------------------------------------
+# Fixed capacity message logs
+# ---------------------------------------------------------------------------
+# Ring: preallocated slots, append() overwrites the oldest entry once full,
+# so the memory of a log does not grow with traffic. Entries are appended in
+# (nearly) time order, so dropping by age is a walk from the oldest end that
+# stops at the first entry young enough, no rebuild of the whole log. An
+# older entry behind it (acked late) waits for a later walk or is overwritten.
+#
+# Unacked: the same ring for the order, plus a dict uid -> entry for the
+# lookups of the ack path. Entries are (msg_uid, msgbytes, time_ms) tuples
+# like in the lists these replace. An acked uid leaves its slot in the ring
+# behind; dead slots are compacted away when the ring is full, and a live
+# entry is only pushed out when every slot holds one. Slots carry a sequence
+# number, so a uid acked and sent again does not bring its old slot back.
+
+TIME = 2     # index of the timestamp (ms) in an entry
+
+
+class Ring:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.start = 0            # slot of the oldest entry
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        # oldest first
+        for i in range(self.count):
+            yield self.slots[(self.start + i) % self.capacity]
+
+    def append(self, entry):
+        # Input: entry: tuple; Output: tuple evicted to make room, or None
+        end = (self.start + self.count) % self.capacity
+        evicted = self.slots[end] if self.count == self.capacity else None
+        self.slots[end] = entry
+        if evicted is None:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+        return evicted
+
+    def popleft(self):
+        # Input: None; Output: oldest entry, None if empty
+        if not self.count:
+            return None
+        entry = self.slots[self.start]
+        self.slots[self.start] = None
+        self.start = (self.start + 1) % self.capacity
+        self.count -= 1
+        return entry
+
+    def peekleft(self):
+        return self.slots[self.start] if self.count else None
+
+    def keep(self, pred):
+        # Input: pred: entry -> bool; Output: int entries dropped (in place, order kept)
+        kept = 0
+        for i in range(self.count):
+            entry = self.slots[(self.start + i) % self.capacity]
+            if pred(entry):
+                self.slots[(self.start + kept) % self.capacity] = entry
+                kept += 1
+        for i in range(kept, self.count):
+            self.slots[(self.start + i) % self.capacity] = None
+        dropped = self.count - kept
+        self.count = kept
+        return dropped
+
+    def trim(self, n):
+        # Input: n: int oldest entries to drop; Output: None
+        for _ in range(min(n, self.count)):
+            self.popleft()
+
+    def drop_older(self, cutoff_ms):
+        # Input: cutoff_ms: int; Output: int entries dropped, those with time < cutoff_ms
+        dropped = 0
+        while self.count and self.slots[self.start][TIME] < cutoff_ms:
+            self.popleft()
+            dropped += 1
+        return dropped
+
+
+class Unacked:
+    def __init__(self, capacity):
+        self.order = Ring(capacity)   # (seq, uid), oldest first; dead slots stay until compacted
+        self.entries = {}             # msg_uid -> (seq, entry)
+        self.seq = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _live(self, slot):
+        held = self.entries.get(slot[1])
+        return held is not None and held[0] == slot[0]
+
+    def __iter__(self):
+        # oldest first
+        for slot in self.order:
+            if self._live(slot):
+                yield self.entries[slot[1]][1]
+
+    def append(self, entry):
+        # Input: entry: tuple(msg_uid, msgbytes, time_ms); Output: entry evicted to make room, or None
+        uid = entry[0]
+        held = self.entries.get(uid)
+        if held is not None:
+            self.entries[uid] = (held[0], entry)   # resent with the same uid, keeps its place
+            return None
+        evicted = None
+        if len(self.order) == self.order.capacity:
+            self.order.keep(self._live)
+            if len(self.order) == self.order.capacity:
+                # every slot is live, the oldest message in flight has to go
+                evicted = self.entries.pop(self.order.popleft()[1])[1]
+        self.seq += 1
+        self.order.append((self.seq, uid))
+        self.entries[uid] = (self.seq, entry)
+        return evicted
+
+    def pop(self, msg_uid):
+        # Input: msg_uid: bytes; Output: entry, None if not (or no longer) waiting for an ack
+        held = self.entries.pop(msg_uid, None)
+        return held[1] if held is not None else None
+
+    def drop_older(self, cutoff_ms):
+        # Input: cutoff_ms: int; Output: int entries dropped, those sent before cutoff_ms
+        dropped = 0
+        while len(self.order):
+            slot = self.order.peekleft()
+            live = self._live(slot)
+            if live and self.entries[slot[1]][1][TIME] >= cutoff_ms:
+                break
+            self.order.popleft()
+            if live:
+                del self.entries[slot[1]]
+                dropped += 1
+        return dropped
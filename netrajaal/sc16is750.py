@@ -0,0 +1,267 @@
+import time
+try:
+    from machine import SPI, Pin
+except ImportError:  # host side, the drivers are replaced by fakes there
+    SPI = Pin = None
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+from logger import logger
+
+# ---------------------------------------------------------------------------
+# SC16IS750 SPI-UART bridge
+# ---------------------------------------------------------------------------
+# Shared by the cellular modem and the GPS. Data is moved through the 64 byte
+# FIFOs in bursts: RXLVL / TXLVL tell how much can be read / written and the
+# whole burst goes in one SPI transaction (one address byte, then the data),
+# instead of one register access per byte.
+#
+# With irq_pin set, the bridge IRQ output (active low) wakes up waiting
+# readers on RX data, otherwise the async methods poll the FIFO level.
+
+CRYSTAL_HZ = 14745600
+SPI_BAUDRATE = 500000
+FIFO_SIZE = 64
+CS_SETUP_US = 5                # pause after pulling CS low before the first SPI byte
+
+# Registers (general register set)
+REG_RHR = 0x00                 # read: receive holding register
+REG_THR = 0x00                 # write: transmit holding register
+REG_IER = 0x01
+REG_FCR = 0x02
+REG_LCR = 0x03
+REG_MCR = 0x04
+REG_LSR = 0x05
+REG_TXLVL = 0x08
+REG_RXLVL = 0x09
+REG_IOCONTROL = 0x0E
+REG_DLL = 0x00                 # with LCR divisor latch enabled
+REG_DLH = 0x01
+
+IER_RHR = 0x01                 # RX FIFO trigger level / RX timeout interrupt
+IOCONTROL_RESET = 0x08
+FCR_RESET_ENABLE = 0x07        # reset both FIFOs, enable FIFOs
+LCR_DIVISOR_LATCH = 0x80
+LCR_8N1 = 0x03
+
+POLL_MS = 10                   # FIFO polling period when there is no IRQ pin
+IRQ_MAX_WAIT_MS = 500          # with an IRQ pin, still look at RXLVL this often in case an edge was missed
+WRITE_TIMEOUT_MS = 1000        # write() / write_async() give up when the TX FIFO does not drain for this long
+
+
+def _addr(reg, read):
+    return (0x80 if read else 0x00) | (reg << 3)
+
+
+class SC16IS750:
+    """ SC16IS750 UART bridge driver with FIFO bursts and optional IRQ wakeup """
+
+    def __init__(self, spi_bus=1, cs_pin="P3", baudrate=None, irq_pin=None):
+        # baudrate: UART baud rate to set up straight away, None to call init() later
+        self.cs = Pin(cs_pin, Pin.OUT)
+        self.cs.value(1)
+        self.spi = SPI(spi_bus, baudrate=SPI_BAUDRATE, polarity=0, phase=0)
+        self.baudrate = None
+        self.rx_flag = None
+        self.irq_count = 0
+        self._addr_rd = bytearray([_addr(REG_RHR, True)])
+        self._addr_wr = bytearray([_addr(REG_THR, False)])
+        self._rx_buf = bytearray(FIFO_SIZE)
+        if irq_pin is not None:
+            self._setup_irq(irq_pin)
+        if baudrate:
+            self.init(baudrate)
+
+    def _setup_irq(self, irq_pin):
+        if not hasattr(asyncio, "ThreadSafeFlag"):
+            logger.warning("[UART] no ThreadSafeFlag in this asyncio, polling the bridge instead of IRQ")
+            return
+        self.rx_flag = asyncio.ThreadSafeFlag()
+        self.irq = Pin(irq_pin, Pin.IN, Pin.PULL_UP)
+        self.irq.irq(trigger=Pin.IRQ_FALLING, handler=self._on_irq)
+
+    def _on_irq(self, pin):
+        # runs in interrupt context, only wake up the waiting task
+        self.irq_count += 1
+        self.rx_flag.set()
+
+    # --- register access ---
+
+    def _write_register(self, reg, val):
+        self.cs.value(0)
+        time.sleep_us(CS_SETUP_US)
+        self.spi.write(bytearray([_addr(reg, False), val]))
+        self.cs.value(1)
+
+    def _read_register(self, reg):
+        self.cs.value(0)
+        time.sleep_us(CS_SETUP_US)
+        self.spi.write(bytearray([_addr(reg, True)]))
+        result = self.spi.read(1)[0]
+        self.cs.value(1)
+        return result
+
+    def _read_fifo(self, n):
+        # Input: n: int 1..FIFO_SIZE, must not exceed RXLVL; Output: memoryview of n bytes (valid until the next read)
+        buf = memoryview(self._rx_buf)[:n]
+        self.cs.value(0)
+        time.sleep_us(CS_SETUP_US)
+        self.spi.write(self._addr_rd)
+        self.spi.readinto(buf)
+        self.cs.value(1)
+        return buf
+
+    def _write_fifo(self, data):
+        # Input: data: bytes/memoryview, at most TXLVL bytes; Output: None
+        self.cs.value(0)
+        time.sleep_us(CS_SETUP_US)
+        self.spi.write(self._addr_wr)
+        self.spi.write(data)
+        self.cs.value(1)
+
+    # --- setup ---
+
+    def init(self, baudrate):
+        # Input: baudrate: int; Output: None (resets the bridge, 8N1, FIFOs on, RX FIFO emptied)
+        reg = self._read_register(REG_IOCONTROL)
+        self._write_register(REG_IOCONTROL, reg | IOCONTROL_RESET)
+        time.sleep_ms(200)
+
+        divisor = CRYSTAL_HZ // (baudrate * 16)
+        self._write_register(REG_LCR, LCR_DIVISOR_LATCH)
+        time.sleep_ms(10)
+        self._write_register(REG_DLL, divisor & 0xFF)
+        self._write_register(REG_DLH, divisor >> 8)
+        self._write_register(REG_LCR, LCR_8N1)
+        time.sleep_ms(10)
+
+        self._write_register(REG_FCR, FCR_RESET_ENABLE)
+        self._write_register(REG_IER, IER_RHR if self.rx_flag is not None else 0x00)
+        self._write_register(REG_MCR, 0x00)
+        time.sleep_ms(100)
+
+        self.baudrate = baudrate
+        while self.read_available():
+            pass
+
+    # --- non-blocking / sync interface ---
+
+    def any(self):
+        # Input: None; Output: int bytes waiting in the RX FIFO
+        return self._read_register(REG_RXLVL)
+
+    def tx_space(self):
+        # Input: None; Output: int free bytes in the TX FIFO
+        return self._read_register(REG_TXLVL)
+
+    def read_available(self, max_bytes=FIFO_SIZE):
+        # Input: max_bytes: int; Output: bytes read from the RX FIFO in one burst, without waiting
+        n = min(self._read_register(REG_RXLVL), max_bytes, FIFO_SIZE)
+        if n <= 0:
+            return b""
+        return bytes(self._read_fifo(n))
+
+    def write(self, data):
+        # Input: data: str or bytes; Output: int bytes written (less than len(data) on timeout)
+        if isinstance(data, str):
+            data = data.encode()
+        mv = memoryview(data)
+        sent = 0
+        start = time.ticks_ms()
+        while sent < len(mv):
+            space = self.tx_space()
+            if space == 0:
+                if time.ticks_diff(time.ticks_ms(), start) > WRITE_TIMEOUT_MS:
+                    logger.warning(f"[UART] TX FIFO stuck, wrote {sent}/{len(mv)} bytes")
+                    break
+                time.sleep_us(100)
+                continue
+            n = min(space, len(mv) - sent)
+            self._write_fifo(mv[sent:sent + n])
+            sent += n
+            start = time.ticks_ms()
+        return sent
+
+    def _printable(self, chunk):
+        out = ""
+        for b in chunk:
+            if (32 <= b <= 126) or b == 10 or b == 13:
+                out += chr(b)
+        return out
+
+    def read_data(self):
+        # Input: None; Output: str of everything in the RX FIFO now (printable ASCII, CR and LF only)
+        data = ""
+        while True:
+            chunk = self.read_available()
+            if not chunk:
+                return data
+            data += self._printable(chunk)
+
+    def read(self, timeout_ms=1000):
+        # Input: timeout_ms: int; Output: str of everything received during timeout_ms, stripped
+        data = ""
+        start = time.ticks_ms()
+        while time.ticks_diff(time.ticks_ms(), start) < timeout_ms:
+            chunk = self.read_available()
+            if chunk:
+                data += self._printable(chunk)
+            else:
+                time.sleep_ms(POLL_MS)
+        return data.strip()
+
+    # --- async interface ---
+
+    async def wait_readable(self, timeout_ms=None):
+        # Input: timeout_ms: int or None; Output: bool True if the RX FIFO has data
+        if self._read_register(REG_RXLVL):
+            return True
+        if self.rx_flag is not None:
+            wait_ms = IRQ_MAX_WAIT_MS if timeout_ms is None else min(timeout_ms, IRQ_MAX_WAIT_MS)
+            try:
+                await asyncio.wait_for(self.rx_flag.wait(), wait_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            wait_ms = POLL_MS if timeout_ms is None else min(timeout_ms, POLL_MS)
+            await asyncio.sleep(wait_ms / 1000)
+        return self._read_register(REG_RXLVL) > 0
+
+    async def read_async(self, max_bytes=FIFO_SIZE, timeout_ms=1000):
+        # Input: max_bytes: int, timeout_ms: int; Output: bytes, b"" if nothing arrived within timeout_ms
+        start = time.ticks_ms()
+        while True:
+            data = self.read_available(max_bytes)
+            if data:
+                return data
+            remaining = timeout_ms - time.ticks_diff(time.ticks_ms(), start)
+            if remaining <= 0:
+                return b""
+            await self.wait_readable(remaining)
+
+    async def write_async(self, data):
+        # Input: data: str or bytes; Output: int bytes written (less than len(data) on timeout)
+        # Yields to the event loop after every burst and while the TX FIFO drains,
+        # so long writes (cellular uploads) do not hold up the LoRa loop.
+        if isinstance(data, str):
+            data = data.encode()
+        mv = memoryview(data)
+        sent = 0
+        # time the UART needs to send a full FIFO (10 bits per byte)
+        drain_ms = max(1, FIFO_SIZE * 10 * 1000 // (self.baudrate or 115200))
+        start = time.ticks_ms()
+        while sent < len(mv):
+            space = self.tx_space()
+            if space == 0:
+                if time.ticks_diff(time.ticks_ms(), start) > WRITE_TIMEOUT_MS:
+                    logger.warning(f"[UART] TX FIFO stuck, wrote {sent}/{len(mv)} bytes")
+                    break
+                await asyncio.sleep(drain_ms / 2000)
+                continue
+            n = min(space, len(mv) - sent)
+            self._write_fifo(mv[sent:sent + n])
+            sent += n
+            start = time.ticks_ms()
+            await asyncio.sleep(0)
+        return sent
@@ -0,0 +1,253 @@
+import json
+import os
+import utime
+import uasyncio as asyncio
+from logger import logger
+
+# ---------------------------------------------------------------------------
+# Offline uplink spool for the command center
+# ---------------------------------------------------------------------------
+# Payloads the CC could not upload (cellular and WiFi both down) are appended
+# to segment files on the SD card, one JSON record per line, and replayed
+# oldest first once an upload goes through again (or every
+# SPOOL_REPLAY_INTERVAL_SEC). Images are already on the card, their record
+# only points at the encrypted file.
+#
+#   {"t": spooled at (sec), "m": msg_typ, "c": creator, "p": payload}
+#   {"t": ..., "m": "image", "c": creator, "e": epoch_ms, "f": enc_filepath, "k": kind}
+#
+# Records older than max_age_sec are dropped on replay, the oldest segment is
+# deleted when the spool grows beyond max_bytes. "t" is spool uptime from the
+# ticks counter, not the wall clock: the RTC starts at a fixed date on every
+# boot and jumps when it is set, which would expire records at once or never.
+# Records of segments left over from before a reboot count as spooled at boot.
+
+SPOOL_DIR = "spool"
+SPOOL_SEGMENT_BYTES = 16 * 1024     # start a new segment file beyond this
+SPOOL_MAX_BYTES = 512 * 1024        # drop the oldest segment beyond this
+SPOOL_MAX_AGE_SEC = 3 * 24 * 3600   # records older than this are not replayed
+SPOOL_REPLAY_INTERVAL_SEC = 120     # also try a replay this often while the spool is not empty
+SPOOL_REPLAY_BATCH = 20             # records handed to replay_fn in one call
+SEGMENT_PREFIX = "seg_"
+SEGMENT_SUFFIX = ".jsonl"
+
+
+class _Uptime:
+    # seconds since boot from ticks_ms(), the wrap of the ticks counter is
+    # taken care of as long as it is read at least every few days
+    def __init__(self):
+        self.last = utime.ticks_ms()
+        self.ms = 0
+
+    def sec(self):
+        now = utime.ticks_ms()
+        self.ms += max(0, utime.ticks_diff(now, self.last))
+        self.last = now
+        return self.ms // 1000
+
+
+class UplinkSpool:
+    def __init__(self, storage, replay_fn, spool_dir=SPOOL_DIR, max_bytes=SPOOL_MAX_BYTES,
+                 max_age_sec=SPOOL_MAX_AGE_SEC, replay_batch=SPOOL_REPLAY_BATCH):
+        # storage: storage.WriteBehindStorage, appends go through its queue
+        # replay_fn: async (list of records) -> bool, False stops the replay until the next kick / interval
+        self.storage = storage
+        self.replay_fn = replay_fn
+        self.dir = spool_dir
+        self.max_bytes = max_bytes
+        self.max_age_sec = max_age_sec
+        self.replay_batch = replay_batch
+        self.uptime = _Uptime()
+        self.segments = []           # segment numbers, oldest first
+        self.boot_segments = set()   # segments from before this boot, their "t" means nothing now
+        self.seg_bytes = {}          # segment number -> bytes (including queued appends)
+        self.write_seg = None        # segment new records go to
+        self.to_remove = []          # paths of dropped segments, removed once queued appends are written
+        self.wakeup = asyncio.Event()
+        self.spooled_count = 0
+        self.replayed_count = 0
+        self.expired_count = 0
+        self.rejected_count = 0
+        self.dropped_count = 0
+        self._scan()
+
+    def _path(self, seg):
+        return f"{self.dir}/{SEGMENT_PREFIX}{seg}{SEGMENT_SUFFIX}"
+
+    def _scan(self):
+        # pick up segments left over from before a reboot
+        try:
+            names = os.listdir(self.dir)
+        except OSError as e:
+            logger.error(f"[SPOOL] can't list {self.dir}: {e}")
+            return
+        for name in names:
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+                continue
+            try:
+                seg = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                self.seg_bytes[seg] = os.stat(self._path(seg))[6]
+            except (ValueError, OSError):
+                continue
+            self.segments.append(seg)
+        self.segments.sort()
+        self.boot_segments = set(self.segments)
+        if self.segments:
+            logger.info(f"[SPOOL] {len(self.segments)} segments ({self.total_bytes()} bytes) waiting for replay")
+            self.wakeup.set()
+
+    def total_bytes(self):
+        return sum(self.seg_bytes.values())
+
+    def is_empty(self):
+        return not self.segments
+
+    def stats(self):
+        return f"spooled:{self.spooled_count}, replayed:{self.replayed_count}, rejected:{self.rejected_count}, expired:{self.expired_count}, dropped:{self.dropped_count}, segments:{len(self.segments)}, bytes:{self.total_bytes()}"
+
+    def kick(self):
+        # Input: None; Output: None (an upload went through, replay what is spooled)
+        if self.segments:
+            self.wakeup.set()
+
+    def _append(self, record):
+        line = json.dumps(record) + "\n"
+        seg = self.write_seg
+        if seg is None or self.seg_bytes.get(seg, 0) + len(line) > SPOOL_SEGMENT_BYTES:
+            seg = (self.segments[-1] + 1) if self.segments else 0
+            self.segments.append(seg)
+            self.seg_bytes[seg] = 0
+            self.write_seg = seg
+        self.storage.submit(self._path(seg), line, "a")
+        self.seg_bytes[seg] += len(line)
+        self.spooled_count += 1
+        while self.total_bytes() > self.max_bytes and len(self.segments) > 1:
+            self._drop_segment(self.segments[0])
+
+    def _drop_segment(self, seg):
+        self.segments.remove(seg)
+        self.boot_segments.discard(seg)
+        size = self.seg_bytes.pop(seg, 0)
+        if seg == self.write_seg:
+            self.write_seg = None
+        self.to_remove.append(self._path(seg))
+        self.wakeup.set()
+        self.dropped_count += 1
+        logger.warning(f"[SPOOL] spool over {self.max_bytes} bytes, dropped oldest segment {seg} ({size} bytes)")
+
+    def add_payload(self, payload, msg_typ, creator):
+        # Input: payload: dict, msg_typ: str, creator: int; Output: None (safe to call from non-async code)
+        self._append({"t": self.uptime.sec(), "m": msg_typ, "c": creator, "p": payload})
+        logger.info(f"[SPOOL] spooled msg_typ:{msg_typ} from node {creator}")
+
+    def add_image(self, creator, epoch_ms, enc_filepath, kind):
+        # Input: creator: int, epoch_ms: int, enc_filepath: str, kind: str; Output: None
+        self._append({"t": self.uptime.sec(), "m": "image", "c": creator, "e": epoch_ms, "f": enc_filepath, "k": kind})
+        logger.info(f"[SPOOL] spooled image {enc_filepath}")
+
+    def put_back(self, record):
+        # Input: record: dict as handed to replay_fn; Output: None
+        # (the server rejected it, spooled again with its original age so it still expires)
+        self._append(record)
+        self.spooled_count -= 1
+        self.rejected_count += 1
+
+    def _read_segment(self, seg):
+        records = []
+        try:
+            with open(self._path(seg), "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        logger.warning(f"[SPOOL] skipping broken record in segment {seg}")
+        except OSError as e:
+            logger.error(f"[SPOOL] can't read segment {seg}: {e}")
+        return records
+
+    async def _replay_segment(self, seg):
+        # Output: bool True if the whole segment went through (and is removed)
+        records = self._read_segment(seg)
+        now = self.uptime.sec()
+        fresh = []
+        for r in records:
+            if seg in self.boot_segments:
+                r["t"] = 0
+            if now - r.get("t", now) > self.max_age_sec:
+                self.expired_count += 1
+            else:
+                fresh.append(r)
+        records = None
+        done = 0
+        while done < len(fresh):
+            batch = fresh[done:done + self.replay_batch]
+            if not await self.replay_fn(batch):
+                break
+            done += len(batch)
+            self.replayed_count += len(batch)
+            await asyncio.sleep(0)
+        if seg not in self.segments:
+            return False  # dropped for space while we were uploading
+        if done < len(fresh):
+            # keep what did not go through, in order, for the next attempt
+            rest = "".join(json.dumps(r) + "\n" for r in fresh[done:])
+            self.storage.submit(self._path(seg), rest, "w")
+            self.seg_bytes[seg] = len(rest)
+            logger.info(f"[SPOOL] replay stopped, {len(fresh) - done} records left in segment {seg}")
+            return False
+        self.segments.remove(seg)
+        self.boot_segments.discard(seg)
+        self.seg_bytes.pop(seg, None)
+        self.to_remove.append(self._path(seg))
+        await self._remove_files()
+        if done:
+            logger.info(f"[SPOOL] replayed segment {seg}, {done} records")
+        return True
+
+    async def _remove_files(self):
+        if not self.to_remove:
+            return
+        await self.storage.flush()  # an append still in the queue would bring the file back
+        paths, self.to_remove = self.to_remove, []
+        async with self.storage.lock:
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    async def replay(self):
+        # Input: None; Output: bool True if the spool is empty afterwards
+        await self._remove_files()
+        last = self.segments[-1] if self.segments else -1  # records put back meanwhile wait for the next replay
+        while self.segments and self.segments[0] <= last:
+            seg = self.segments[0]
+            if seg == self.write_seg:
+                self.write_seg = None  # new records go to a new segment while this one is replayed
+            await self.storage.flush()  # appends queued for this segment are on the card
+            if not await self._replay_segment(seg):
+                return False
+        return not self.segments
+
+    async def run(self):
+        # Input: None; Output: None (replay task, start once with asyncio.create_task)
+        logger.info(f"[SPOOL] uplink spool started, {len(self.segments)} segments waiting")
+        while True:
+            try:
+                if self.segments:
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), SPOOL_REPLAY_INTERVAL_SEC)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await self.wakeup.wait()
+                self.wakeup.clear()
+                await self._remove_files()
+                if self.segments:
+                    await self.replay()
+            except Exception as e:
+                logger.error(f"[SPOOL] unexpected error in spool replay: {e}")
+                await asyncio.sleep(SPOOL_REPLAY_INTERVAL_SEC)
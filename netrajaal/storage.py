@@ -0,0 +1,154 @@
+import os
+import uasyncio as asyncio
+import utime
+from logger import logger
+
+# ---------------------------------------------------------------------------
+# Write-behind storage for the SD card
+# ---------------------------------------------------------------------------
+# Callers queue whole-file writes and return straight away, a single writer
+# task drains the queue and calls os.sync() according to the sync policy.
+# All waiting (settle time after a sync, time-bounded sync) is done with
+# awaitable sleeps so the radio loop keeps running while the card is busy.
+
+SYNC_IMMEDIATE = 0   # sync after every file
+SYNC_PER_BATCH = 1   # one sync per batch (e.g. per capture), see end_batch()
+SYNC_TIMED = 2       # sync at most every sync_interval_ms while there are unsynced writes
+
+SYNC_POLICY_NAMES = {
+    SYNC_IMMEDIATE: "immediate",
+    SYNC_PER_BATCH: "per-batch",
+    SYNC_TIMED: "timed",
+}
+
+DEFAULT_SETTLE_MS = 500          # pause after os.sync() before the next write
+DEFAULT_SYNC_INTERVAL_MS = 5000  # upper bound for unsynced data with SYNC_TIMED
+PENDING_WARN_SIZE = 16           # log when the queue grows beyond this
+
+_BATCH_END = None  # queue marker, path is None
+
+
+class WriteBehindStorage:
+    def __init__(self, lock, policy=SYNC_PER_BATCH, settle_ms=DEFAULT_SETTLE_MS,
+                 sync_interval_ms=DEFAULT_SYNC_INTERVAL_MS):
+        self.lock = lock                  # SD card write lock shared with other writers
+        self.policy = policy
+        self.settle_ms = settle_ms
+        self.sync_interval_ms = sync_interval_ms
+        self.pending = []                 # [(path, data, mode, on_done)]
+        self.unsynced = []                # on_done callbacks waiting for the next sync
+        self.dirty = False
+        self.wakeup = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.last_sync_ms = utime.ticks_ms()
+        self.write_count = 0
+        self.sync_count = 0
+        self.error_count = 0
+
+    def submit(self, path, data, mode="wb", on_done=None):
+        # Input: path: str, data: bytes/str, mode: str, on_done: callable(ok) or None; Output: None
+        # Safe to call from non-async code, e.g. process_message().
+        self.pending.append((path, data, mode, on_done))
+        if len(self.pending) > PENDING_WARN_SIZE:
+            logger.warning(f"[FS] write-behind queue has {len(self.pending)} pending writes")
+        self.idle.clear()
+        self.wakeup.set()
+
+    def end_batch(self):
+        # Input: None; Output: None (marks the end of a group of writes that share one sync)
+        self.submit(_BATCH_END, None)
+
+    async def flush(self):
+        # Input: None; Output: None (waits until everything queued so far is written and synced)
+        if self.pending or self.dirty:
+            self.end_batch()
+            if self.policy == SYNC_TIMED:
+                self.last_sync_ms = utime.ticks_add(utime.ticks_ms(), -self.sync_interval_ms)
+        await self.idle.wait()
+
+    def stats(self):
+        return f"writes:{self.write_count}, syncs:{self.sync_count}, errors:{self.error_count}, pending:{len(self.pending)}"
+
+    def _write_file(self, path, data, mode):
+        try:
+            with open(path, mode) as f:
+                f.write(data)
+            self.write_count += 1
+            return True
+        except Exception as e:
+            self.error_count += 1
+            logger.error(f"[FS] failed to write {path}: {e}")
+            return False
+
+    def _notify(self, callbacks, ok=True):
+        for on_done, res in callbacks:
+            if on_done is None:
+                continue
+            try:
+                on_done(ok and res)
+            except Exception as e:
+                logger.error(f"[FS] write callback failed: {e}")
+
+    async def _sync(self):
+        if not self.dirty:
+            return
+        ok = True
+        async with self.lock:
+            try:
+                os.sync()  # Force filesystem sync to SD card
+                self.sync_count += 1
+            except Exception as e:
+                ok = False
+                self.error_count += 1
+                logger.error(f"[FS] os.sync failed: {e}")
+        self.dirty = False
+        self.last_sync_ms = utime.ticks_ms()
+        done, self.unsynced = self.unsynced, []
+        self._notify(done, ok)
+        if self.settle_ms > 0:
+            await asyncio.sleep(self.settle_ms / 1000)
+
+    async def _drain(self):
+        while self.pending:
+            path, data, mode, on_done = self.pending.pop(0)
+            if path is _BATCH_END:
+                if self.policy != SYNC_TIMED:
+                    await self._sync()
+                continue
+            async with self.lock:
+                ok = self._write_file(path, data, mode)
+            data = None
+            self.dirty = self.dirty or ok
+            if self.policy == SYNC_TIMED or not ok:
+                # durability is time-bounded, report as soon as the data is in the FS
+                self._notify([(on_done, ok)])
+            else:
+                self.unsynced.append((on_done, ok))
+                if self.policy == SYNC_IMMEDIATE:
+                    await self._sync()
+            await asyncio.sleep(0)  # let the radio loop in between files
+
+    async def run(self):
+        # Input: None; Output: None (writer task, start once with asyncio.create_task)
+        logger.info(f"[FS] write-behind storage started, sync policy = {SYNC_POLICY_NAMES.get(self.policy)}")
+        while True:
+            try:
+                if self.policy == SYNC_TIMED and self.dirty:
+                    remaining = self.sync_interval_ms - utime.ticks_diff(utime.ticks_ms(), self.last_sync_ms)
+                    if remaining <= 0:
+                        await self._sync()
+                    else:
+                        try:
+                            await asyncio.wait_for(self.wakeup.wait(), remaining / 1000)
+                        except asyncio.TimeoutError:
+                            pass
+                else:
+                    await self.wakeup.wait()
+                self.wakeup.clear()
+                await self._drain()
+                if not self.pending and not self.dirty:
+                    self.idle.set()
+            except Exception as e:
+                logger.error(f"[FS] unexpected error in write-behind loop: {e}")
+                await asyncio.sleep(1)
@@ -0,0 +1,154 @@
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+try:
+    from utime import ticks_us, ticks_diff
+except ImportError:
+    import time
+
+    def ticks_us():
+        return int(time.monotonic() * 1000000) & 0x3FFFFFFF
+
+    def ticks_diff(new, old):
+        d = (new - old) & 0x3FFFFFFF
+        return d - 0x40000000 if d >= 0x20000000 else d
+
+# ---------------------------------------------------------------------------
+# Task profiler
+# ---------------------------------------------------------------------------
+# Measures how long every long running task of main() keeps the event loop
+# between two yields (a step), and how late the loop wakes a task that asked
+# to sleep. A blocking utime.sleep_ms(), gc.collect(), RSA or os.sync() in
+# any task shows up as loop lag, and as a long step of the task that did it.
+#
+# Tasks started with spawn() run inside ProfiledTask, which times every
+# send()/throw() into the coroutine. Per task it keeps steps, total and
+# longest step, and a histogram of step times in RAM:
+#
+#   bucket 0: < 1 ms, bucket i: < 2**i ms, last bucket: everything longer
+#
+# run() is the lag probe: it sleeps LAG_PROBE_MS at a time and records how
+# much later than that it got the loop back. summary() is one log line,
+# take_peaks() the worst lag and step since the previous call (heartbeat).
+
+LAG_PROBE_MS = 100       # the probe asks to be woken up this often
+HIST_BUCKETS = 12        # last bucket starts at 2**10 = 1024 ms
+TOP_TASKS = 5            # tasks in summary(), most loop time first
+LAG_TASK = "loop lag"
+
+
+class TaskStats:
+    def __init__(self, name):
+        self.name = name
+        self.steps = 0
+        self.total_us = 0
+        self.max_us = 0
+        self.peak_us = 0          # longest step since take_peaks()
+        self.hist = [0] * HIST_BUCKETS
+
+    def record(self, us):
+        # Input: us: int duration in microseconds; Output: None
+        self.steps += 1
+        self.total_us += us
+        if us > self.max_us:
+            self.max_us = us
+        if us > self.peak_us:
+            self.peak_us = us
+        ms = us // 1000
+        b = 0
+        while ms and b < HIST_BUCKETS - 1:
+            ms >>= 1
+            b += 1
+        self.hist[b] += 1
+
+    def percentile_ms(self, p):
+        # Input: p: float 0..1; Output: int upper bound (ms) of the bucket holding that share of the steps
+        if not self.steps:
+            return 0
+        want = p * self.steps
+        seen = 0
+        for b, n in enumerate(self.hist):
+            seen += n
+            if seen >= want:
+                return 1 << b
+        return 1 << (HIST_BUCKETS - 1)
+
+    def describe(self):
+        return (f"{self.name} {self.steps}x {self.total_us // 1000}ms p95<{self.percentile_ms(0.95)}ms "
+                f"max {self.max_us // 1000}ms")
+
+
+class ProfiledTask:
+    # Coroutine protocol around another coroutine: uasyncio and CPython asyncio
+    # both drive a task through send() / throw() only.
+    def __init__(self, coro, stats):
+        self.coro = coro
+        self.stats = stats
+
+    def send(self, value):
+        t0 = ticks_us()
+        try:
+            return self.coro.send(value)
+        finally:
+            self.stats.record(ticks_diff(ticks_us(), t0))
+
+    def throw(self, *args):
+        t0 = ticks_us()
+        try:
+            return self.coro.throw(*args)
+        finally:
+            self.stats.record(ticks_diff(ticks_us(), t0))
+
+    def close(self):
+        return self.coro.close()
+
+    def __await__(self):
+        return self
+
+    __iter__ = __await__
+
+    def __next__(self):
+        return self.send(None)
+
+
+class TaskProfiler:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.tasks = {}           # name -> TaskStats
+        self.lag = TaskStats(LAG_TASK)
+
+    def spawn(self, name, coro):
+        # Input: name: str, coro: coroutine; Output: task of asyncio.create_task()
+        if not self.enabled:
+            return asyncio.create_task(coro)
+        stats = self.tasks.get(name)
+        if stats is None:
+            stats = self.tasks[name] = TaskStats(name)
+        return asyncio.create_task(ProfiledTask(coro, stats))
+
+    async def run(self, interval_ms=LAG_PROBE_MS):
+        # Input: interval_ms: int; Output: None (records loop lag forever)
+        while True:
+            t0 = ticks_us()
+            await asyncio.sleep_ms(interval_ms)
+            late = ticks_diff(ticks_us(), t0) - interval_ms * 1000
+            self.lag.record(late if late > 0 else 0)
+
+    def take_peaks(self):
+        # Input: None; Output: tuple(int worst loop lag ms, int longest task step ms) since the previous call
+        step = 0
+        for s in self.tasks.values():
+            if s.peak_us > step:
+                step = s.peak_us
+            s.peak_us = 0
+        lag = self.lag.peak_us
+        self.lag.peak_us = 0
+        return lag // 1000, step // 1000
+
+    def summary(self, top=TOP_TASKS):
+        # Input: top: int; Output: str, loop lag and the tasks that held the loop longest
+        if not self.enabled:
+            return "off"
+        busiest = sorted(self.tasks.values(), key=lambda s: s.total_us, reverse=True)[:top]
+        return ", ".join([self.lag.describe()] + [s.describe() for s in busiest])
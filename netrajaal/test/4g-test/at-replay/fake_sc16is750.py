@@ -0,0 +1,103 @@
+"""
+Fake SC16IS750 SPI-UART bridge that replays a recorded AT transcript.
+
+Runs on a computer, stands in for sc16is750.SC16IS750 (any(),
+read_available(), write()). Transcript lines:
+
+    # comment
+    > AT+HTTPINIT          host must send this command (a trailing * matches any rest of line)
+    >>                     host sends the raw body announced by the last AT+HTTPDATA=<len>,...
+    < OK                   modem answers this line
+    @ 1500                 the following answers arrive 1500 ms later
+
+Answers before the first ">" are sent right away (boot URCs etc.).
+"""
+import time
+
+
+class FakeSC16IS750:
+    def __init__(self, path):
+        self.steps = []
+        with open(path) as f:
+            for raw in f:
+                line = raw.rstrip("\r\n")
+                if not line.strip() or line.startswith("#"):
+                    continue
+                if line.startswith(">>"):
+                    self.steps.append((">>", None))
+                elif line.startswith(">"):
+                    self.steps.append((">", line[1:].strip()))
+                elif line.startswith("<"):
+                    self.steps.append(("<", line[1:].strip()))
+                elif line.startswith("@"):
+                    self.steps.append(("@", int(line[1:].strip())))
+                else:
+                    raise ValueError(f"bad transcript line: {line}")
+        self.idx = 0
+        self.tx = b""
+        self.rx = b""
+        self.pending = []      # [(release time in sec, bytes)]
+        self.errors = []
+        self.body_len = 0
+        self.bytes_written = 0
+        self._schedule()
+
+    def _now(self):
+        return time.monotonic()
+
+    def _schedule(self):
+        t = self._now()
+        while self.idx < len(self.steps) and self.steps[self.idx][0] in ("<", "@"):
+            kind, arg = self.steps[self.idx]
+            if kind == "@":
+                t += arg / 1000
+            else:
+                self.pending.append((t, arg.encode() + b"\r\n"))
+            self.idx += 1
+
+    def _match(self):
+        while self.idx < len(self.steps):
+            kind, arg = self.steps[self.idx]
+            if kind == ">":
+                i = self.tx.find(b"\r\n")
+                if i < 0:
+                    return
+                sent = self.tx[:i].decode()
+                self.tx = self.tx[i + 2:]
+                ok = sent.startswith(arg[:-1]) if arg.endswith("*") else sent == arg
+                if not ok:
+                    self.errors.append(f"step {self.idx}: expected {arg!r}, host sent {sent!r}")
+                if sent.startswith("AT+HTTPDATA="):
+                    self.body_len = int(sent.split("=")[1].split(",")[0])
+            elif kind == ">>":
+                if len(self.tx) < self.body_len:
+                    return
+                self.tx = self.tx[self.body_len:]
+            else:
+                return
+            self.idx += 1
+            self._schedule()
+
+    # --- SC16IS750 interface used by cellular_driver.ATChannel ---
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.bytes_written += len(data)
+        self.tx += data
+        self._match()
+
+    def any(self):
+        now = self._now()
+        while self.pending and self.pending[0][0] <= now:
+            self.rx += self.pending.pop(0)[1]
+        return len(self.rx)
+
+    def read_available(self, max_bytes=64):
+        self.any()
+        data = self.rx[:max_bytes]
+        self.rx = self.rx[max_bytes:]
+        return data
+
+    def finished(self):
+        return self.idx >= len(self.steps) and not self.pending and not self.errors
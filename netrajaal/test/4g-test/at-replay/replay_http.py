@@ -0,0 +1,56 @@
+"""
+Replays recorded AT transcripts against Cellular's async HTTP client.
+
+Runs on a computer, NOT on the OpenMV board:
+    python test/4g-test/at-replay/replay_http.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.abspath(os.path.join(HERE, "..", "..", "..")))  # netrajaal/
+
+from cellular_driver import Cellular
+from fake_sc16is750 import FakeSC16IS750
+
+URL = "https://hqapi.vyomos.org/watchmen-detect/"
+
+# transcript -> expected HTTP status per upload (None = upload fails)
+SCENARIOS = [
+    ("http_post_keepalive.txt", [200, 200]),
+    ("http_peer_closed.txt", [200, 713]),
+]
+
+
+async def run_scenario(name, expected):
+    fake = FakeSC16IS750(os.path.join(HERE, "transcripts", name))
+    cell = Cellular(uart=fake)
+    cell.connected = True
+    statuses = []
+    for i in range(len(expected)):
+        # give late URCs of the previous upload a chance to arrive
+        await asyncio.sleep(0.2)
+        t0 = time.monotonic()
+        result = await cell.upload_data_async({"machine_id": 219, "message_type": "heartbeat", "n": i}, URL)
+        status = result["status_code"] if result else None
+        statuses.append(status)
+        print(f"  upload {i}: status={status}, {time.monotonic() - t0:.2f}s, text={result['text'] if result else None!r}")
+    ok = statuses == expected and fake.finished()
+    for err in fake.errors:
+        print(f"  {err}")
+    if fake.idx < len(fake.steps):
+        print(f"  transcript not finished, stopped at step {fake.idx}: {fake.steps[fake.idx]}")
+    print(f"{'PASS' if ok else 'FAIL'} {name}")
+    return ok
+
+
+async def main():
+    results = [await run_scenario(name, expected) for name, expected in SCENARIOS]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,134 @@
+"""
+Mock server for the resumable image upload (see resumable_upload.py).
+
+Runs on a computer:
+    python test/resumable-upload/mock_server.py --port 8090 --out /tmp/uploads --fail-rate 0.2
+
+--fail-rate    answer this fraction of parts with HTTP 500 without storing them
+--lose-rate    store this fraction of parts but answer HTTP 500 (the reply is "lost")
+"""
+import argparse
+import json
+import os
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+BASE_PATH = "/upload"    # endpoints are <BASE_PATH>/start, /part and /finish
+
+
+class UploadStore:
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.lock = threading.Lock()
+        self.uploads = {}    # upload_id -> {"key", "size", "data": bytearray}
+        self.by_key = {}     # (machine_id, epoch_ms, image_kind) -> upload_id
+        self.next_id = 1
+        self.finished = []   # file paths
+        os.makedirs(out_dir, exist_ok=True)
+
+    def start(self, req):
+        key = (req["machine_id"], req["epoch_ms"], req.get("image_kind", "full"))
+        with self.lock:
+            upload_id = self.by_key.get(key)
+            if upload_id is None or self.uploads[upload_id]["size"] != req["size"]:
+                upload_id = f"u{self.next_id}"
+                self.next_id += 1
+                self.uploads[upload_id] = {"key": key, "size": req["size"], "data": bytearray()}
+                self.by_key[key] = upload_id
+            return upload_id, len(self.uploads[upload_id]["data"])
+
+    def part(self, upload_id, offset, body):
+        with self.lock:
+            up = self.uploads.get(upload_id)
+            if up is None:
+                return 404, {"error": "unknown upload_id"}
+            if offset != len(up["data"]):
+                return 409, {"offset": len(up["data"])}
+            up["data"] += body[:up["size"] - offset]
+            return 200, {"offset": len(up["data"])}
+
+    def finish(self, upload_id):
+        with self.lock:
+            up = self.uploads.get(upload_id)
+            if up is None:
+                return 404, {"ok": False, "error": "unknown upload_id"}
+            if len(up["data"]) != up["size"]:
+                return 400, {"ok": False, "error": f"have {len(up['data'])} of {up['size']} bytes"}
+            machine_id, epoch_ms, kind = up["key"]
+            path = os.path.join(self.out_dir, f"{machine_id}_{epoch_ms}_{kind}.enc")
+            with open(path, "wb") as f:
+                f.write(up["data"])
+            self.finished.append(path)
+            return 200, {"ok": True}
+
+
+def make_handler(store, fail_rate=0.0, lose_rate=0.0, quiet=True):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            if not quiet:
+                super().log_message(fmt, *args)
+
+        def _reply(self, status, obj):
+            body = json.dumps(obj).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            qs = parse_qs(url.query)
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            base, _, route = url.path.rstrip("/").rpartition("/")
+            if base != BASE_PATH:
+                self._reply(404, {"error": "not found"})
+                return
+            if route == "start":
+                upload_id, offset = store.start(json.loads(body))
+                self._reply(200, {"upload_id": upload_id, "offset": offset})
+            elif route == "part":
+                if random.random() < fail_rate:
+                    self._reply(500, {"error": "injected failure"})
+                    return
+                status, resp = store.part(qs["upload_id"][0], int(qs["offset"][0]), body)
+                if status == 200 and random.random() < lose_rate:
+                    self._reply(500, {"error": "injected lost reply"})
+                    return
+                self._reply(status, resp)
+            elif route == "finish":
+                status, resp = store.finish(qs["upload_id"][0])
+                self._reply(status, resp)
+            else:
+                self._reply(404, {"error": "not found"})
+    return Handler
+
+
+def serve(port, out_dir, fail_rate=0.0, lose_rate=0.0, quiet=True):
+    # Input: port: int (0 = any free port), out_dir: str; Output: tuple(server, store), server runs in a thread
+    store = UploadStore(out_dir)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(store, fail_rate, lose_rate, quiet))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock server for resumable image uploads")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--out", default="uploads")
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--lose-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    store = UploadStore(args.out)
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), make_handler(store, args.fail_rate, args.lose_rate, quiet=False))
+    print(f"listening on :{args.port}, writing finished uploads to {args.out}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
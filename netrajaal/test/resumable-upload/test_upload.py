@@ -0,0 +1,105 @@
+"""
+Uploads random "images" to the mock server with injected failures and an
+interrupted upload, and checks the server ends up with identical files.
+
+Runs on a computer, NOT on the OpenMV board:
+    python test/resumable-upload/test_upload.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import urllib.error
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.abspath(os.path.join(HERE, "..", "..")))  # netrajaal/
+
+import resumable_upload
+from resumable_upload import ResumableUploader
+import mock_server
+
+resumable_upload.PART_RETRY_PAUSE = 0.01
+
+
+def http_post(url, body, content_type):
+    if isinstance(body, str):
+        body = body.encode()
+    req = urllib.request.Request(url, data=bytes(body), headers={"Content-Type": content_type}, method="POST")
+    try:
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return resp.status, resp.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+    except OSError:
+        return None, ""
+
+
+async def post_fn(url, body, content_type):
+    return await asyncio.to_thread(http_post, url, body, content_type)
+
+
+def make_post_fn_dying_after(n_parts):
+    # link goes away after n_parts parts
+    count = [0]
+    async def post(url, body, content_type):
+        if "/part" in url:
+            count[0] += 1
+            if count[0] > n_parts:
+                return None, ""
+        return await post_fn(url, body, content_type)
+    return post
+
+
+def same_file(a, b):
+    with open(a, "rb") as fa, open(b, "rb") as fb:
+        return fa.read() == fb.read()
+
+
+async def main():
+    ok = True
+    tmp = tempfile.mkdtemp()
+    server, store = mock_server.serve(0, os.path.join(tmp, "server"), fail_rate=0.2, lose_rate=0.1)
+    base = f"http://127.0.0.1:{server.server_port}/upload"
+
+    # 1. flaky link: parts fail or lose their reply, retried until done
+    src = os.path.join(tmp, "221_1000.enc")
+    with open(src, "wb") as f:
+        f.write(os.urandom(50_000))
+    up = ResumableUploader(base, post_fn, part_size=4096)
+    res = await up.upload_file(src, 221, 1000, "full")
+    for _ in range(5):
+        if res:
+            break
+        res = await up.upload_file(src, 221, 1000, "full")
+    good = res is True and same_file(src, os.path.join(tmp, "server", "221_1000_full.enc"))
+    print(f"{'PASS' if good else 'FAIL'} flaky link: {up.stats()}")
+    ok = ok and good
+
+    # 2. link dies half way, a new uploader (reboot) resumes from the sidecar / server offset
+    src = os.path.join(tmp, "222_2000.enc")
+    with open(src, "wb") as f:
+        f.write(os.urandom(30_000))
+    server.RequestHandlerClass = mock_server.make_handler(store)  # no injected failures
+    first = await ResumableUploader(base, make_post_fn_dying_after(3), part_size=4096).upload_file(src, 222, 2000, "preview")
+    has_sidecar = os.path.exists(src + resumable_upload.PROGRESS_SUFFIX)
+    up = ResumableUploader(base, post_fn, part_size=4096)
+    second = await up.upload_file(src, 222, 2000, "preview")
+    good = (first is False and has_sidecar and second is True and up.parts_sent == 5
+            and not os.path.exists(src + resumable_upload.PROGRESS_SUFFIX)
+            and same_file(src, os.path.join(tmp, "server", "222_2000_preview.enc")))
+    print(f"{'PASS' if good else 'FAIL'} resume after interruption: first={first}, second={second}, {up.stats()}")
+    ok = ok and good
+
+    # 3. server without the endpoint -> None, caller falls back to the single JSON upload
+    res = await ResumableUploader(f"http://127.0.0.1:{server.server_port}/nothing", post_fn).upload_file(src, 222, 2000)
+    print(f"{'PASS' if res is None else 'FAIL'} unsupported server: {res}")
+    ok = ok and res is None
+
+    server.shutdown()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,141 @@
+from logger import logger
+
+# ---------------------------------------------------------------------------
+# Image transfer budget
+# ---------------------------------------------------------------------------
+# Decides how many LoRa chunks an image may use, from the quality of the link
+# to the next hop and the number of images already waiting, and picks jpeg
+# quality / resolution / crop so the encrypted image fits that budget.
+
+CHUNK_BYTES = 200            # payload bytes per "I" chunk, see make_chunks()
+ENC_OVERHEAD_BYTES = 272     # hybrid encryption: 2 RSA blocks (AES key + IV) + AES padding
+MIN_IMAGE_CHUNKS = 15        # never squeeze an image below this (~3KB)
+MAX_IMAGE_CHUNKS = 250       # budget on a perfect link with an empty queue (~50KB)
+QUEUE_DEPTH_SCALE = 4        # budget is divided by (1 + queued_images / QUEUE_DEPTH_SCALE)
+
+ACK_EWMA_ALPHA = 0.2         # weight of the newest ack result in the success rate
+RSSI_GOOD = -90              # dBm, at or above this RSSI does not reduce the budget
+RSSI_POOR = -120             # dBm, at or below this the RSSI factor is RSSI_MIN_FACTOR
+RSSI_MIN_FACTOR = 0.3
+
+QUALITY_STEPS = (50, 35, 20, 10)
+SCALE_STEPS = (1.0, 0.5, 0.25, 0.125)
+
+MOTION_SCALE = 0.0625        # motion is detected on a 1/16 grayscale thumbnail
+MOTION_THRESHOLD = 40        # pixel difference that counts as motion
+MOTION_MIN_PIXELS = 4        # ignore blobs smaller than this (thumbnail pixels)
+ROI_PAD = 0.25               # grow the motion box by this fraction on every side
+ROI_MAX_AREA = 0.7           # a box covering more of the frame than this is not worth cropping
+
+
+def max_bytes_for_chunks(chunks):
+    # Input: chunks: int; Output: int max jpeg size that still fits after encryption
+    return chunks * CHUNK_BYTES - ENC_OVERHEAD_BYTES
+
+
+def chunk_budget(link_quality, queue_depth):
+    # Input: link_quality: float 0..1, queue_depth: int images waiting; Output: int chunks
+    budget = MAX_IMAGE_CHUNKS * link_quality / (1 + queue_depth / QUEUE_DEPTH_SCALE)
+    return int(max(MIN_IMAGE_CHUNKS, min(MAX_IMAGE_CHUNKS, budget)))
+
+
+class LinkStats:
+    def __init__(self):
+        self.ack_rate = {}   # addr -> EWMA of ack success (1.0 = every packet acked first time)
+        self.rssi = {}       # addr -> last RSSI in dBm
+
+    def record_ack(self, addr, acked):
+        # Input: addr: int, acked: bool; Output: None
+        sample = 1.0 if acked else 0.0
+        prev = self.ack_rate.get(addr)
+        if prev is None:
+            self.ack_rate[addr] = sample
+        else:
+            self.ack_rate[addr] = prev + ACK_EWMA_ALPHA * (sample - prev)
+
+    def record_rssi(self, addr, rssi):
+        # Input: addr: int, rssi: int dBm; Output: None
+        self.rssi[addr] = rssi
+
+    def quality(self, addr):
+        # Input: addr: int; Output: float 0..1, unknown links are assumed good
+        q = self.ack_rate.get(addr, 1.0)
+        rssi = self.rssi.get(addr)
+        if rssi is not None and rssi < RSSI_GOOD:
+            frac = (rssi - RSSI_POOR) / (RSSI_GOOD - RSSI_POOR)
+            q *= RSSI_MIN_FACTOR + (1 - RSSI_MIN_FACTOR) * max(0.0, frac)
+        return q
+
+    def summary(self):
+        return ", ".join(f"{a}:{self.quality(a):.2f}" for a in self.ack_rate)
+
+
+class MotionROI:
+    # Keeps a small grayscale copy of the previous capture and returns the
+    # box around what changed since then, in full frame coordinates.
+    def __init__(self):
+        self.prev = None
+
+    def update(self, img):
+        # Input: img: image.Image (uncompressed snapshot); Output: tuple(x, y, w, h) or None
+        try:
+            small = img.to_grayscale(x_scale=MOTION_SCALE, y_scale=MOTION_SCALE, copy=True)
+        except Exception as e:
+            logger.warning(f"[BUDGET] motion thumbnail failed: {e}")
+            return None
+        prev = self.prev
+        self.prev = small
+        if prev is None or prev.width() != small.width() or prev.height() != small.height():
+            return None
+        diff = small.copy()
+        diff.difference(prev)
+        blobs = diff.find_blobs([(MOTION_THRESHOLD, 255)], pixels_threshold=MOTION_MIN_PIXELS,
+                                area_threshold=MOTION_MIN_PIXELS, merge=True)
+        if not blobs:
+            return None
+        x0 = min(b.x() for b in blobs)
+        y0 = min(b.y() for b in blobs)
+        x1 = max(b.x() + b.w() for b in blobs)
+        y1 = max(b.y() + b.h() for b in blobs)
+        pad_x = int((x1 - x0) * ROI_PAD) + 1
+        pad_y = int((y1 - y0) * ROI_PAD) + 1
+        x0 = max(0, x0 - pad_x)
+        y0 = max(0, y0 - pad_y)
+        x1 = min(small.width(), x1 + pad_x)
+        y1 = min(small.height(), y1 + pad_y)
+        if (x1 - x0) * (y1 - y0) > ROI_MAX_AREA * small.width() * small.height():
+            return None
+        f = 1 / MOTION_SCALE
+        return (int(x0 * f), int(y0 * f), int((x1 - x0) * f), int((y1 - y0) * f))
+
+
+def _encode(img, q, scale, region):
+    if region is None:
+        return img.to_jpeg(quality=q, x_scale=scale, y_scale=scale, copy=True)
+    return img.to_jpeg(quality=q, x_scale=scale, y_scale=scale, roi=region, copy=True)
+
+
+def fit_to_budget(img, budget_chunks, roi=None):
+    # Input: img: image.Image uncompressed snapshot, budget_chunks: int, roi: tuple or None
+    # Output: tuple(jpeg image.Image, str description) - smallest tried variant if nothing fits
+    # At every scale and quality the whole frame is tried before the motion crop,
+    # so a crop is only sent when the whole frame at that setting is too big.
+    # Only one candidate is alive at a time (the caller may still hold the HD jpeg):
+    # the smallest one is remembered by its settings and encoded again if nothing fits.
+    max_bytes = max_bytes_for_chunks(budget_chunks)
+    regions = (None, roi) if roi else (None,)
+    best = None                       # (size, q, scale, region)
+    for scale in SCALE_STEPS:
+        for q in QUALITY_STEPS:
+            for region in regions:
+                jpg = _encode(img, q, scale, region)
+                size = jpg.size()
+                if size <= max_bytes:
+                    return jpg, f"q={q}, scale={scale}, roi={region}, {size} bytes"
+                jpg = None
+                if best is None or size < best[0]:
+                    best = (size, q, scale, region)
+    size, q, scale, region = best
+    desc = f"q={q}, scale={scale}, roi={region}, {size} bytes"
+    logger.warning(f"[BUDGET] nothing fits {budget_chunks} chunks, using smallest: {desc}")
+    return _encode(img, q, scale, region), desc
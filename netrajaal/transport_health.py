@@ -0,0 +1,153 @@
+import uasyncio as asyncio
+import utime
+from logger import logger
+
+# ---------------------------------------------------------------------------
+# Uplink transport health
+# ---------------------------------------------------------------------------
+# Keeps rolling success rate and latency per uplink transport (cellular, WiFi)
+# and a circuit breaker for each:
+#
+#   closed     transport is used
+#   open       FAIL_THRESHOLD failures in a row, not used for backoff_ms;
+#              the probe task checks it in the background once that runs out
+#   half-open  probe went through, the next real upload is the trial:
+#              success closes the breaker, failure opens it with twice the backoff
+#
+# Callers ask order() which transports to try and report every attempt with
+# record(), so a hung modem costs one round of AT timeouts instead of one per
+# upload.
+
+CLOSED = 0
+OPEN = 1
+HALF_OPEN = 2
+STATE_NAMES = {CLOSED: "closed", OPEN: "open", HALF_OPEN: "half-open"}
+
+FAIL_THRESHOLD = 2              # failures in a row that open the breaker
+BACKOFF_BASE_MS = 30000         # first open period
+BACKOFF_MAX_MS = 600000         # open period doubles up to this
+EWMA_ALPHA = 0.2                # weight of the newest attempt in success rate / latency
+LATENCY_SCALE_MS = 5000         # score halves at this average latency
+SWITCH_MARGIN = 0.2             # the preferred transport keeps traffic unless another scores this much better
+PROBE_INTERVAL_SEC = 5          # how often the probe task looks for open breakers that are due
+
+
+class TransportHealth:
+    def __init__(self, name, probe_fn=None):
+        # probe_fn: async () -> bool, cheap check that the transport is usable again
+        self.name = name
+        self.probe_fn = probe_fn
+        self.state = CLOSED
+        self.success_rate = 1.0
+        self.latency_ms = 0
+        self.fail_streak = 0
+        self.backoff_ms = BACKOFF_BASE_MS
+        self.opened_at = 0
+        self.attempts = 0
+        self.failures = 0
+
+    def score(self):
+        return self.success_rate / (1 + self.latency_ms / LATENCY_SCALE_MS)
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = utime.ticks_ms()
+        logger.warning(f"[NET] {self.name} marked down for {self.backoff_ms // 1000}s after {self.fail_streak} failures")
+
+    def record(self, ok, latency_ms):
+        # Input: ok: bool, latency_ms: int; Output: None
+        self.attempts += 1
+        sample = 1.0 if ok else 0.0
+        self.success_rate += EWMA_ALPHA * (sample - self.success_rate)
+        if ok:
+            self.latency_ms += EWMA_ALPHA * (latency_ms - self.latency_ms)
+            self.fail_streak = 0
+            if self.state != CLOSED:
+                logger.info(f"[NET] {self.name} is back up")
+            self.state = CLOSED
+            self.backoff_ms = BACKOFF_BASE_MS
+            return
+        self.failures += 1
+        self.fail_streak += 1
+        if self.state == HALF_OPEN:
+            self.backoff_ms = min(self.backoff_ms * 2, BACKOFF_MAX_MS)
+            self._open()
+        elif self.state == CLOSED and self.fail_streak >= FAIL_THRESHOLD:
+            self._open()
+
+    def probe_due(self):
+        return self.state == OPEN and utime.ticks_diff(utime.ticks_ms(), self.opened_at) >= self.backoff_ms
+
+    def summary(self):
+        return f"{self.name}:{STATE_NAMES[self.state]} {self.success_rate:.2f} {int(self.latency_ms)}ms"
+
+
+class TransportSelector:
+    def __init__(self):
+        self.transports = []    # registration order = preference order
+
+    def add(self, name, probe_fn=None):
+        # Input: name: str, probe_fn: async () -> bool or None; Output: TransportHealth
+        t = TransportHealth(name, probe_fn)
+        self.transports.append(t)
+        return t
+
+    def get(self, name):
+        for t in self.transports:
+            if t.name == name:
+                return t
+        return None
+
+    def order(self):
+        # Input: None; Output: list of transport names to try, best first (open breakers left out)
+        usable = [t for t in self.transports if t.state != OPEN]
+        if not usable:
+            return []
+        best = max(usable, key=lambda t: t.score())
+        preferred = usable[0]
+        if preferred is not best and preferred.score() + SWITCH_MARGIN >= best.score():
+            best = preferred
+        for t in usable:
+            if t.state == HALF_OPEN:
+                best = t  # give the recovered transport its trial upload
+                break
+        return [best.name] + [t.name for t in usable if t is not best]
+
+    def record(self, name, ok, latency_ms):
+        # Input: name: str, ok: bool, latency_ms: int; Output: None
+        t = self.get(name)
+        if t is not None:
+            t.record(ok, latency_ms)
+
+    def summary(self):
+        return ", ".join(t.summary() for t in self.transports)
+
+    async def _probe(self, t):
+        ok = False
+        start = utime.ticks_ms()
+        try:
+            ok = await t.probe_fn()
+        except Exception as e:
+            logger.warning(f"[NET] probe of {t.name} failed: {e}")
+        if ok:
+            t.state = HALF_OPEN
+            logger.info(f"[NET] probe of {t.name} ok in {utime.ticks_diff(utime.ticks_ms(), start)} ms, trying it again")
+        else:
+            t.backoff_ms = min(t.backoff_ms * 2, BACKOFF_MAX_MS)
+            t.opened_at = utime.ticks_ms()
+            logger.info(f"[NET] {t.name} still down, next probe in {t.backoff_ms // 1000}s")
+
+    async def run(self):
+        # Input: None; Output: None (probe task, start once with asyncio.create_task)
+        logger.info(f"[NET] transport health started: {', '.join(t.name for t in self.transports)}")
+        while True:
+            try:
+                for t in self.transports:
+                    if t.probe_due():
+                        if t.probe_fn is None:
+                            t.state = HALF_OPEN  # nothing to probe with, let the next upload be the trial
+                        else:
+                            await self._probe(t)
+            except Exception as e:
+                logger.error(f"[NET] unexpected error in transport probe: {e}")
+            await asyncio.sleep(PROBE_INTERVAL_SEC)
@@ -0,0 +1,168 @@
+import json
+import uasyncio as asyncio
+import utime
+from logger import logger
+
+# ---------------------------------------------------------------------------
+# Uplink batching for the command center
+# ---------------------------------------------------------------------------
+# Heartbeats and event texts are small, every upload over cellular costs a
+# full AT sequence (HTTPPARA, HTTPDATA, HTTPACTION, HTTPREAD). The batcher
+# collects payloads for a short window (or until a size cap) and uploads
+# them as one JSON array POST.
+#
+# The server answers a batch with HTTP 200 and optionally per item results,
+# in the same order as the posted array:
+#     {"results": [{"ok": true}, {"ok": false, "error": "..."}, ...]}
+# Without "results" a 200 means every item was accepted. Items that failed are
+# retried in the next batch, up to UPLINK_MAX_ATTEMPTS times. Items given up
+# on (or pushed out of a full queue) are handed to on_drop, e.g. the SD spool.
+
+UPLINK_WINDOW_SEC = 5          # wait this long after the first item for more to arrive
+UPLINK_MAX_ITEMS = 25          # upload straight away once this many items are waiting
+UPLINK_MAX_BYTES = 8000        # ... or once the JSON body would get this big
+UPLINK_MAX_QUEUE = 200         # oldest items are dropped beyond this
+UPLINK_MAX_ATTEMPTS = 5        # give up on an item after this many failed uploads
+UPLINK_FAILED_PAUSE = 10       # seconds to wait after a failed batch upload
+
+
+def item_result(results, i):
+    # Input: results: list from the "results" of a batch reply, i: int; Output: tuple(bool ok, error or None)
+    if i >= len(results):
+        return True, None
+    r = results[i]
+    if isinstance(r, dict):
+        return r.get("ok", True), r.get("error")
+    return bool(r), None
+
+
+class UplinkBatcher:
+    def __init__(self, upload_fn, window_sec=UPLINK_WINDOW_SEC, max_items=UPLINK_MAX_ITEMS,
+                 max_bytes=UPLINK_MAX_BYTES, on_drop=None):
+        # upload_fn: async (payload_list, on_response) -> bool, on_response(dict) gets the parsed reply
+        # on_drop: callable(payload, msg_typ, creator) or None
+        self.upload_fn = upload_fn
+        self.on_drop = on_drop
+        self.window_sec = window_sec
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.pending = []            # [[payload, msg_typ, creator, size, attempts]]
+        self.pending_bytes = 0
+        self.wakeup = asyncio.Event()
+        self.full = asyncio.Event()
+        self.batch_count = 0
+        self.sent_count = 0
+        self.failed_count = 0
+        self.dropped_count = 0
+
+    def submit(self, payload, msg_typ, creator):
+        # Input: payload: dict, msg_typ: str, creator: int; Output: None
+        size = len(json.dumps(payload)) + 1  # + separator in the array
+        self.pending.append([payload, msg_typ, creator, size, 0])
+        self.pending_bytes += size
+        while len(self.pending) > UPLINK_MAX_QUEUE:
+            dropped = self.pending.pop(0)
+            self.pending_bytes -= dropped[3]
+            self.dropped_count += 1
+            logger.warning(f"[UPL] queue full, dropped msg_typ:{dropped[1]} from node {dropped[2]}")
+            self._dropped(dropped)
+        self.wakeup.set()
+        if len(self.pending) >= self.max_items or self.pending_bytes >= self.max_bytes:
+            self.full.set()
+
+    def stats(self):
+        return f"batches:{self.batch_count}, sent:{self.sent_count}, failed:{self.failed_count}, dropped:{self.dropped_count}, pending:{len(self.pending)}"
+
+    def _dropped(self, item):
+        if self.on_drop is None:
+            return
+        try:
+            self.on_drop(item[0], item[1], item[2])
+        except Exception as e:
+            logger.error(f"[UPL] on_drop failed: {e}")
+
+    def _take_batch(self):
+        batch = []
+        size = 2
+        while self.pending and len(batch) < self.max_items:
+            item = self.pending[0]
+            if batch and size + item[3] > self.max_bytes:
+                break
+            batch.append(self.pending.pop(0))
+            size += item[3]
+            self.pending_bytes -= item[3]
+        return batch
+
+    def _requeue(self, items):
+        # failed items go back to the front so they keep their order
+        keep = []
+        for item in items:
+            item[4] += 1
+            if item[4] >= UPLINK_MAX_ATTEMPTS:
+                self.dropped_count += 1
+                logger.error(f"[UPL] giving up on msg_typ:{item[1]} from node {item[2]} after {item[4]} attempts")
+                self._dropped(item)
+            else:
+                keep.append(item)
+                self.pending_bytes += item[3]
+        self.pending = keep + self.pending
+
+    async def _wait_for_window(self):
+        self.full.clear()
+        if len(self.pending) >= self.max_items or self.pending_bytes >= self.max_bytes:
+            return
+        try:
+            await asyncio.wait_for(self.full.wait(), self.window_sec)
+        except asyncio.TimeoutError:
+            pass
+
+    async def upload_batch(self, batch):
+        # Input: batch: list of pending items; Output: bool True if the POST itself went through
+        results = []
+        def on_response(resp):
+            r = resp.get("results")
+            if isinstance(r, list):
+                results.extend(r)
+
+        payloads = [item[0] for item in batch]
+        t0 = utime.ticks_ms()
+        ok = await self.upload_fn(payloads, on_response)
+        elapsed = utime.ticks_diff(utime.ticks_ms(), t0)
+        self.batch_count += 1
+        if not ok:
+            self.failed_count += len(batch)
+            logger.warning(f"[UPL] batch of {len(batch)} items failed after {elapsed} ms, re-queued")
+            self._requeue(batch)
+            return False
+
+        failed = []
+        for i in range(len(batch)):
+            item_ok, err = item_result(results, i)
+            if item_ok:
+                self.sent_count += 1
+            else:
+                self.failed_count += 1
+                failed.append(batch[i])
+                logger.warning(f"[UPL] server rejected msg_typ:{batch[i][1]} from node {batch[i][2]}: {err}")
+        if failed:
+            self._requeue(failed)
+        logger.info(f"[UPL] uploaded batch of {len(batch)} items ({len(batch) - len(failed)} accepted) in {elapsed} ms")
+        return True
+
+    async def run(self):
+        # Input: None; Output: None (start once with asyncio.create_task)
+        logger.info(f"[UPL] uplink batcher started, window = {self.window_sec}s, max items = {self.max_items}")
+        while True:
+            try:
+                if not self.pending:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                await self._wait_for_window()
+                batch = self._take_batch()
+                if not batch:
+                    continue
+                if not await self.upload_batch(batch):
+                    await asyncio.sleep(UPLINK_FAILED_PAUSE)
+            except Exception as e:
+                logger.error(f"[UPL] unexpected error in uplink batcher: {e}")
+                await asyncio.sleep(UPLINK_FAILED_PAUSE)
@@ -0,0 +1,148 @@
+"""
+`decode_trace.py`
+===================================================================
+
+Decoder for the binary event trace written by `pkttrace.py` on the nodes
+(`<FS_ROOT>/trace/trace_<n>.bin`).
+
+Every record becomes one row with the union of all record fields (empty where
+a field does not apply). Wall clock time is worked out from the SYNC record
+that starts every file / boot, ticks_ms wrap-around is taken care of.
+
+This script is designed to run on a computer, NOT on the OpenMV board.
+
+Usage:
+    python util/decode_trace.py trace_0.bin trace_1.bin -o trace.csv
+    python util/decode_trace.py /path/to/sdcard/trace/*.bin -o trace.parquet --format parquet   # needs pandas + pyarrow
+"""
+import argparse
+import contextlib
+import csv
+import datetime
+import os
+import struct
+import sys
+
+# Run from anywhere, import pkttrace.py from the netrajaal directory
+NETRAJAAL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if NETRAJAAL_DIR not in sys.path:
+    sys.path.insert(0, NETRAJAAL_DIR)
+
+with contextlib.redirect_stdout(sys.stderr):  # logger prints its setup lines on import
+    import pkttrace
+
+TICKS_PERIOD = 1 << 30     # MicroPython ticks_ms() wraps here
+EPOCH_2000 = 946684800     # add with --epoch-2000 if the board's time.time() counts from 2000
+
+COLUMNS = ["file", "type", "ticks_ms", "time", "node", "uid", "peer", "length", "rssi",
+           "latency_ms", "tries", "img_id", "event", "value", "free_kb", "queued", "unacked",
+           "transport", "msg_type", "ok"]
+
+CHUNK_EVENTS = {
+    pkttrace.CHUNK_BEGIN: "begin", pkttrace.CHUNK_MISSING: "missing", pkttrace.CHUNK_DONE: "done",
+    pkttrace.CHUNK_FAILED: "failed", pkttrace.CHUNK_RECEIVED: "received",
+}
+TRANSPORTS = {pkttrace.UPLOAD_CELLULAR: "cellular", pkttrace.UPLOAD_WIFI: "wifi", pkttrace.UPLOAD_RESUMABLE: "resumable"}
+SIZES = {t: struct.calcsize(fmt) for t, fmt in pkttrace.RECORD_FORMATS.items()}
+
+
+def _uid(b):
+    return b.decode("latin-1")
+
+
+def read_records(path, epoch_offset=0):
+    # Input: path: str trace file, epoch_offset: int sec; Output: generator of row dicts
+    with open(path, "rb") as f:
+        data = f.read()
+    name = os.path.basename(path)
+    pos = 0
+    sync = None            # (ticks_ms, epoch sec, node) of the last SYNC
+    while pos < len(data):
+        rec_type = data[pos]
+        if rec_type not in SIZES:
+            print(f"WARNING - {name}: unknown record type {rec_type} at byte {pos}, skipping rest of file", file=sys.stderr)
+            return
+        size = SIZES[rec_type]
+        if pos + size > len(data):
+            print(f"WARNING - {name}: truncated record at byte {pos}", file=sys.stderr)
+            return
+        fields = struct.unpack_from(pkttrace.RECORD_FORMATS[rec_type], data, pos)
+        pos += size
+        ticks = fields[1]
+        row = {"file": name, "type": pkttrace.RECORD_NAMES[rec_type], "ticks_ms": ticks}
+        if rec_type == pkttrace.REC_SYNC:
+            sync = (ticks, fields[2] + epoch_offset, fields[3])
+        if sync is not None:
+            delta = (ticks - sync[0]) % TICKS_PERIOD
+            t = datetime.datetime.fromtimestamp(sync[1] + delta / 1000, tz=datetime.timezone.utc)
+            row["time"] = t.isoformat(timespec="milliseconds")
+            row["node"] = sync[2]
+        if rec_type == pkttrace.REC_TX:
+            row.update(uid=_uid(fields[2]), peer=fields[3], length=fields[4])
+        elif rec_type == pkttrace.REC_RX:
+            row.update(uid=_uid(fields[2]), peer=fields[3], length=fields[4],
+                       rssi=None if fields[5] == pkttrace.NO_RSSI else fields[5])
+        elif rec_type == pkttrace.REC_ACK:
+            row.update(uid=_uid(fields[2]), latency_ms=None if fields[3] == pkttrace.NO_ACK else fields[3],
+                       tries=fields[4], ok=int(fields[3] != pkttrace.NO_ACK))
+        elif rec_type == pkttrace.REC_CHUNK:
+            row.update(img_id=_uid(fields[2]), event=CHUNK_EVENTS.get(fields[3], fields[3]), value=fields[4])
+        elif rec_type == pkttrace.REC_MEM:
+            row.update(free_kb=fields[2], queued=fields[3], unacked=fields[4])
+        elif rec_type == pkttrace.REC_UPLOAD:
+            row.update(transport=TRANSPORTS.get(fields[2], fields[2]), msg_type=chr(fields[3]) if fields[3] else "",
+                       ok=fields[4], latency_ms=fields[5])
+        yield row
+
+
+def _file_order(path):
+    # trace_<n>.bin sorts by n, anything else by name
+    base = os.path.basename(path)
+    try:
+        return (0, int(base[len(pkttrace.TRACE_PREFIX):-len(pkttrace.TRACE_SUFFIX)]), base)
+    except ValueError:
+        return (1, 0, base)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode binary event traces of the nodes to CSV / Parquet")
+    parser.add_argument("inputs", nargs="+", help="trace_<n>.bin files")
+    parser.add_argument("-o", "--output", help="output file (default: CSV on stdout)")
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("--epoch-2000", action="store_true", help="board time.time() counts from 2000-01-01")
+    args = parser.parse_args()
+
+    epoch_offset = EPOCH_2000 if args.epoch_2000 else 0
+    paths = sorted(args.inputs, key=_file_order)
+
+    def rows():
+        for p in paths:
+            yield from read_records(p, epoch_offset)
+
+    count = 0
+    if args.format == "parquet":
+        if not args.output:
+            parser.error("--format parquet needs -o")
+        try:
+            import pandas as pd
+        except ImportError:
+            parser.error("--format parquet needs pandas and pyarrow (pip install pandas pyarrow)")
+        df = pd.DataFrame(list(rows()), columns=COLUMNS)
+        df.to_parquet(args.output, index=False)
+        count = len(df)
+    else:
+        out = open(args.output, "w", newline="") if args.output else sys.stdout
+        try:
+            writer = csv.DictWriter(out, fieldnames=COLUMNS)
+            writer.writeheader()
+            for row in rows():
+                writer.writerow(row)
+                count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    print(f"info - decoded {count} records from {len(paths)} files", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+`decode_uplink.py`
+===================================================================
+
+Batch decoder for the payloads the command center uplinks to the cloud.
+
+Reads a JSONL file where every line is one uplinked payload, as built by
+`hb_process()` / `send_heartbeat()` ("heartbeat") and `event_text_process()` /
+`send_event_text()` ("event_text") in main.py:
+
+    {"machine_id": 221, "message_type": "heartbeat",
+     "heartbeat_data": "<base64 RSA block>", "epoch_ms": 1735689600000}
+
+and writes one JSON record per input line with the decrypted and parsed
+fields. Heartbeats can be the old colon joined text or the binary format of
+`hb_codec.py`. Decryption runs on a process pool; every worker builds the private
+key repo once and decrypts with the CRT form of the key, which is several
+times faster than `enc.decrypt_rsa()`.
+
+This script is designed to run on a computer, NOT on the OpenMV board.
+
+Usage:
+    python util/decode_uplink.py uplink.jsonl -o decoded.jsonl
+    python util/decode_uplink.py uplink.jsonl --follow       # tail the file
+"""
+import argparse
+import base64
+import contextlib
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+# Run from anywhere, import enc_priv / rsa from the netrajaal directory
+NETRAJAAL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if NETRAJAAL_DIR not in sys.path:
+    sys.path.insert(0, NETRAJAAL_DIR)
+
+import hb_codec
+
+BATCH_SIZE = 256           # lines handed to the pool in one go
+FOLLOW_POLL_SEC = 1.0      # how often to check the file for new lines in --follow mode
+
+DATA_KEYS = {
+    "heartbeat": "heartbeat_data",
+    "event_text": "event_data",
+}
+
+# ---------------------------------------------------------------------------
+# Per-process key cache
+# ---------------------------------------------------------------------------
+
+_key_cache = {}  # node addr -> (n, p, q, exp1, exp2, coef, blocksize)
+_key_repo = None
+
+
+def _init_worker():
+    global _key_repo
+    # logger prints its setup lines on import, keep them off the output stream
+    with contextlib.redirect_stdout(sys.stderr):
+        from logger import logger
+        logger.log_level_value = 40  # errors only
+        import enc_priv
+        _key_repo = enc_priv.PrivKeyRepo()
+
+
+def get_key(node_addr):
+    # Input: node_addr: int; Output: tuple of CRT key parts or None if unknown
+    if node_addr in _key_cache:
+        return _key_cache[node_addr]
+    if _key_repo is None:
+        _init_worker()
+    from rsa import common
+    priv = _key_repo.get_pvt_key(node_addr)
+    if priv is None:
+        _key_cache[node_addr] = None
+        return None
+    key = (priv.n, priv.p, priv.q, priv.exp1, priv.exp2, priv.coef, common.byte_size(priv.n))
+    _key_cache[node_addr] = key
+    return key
+
+
+def decrypt_block(crypto, key):
+    # Input: crypto: bytes single RSA block, key: CRT key tuple; Output: bytes cleartext
+    # Same result as enc.decrypt_rsa(), PKCS#1 v1.5 padding removed by hand.
+    from rsa import transform
+    n, p, q, exp1, exp2, coef, blocksize = key
+    c = transform.bytes2int(crypto)
+    if c >= n:
+        raise ValueError("cipher block larger than modulus")
+    m1 = pow(c, exp1, p)
+    m2 = pow(c, exp2, q)
+    m = m2 + ((coef * (m1 - m2)) % p) * q
+    cleartext = transform.int2bytes(m, blocksize)
+    if cleartext[0:2] != b"\x00\x02":
+        raise ValueError("decryption failed, bad padding")
+    sep = cleartext.find(b"\x00", 2)
+    if sep < 10:
+        raise ValueError("decryption failed, bad padding")
+    return cleartext[sep + 1:]
+
+# ---------------------------------------------------------------------------
+# Payload parsing
+# ---------------------------------------------------------------------------
+
+def _parse_list(s):
+    s = s.strip().strip("[]").strip()
+    if not s:
+        return []
+    return [int(x) for x in s.split(",")]
+
+
+def _parse_gps(s):
+    if not s or "," not in s:
+        return None, None
+    lat, lon = s.split(",", 1)
+    return float(lat), float(lon)
+
+
+def parse_heartbeat(data):
+    # binary (hb_codec.py) or text:
+    # my_addr : uptime : photos taken : events seen : lat,lon : gps_staleness : neighbours : shortest_path
+    if hb_codec.is_binary(data):
+        return hb_codec.decode(data)
+    parts = data.decode().split(":")
+    if len(parts) != 8:
+        raise ValueError(f"heartbeat has {len(parts)} fields, expected 8")
+    lat, lon = _parse_gps(parts[4])
+    return {
+        "node": int(parts[0]),
+        "uptime_sec": int(parts[1]),
+        "total_images": int(parts[2]),
+        "person_images": int(parts[3]),
+        "lat": lat,
+        "lon": lon,
+        "gps_staleness": int(parts[5]),
+        "neighbours": _parse_list(parts[6]),
+        "shortest_path": _parse_list(parts[7]),
+    }
+
+
+def parse_event_text(data):
+    # my_addr : epoch_ms : lat,lon : gps_staleness
+    parts = data.decode().split(":")
+    if len(parts) != 4:
+        raise ValueError(f"event text has {len(parts)} fields, expected 4")
+    lat, lon = _parse_gps(parts[2])
+    return {
+        "node": int(parts[0]),
+        "event_epoch_ms": int(parts[1]),
+        "lat": lat,
+        "lon": lon,
+        "gps_staleness": int(parts[3]),
+    }
+
+
+PARSERS = {
+    "heartbeat": parse_heartbeat,
+    "event_text": parse_event_text,
+}
+
+
+def decode_line(line):
+    # Input: line: str one JSONL record; Output: dict decoded record (always has "ok")
+    try:
+        payload = json.loads(line)
+    except ValueError as e:
+        return {"ok": False, "error": f"bad json: {e}"}
+    msg_typ = payload.get("message_type")
+    record = {
+        "machine_id": payload.get("machine_id"),
+        "message_type": msg_typ,
+        "epoch_ms": payload.get("epoch_ms"),
+        "ok": False,
+    }
+    if msg_typ not in DATA_KEYS:
+        record["error"] = f"unsupported message_type {msg_typ}"
+        return record
+    try:
+        raw = base64.b64decode(payload[DATA_KEYS[msg_typ]])
+        key = get_key(int(payload["machine_id"]))
+        if key is None:
+            record["error"] = f"no private key for {payload['machine_id']}"
+            return record
+        if len(raw) == key[6]:
+            cleartext = decrypt_block(raw, key)
+        else:
+            cleartext = raw  # sent unencrypted (ENCRYPTION_ENABLED = False or > 117 bytes)
+        record.update(PARSERS[msg_typ](cleartext))
+        record["ok"] = True
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def read_batches(f, follow):
+    # Input: f: binary file, follow: bool; Output: generator of lists of str lines
+    batch = []
+    while True:
+        line = f.readline()
+        if line:
+            if not line.endswith(b"\n") and follow:
+                # partial line, writer is still busy with it
+                f.seek(f.tell() - len(line))
+            else:
+                if line.strip():
+                    batch.append(line.decode())
+                if len(batch) >= BATCH_SIZE:
+                    yield batch
+                    batch = []
+                continue
+        if batch:
+            yield batch
+            batch = []
+        if not follow:
+            return
+        time.sleep(FOLLOW_POLL_SEC)
+
+
+def run(in_path, out, workers, follow):
+    # Input: in_path: str, out: text file, workers: int, follow: bool; Output: tuple(total, failed)
+    total = 0
+    failed = 0
+    t0 = time.time()
+    with Pool(processes=workers, initializer=_init_worker) as pool, open(in_path, "rb") as f:
+        for batch in read_batches(f, follow):
+            chunksize = max(1, len(batch) // (workers * 4))
+            for record in pool.imap(decode_line, batch, chunksize=chunksize):
+                total += 1
+                if not record["ok"]:
+                    failed += 1
+                out.write(json.dumps(record) + "\n")
+            out.flush()
+    elapsed = time.time() - t0
+    rate = total / elapsed if elapsed > 0 else 0
+    print(f"info - decoded {total} payloads ({failed} failed) in {elapsed:.2f}s, {rate:.0f}/s", file=sys.stderr)
+    return total, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decrypt and parse uplinked heartbeats / event texts")
+    parser.add_argument("input", help="JSONL file of uplinked payloads")
+    parser.add_argument("-o", "--output", help="output JSONL file (default: stdout)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="decoder processes")
+    parser.add_argument("-f", "--follow", action="store_true", help="keep tailing the input file")
+    args = parser.parse_args()
+
+    out = open(args.output, "a" if args.follow else "w") if args.output else sys.stdout
+    try:
+        run(args.input, out, max(1, args.workers), args.follow)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
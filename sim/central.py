@@ -2,10 +2,8 @@ import json
 import time
 import io
 import base64
-from PIL import Image
 
-from .. import image
-from .. import constants
+import constants
 
 class NodeInfo:
     def __init__(self, devid):
@@ -117,6 +115,7 @@ class CommandCentral:
             print(f" --- At CC Noticed rerouting from {msg_spath} to {path_so_far}")
 
     def consume_image(self, msg):
+        import image  # repo root image.py, needs PIL
         imf = f"/tmp/camera_captures_test/Image_CC_{msg['constants.JK_SOURCE']}_{msg['constants.JK_IMAGE_TS']}.jpg"
         print(f" %%%%%% ==== CC got an image from {msg['constants.JK_SOURCE']}, will save to {imf}")
         im = image.imstrtoimage(msg[constants.JK_IMAGE_DATA])
@@ -0,0 +1,296 @@
+"""
+Discrete-event mesh simulator: the Device / CommandCentral protocol of this
+directory on a virtual clock, for fields of 100+ nodes.
+
+network_sim.py delivers every message with a direct method call (so a spath
+spread or a heartbeat relay recurses through the whole mesh) and sleeps on
+wall time. Here every transmission is an event in a priority queue:
+
+    EventQueue   : heap of (virtual time, seq, callback), run() pops in order
+    RadioMedium  : adjacency from Layout (cached there), airtime per frame at
+                   AIR_SPEED, a busy transmitter queues frames, overlapping
+                   receptions at a node collide, a node does not hear while
+                   it transmits, optional loss per frame
+    EventCommunicator : drop-in for IPCCommunicator (add_dev, send_to_network)
+
+Devices scan every SCAN_WAIT, send a heartbeat every HB_WAIT, the CC sends
+spath every SPATH_WAIT (names and defaults as in netrajaal/main.py), each with
+a random phase. Hours of a 200-node grid take seconds.
+
+Usage:
+    python event_sim.py --nodes 200 --hours 3
+    python event_sim.py --nodes 100 --hb-wait 300 --scan-wait 60 --loss 0.05 --json out.json
+    python event_sim.py --nodes 200 --range-m 250 --spacing-m 100
+    python event_sim.py --latlong ../netrajaal/test/distance-graph/lat-long.txt --range-m 400
+"""
+import argparse
+import contextlib
+import heapq
+import json
+import os
+import random
+import sys
+import time
+
+import layout
+from central import CommandCentral
+from device import Device
+
+AIR_SPEED = 19200          # bps, netrajaal/main.py AIR_SPEED
+SUBPACKET_BYTES = 240      # the E22 module splits longer frames into packets of this size
+AIR_OVERHEAD_BYTES = 12    # preamble, header and CRC per packet, in byte times
+TX_SETUP_MS = 8            # module wake up before each packet
+HB_WAIT = 600              # sec between heartbeats of a unit
+SCAN_WAIT = 30             # sec between scans of a unit
+SPATH_WAIT = 30            # sec between spath rounds of the CC
+CC_ID = "ZZZ"
+
+
+class EventQueue:
+    def __init__(self):
+        self.now = 0.0
+        self.heap = []
+        self.seq = 0
+        self.processed = 0
+
+    def at(self, t, fn, *args):
+        # Input: t: float virtual sec, fn: callable; Output: None (fn(*args) runs at t)
+        self.seq += 1
+        heapq.heappush(self.heap, (t, self.seq, fn, args))
+
+    def after(self, dt, fn, *args):
+        self.at(self.now + dt, fn, *args)
+
+    def every(self, period, fn, first=None, jitter=0.0, rng=None):
+        # Input: period: float sec, fn: callable(); Output: None (fn repeats until the run ends)
+        def tick():
+            fn()
+            self.after(period + (rng.uniform(-jitter, jitter) if jitter else 0), tick)
+        self.at(self.now + (period if first is None else first), tick)
+
+    def run(self, until):
+        # Input: until: float virtual sec; Output: int events processed
+        heap = self.heap
+        while heap and heap[0][0] <= until:
+            t, _, fn, args = heapq.heappop(heap)
+            self.now = t
+            fn(*args)
+            self.processed += 1
+        self.now = until
+        return self.processed
+
+
+class Reception:
+    __slots__ = ("start", "end", "src", "payload", "deliver", "lost")
+
+    def __init__(self, start, end, src, payload, deliver):
+        self.start = start
+        self.end = end
+        self.src = src
+        self.payload = payload
+        self.deliver = deliver   # False when the frame is only interference here (unicast to another node)
+        self.lost = None         # None, "loss", "collision" or "half-duplex"
+
+
+class RadioMedium:
+    def __init__(self, events, sim_layout, rng, air_speed=AIR_SPEED, loss=0.0):
+        self.events = events
+        self.rng = rng
+        self.air_speed = air_speed
+        self.loss = loss
+        # adjacency once, a node does not hear itself
+        self.adjacency = {n: [m for m in sim_layout.get_neighbours(n) if m != n] for n in sim_layout.list_nodes()}
+        self.busy_until = {n: 0.0 for n in self.adjacency}
+        self.tx_log = {n: [] for n in self.adjacency}       # [(start, end)] recent own transmissions
+        self.pending = {n: [] for n in self.adjacency}      # receptions on the air towards n
+        self.receivers = {}                                 # devid -> callable(payload)
+        self.counts = {"tx_frames": 0, "tx_bytes": 0, "airtime_sec": 0.0, "delivered": 0,
+                       "loss": 0, "collision": 0, "half-duplex": 0}
+
+    def airtime(self, length):
+        # Input: length: int bytes; Output: float sec on the air
+        packets = max(1, -(-length // SUBPACKET_BYTES))
+        return packets * TX_SETUP_MS / 1000 + (length + packets * AIR_OVERHEAD_BYTES) * 8 / self.air_speed
+
+    def transmit(self, src, payload, dest=None):
+        # Input: src: devid, payload: str, dest: devid or None (broadcast); Output: bool, False if dest is out of range or the frame is lost to it
+        neighbours = self.adjacency.get(src, [])
+        if dest is not None and dest not in neighbours:
+            return False
+        now = self.events.now
+        start = max(now, self.busy_until[src])
+        end = start + self.airtime(len(payload))
+        self.busy_until[src] = end
+        log = self.tx_log[src]
+        while log and log[0][1] < now:
+            log.pop(0)
+        log.append((start, end))
+        self.counts["tx_frames"] += 1
+        self.counts["tx_bytes"] += len(payload)
+        self.counts["airtime_sec"] += end - start
+        for rec in self.pending[src]:
+            if not rec.lost and rec.start < end and start < rec.end:
+                rec.lost = "half-duplex"
+        delivered_to_dest = True
+        for n in neighbours:
+            rec = Reception(start, end, src, payload, dest is None or dest == n)
+            if rec.deliver and self.loss and self.rng.random() < self.loss:
+                rec.lost = "loss"
+                if dest == n:
+                    delivered_to_dest = False
+            elif any(s < end and start < e for s, e in self.tx_log[n]):
+                rec.lost = "half-duplex"
+            for other in self.pending[n]:
+                if other.start < end and start < other.end:
+                    rec.lost = rec.lost or "collision"
+                    other.lost = other.lost or "collision"
+            self.pending[n].append(rec)
+            self.events.at(end, self._receive, n, rec)
+        return delivered_to_dest
+
+    def _receive(self, n, rec):
+        self.pending[n].remove(rec)
+        if not rec.deliver:
+            return
+        if rec.lost:
+            self.counts[rec.lost] += 1
+            return
+        self.counts["delivered"] += 1
+        self.receivers[n](rec.payload)
+
+
+class EventCommunicator:
+    # Same interface as ipc_communicator.IPCCommunicator, messages travel as JSON on the RadioMedium.
+    # send_to_network returns False when the frame is lost on the way to dest (the loss draw, like
+    # IPCCommunicator's flakiness); a collision is only known at the receiver and drops silently.
+    def __init__(self, radio):
+        self.radio = radio
+        self.dev = {}
+
+    def add_dev(self, devid, devobj):
+        self.dev[devid] = devobj
+        self.radio.receivers[devid] = lambda payload: devobj.process_msg(json.loads(payload))
+
+    def send_to_network(self, msg, devid, dest=None):
+        return self.radio.transmit(devid, json.dumps(msg), dest)
+
+
+def build_field(num_nodes, cc_pos="corner", cols=None, radio_range_m=None, spacing_m=layout.GRID_SPACING_M):
+    # Input: num_nodes: int units (the CC is one more), cc_pos: "corner" or "center"; Output: layout.Layout
+    rows = layout.grid_layout(num_nodes + 1, cols)
+    width = len(rows[0])
+    names = [n for row in rows for n in row][:num_nodes]
+    cc_index = 0 if cc_pos == "corner" else len(rows) // 2 * width + width // 2
+    names.insert(cc_index, CC_ID)
+    return layout.Layout([names[i:i+width] for i in range(0, len(names), width)], radio_range_m, spacing_m)
+
+
+def build_latlong_field(path, radio_range_m, cc_point=1):
+    # Input: path: lat-long.txt, cc_point: 1-based point that is the CC; Output: layout.Layout
+    count = len(layout.load_latlong(path))
+    names = [CC_ID if i + 1 == cc_point else f"P{i+1}" for i in range(count)]
+    return layout.Layout.from_latlong(path, radio_range_m, names)
+
+
+def run(args):
+    # Input: args: argparse.Namespace; Output: dict summary
+    rng = random.Random(args.seed)
+    events = EventQueue()
+    if args.latlong:
+        sim_layout = build_latlong_field(args.latlong, args.range_m, args.cc_point)
+    else:
+        sim_layout = build_field(args.nodes, args.cc, args.cols, args.range_m, args.spacing_m)
+    radio = RadioMedium(events, sim_layout, rng, args.air_speed, args.loss)
+    fcomm = EventCommunicator(radio)
+    cc = CommandCentral(CC_ID, fcomm, None)
+    fcomm.add_dev(CC_ID, cc)
+    devices = []
+    for devid in sim_layout.list_nodes():
+        if devid == CC_ID:
+            continue
+        device = Device(devid, fcomm, None)
+        fcomm.add_dev(devid, device)
+        devices.append(device)
+
+    def ts():
+        return int(events.now * 1e9)
+
+    def spath_known():
+        return sum(1 for d in devices if len(d.spath) >= 2)
+
+    all_spath_at = [None]
+    first_hb_at = {}
+
+    def sample():
+        if all_spath_at[0] is None and spath_known() == len(devices):
+            all_spath_at[0] = round(events.now, 1)
+        for devid in cc.node_list:
+            first_hb_at.setdefault(devid, round(events.now, 1))
+
+    for d in devices:
+        events.every(args.scan_wait, lambda d=d: d.send_scan(ts()), first=rng.uniform(0, args.scan_wait), jitter=args.scan_wait * 0.1, rng=rng)
+        events.every(args.hb_wait, lambda d=d: d.send_hb(ts()), first=rng.uniform(0, args.hb_wait), jitter=args.hb_wait * 0.1, rng=rng)
+    events.every(args.spath_wait, cc.send_spath, first=args.spath_wait)
+    events.every(10, sample)
+
+    until = args.hours * 3600
+    wall = time.monotonic()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        processed = events.run(until)
+    wall = time.monotonic() - wall
+
+    counts = dict(radio.counts)
+    counts["airtime_sec"] = round(counts["airtime_sec"], 1)
+    hb_counts = [info.hb_count for info in cc.node_list.values()]
+    expected_hbs = until / args.hb_wait
+    heard = sorted(first_hb_at.values())
+    return {
+        "nodes": len(devices),
+        "cc": CC_ID,
+        "virtual_sec": until,
+        "wall_sec": round(wall, 2),
+        "events": processed,
+        "radio": counts,
+        "total_airtime_per_sec": round(counts["airtime_sec"] / until, 4), # all transmitters summed, can exceed 1
+        "spath_known": spath_known(),
+        "all_spath_at_sec": all_spath_at[0],
+        "nodes_heard_at_cc": len(cc.node_list),
+        "first_hb_median_sec": heard[len(heard) // 2] if heard else None,
+        "hb_received": cc.num_hbs_received,
+        "hb_rerouted": cc.num_hbs_rerouted,
+        "hb_delivery_ratio": round(sum(hb_counts) / (len(devices) * expected_hbs), 3) if devices else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Discrete-event mesh simulation on a virtual clock")
+    parser.add_argument("--nodes", type=int, default=200, help="camera units, the CC is added")
+    parser.add_argument("--cols", type=int, help="grid width (default square)")
+    parser.add_argument("--cc", choices=["corner", "center"], default="corner", help="where the CC sits")
+    parser.add_argument("--range-m", type=float, help="radio range in metres (default: the 8 surrounding grid cells)")
+    parser.add_argument("--spacing-m", type=float, default=layout.GRID_SPACING_M, help="grid spacing when --range-m is given")
+    parser.add_argument("--latlong", help="node GPS positions instead of a grid, e.g. ../netrajaal/test/distance-graph/lat-long.txt (needs --range-m)")
+    parser.add_argument("--cc-point", type=int, default=1, help="with --latlong, the point that is the CC")
+    parser.add_argument("--hours", type=float, default=3.0, help="virtual hours to run")
+    parser.add_argument("--hb-wait", type=float, default=HB_WAIT)
+    parser.add_argument("--scan-wait", type=float, default=SCAN_WAIT)
+    parser.add_argument("--spath-wait", type=float, default=SPATH_WAIT)
+    parser.add_argument("--air-speed", type=int, default=AIR_SPEED)
+    parser.add_argument("--loss", type=float, default=0.0, help="loss rate per frame")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="keep the prints of the devices")
+    parser.add_argument("--json", help="write the summary here as well")
+    args = parser.parse_args()
+    if args.latlong and args.range_m is None:
+        parser.error("--latlong needs --range-m")
+
+    summary = run(args)
+    text = json.dumps(summary, indent=2)
+    print(text)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,63 @@
+import math
+import re
+
 import constants
 
+GRID_SPACING_M = 100        # metres between grid cells when a radio range is given
+EARTH_RADIUS_M = 6371000
+
+def dms_to_decimal(dms):
+    # Input: dms: str e.g. 34°09'25.7"N; Output: float decimal degrees, negative for S / W
+    m = re.match(r"(\d+)°(\d+)'([\d.]+)\"([NSEW])", dms)
+    d = int(m.group(1)) + int(m.group(2))/60 + float(m.group(3))/3600
+    return -d if m.group(4) in 'SW' else d
+
+def load_latlong(path):
+    # Input: path: lat-long.txt lines "point 1 : 34°09'19.3"N 74°55'58.6"E"; Output: list of (lat, lon)
+    points = []
+    with open(path, 'r') as f:
+        for line in f:
+            if ':' in line:
+                lat_str, lon_str = line.split(':', 1)[1].strip().split()
+                points.append((dms_to_decimal(lat_str), dms_to_decimal(lon_str)))
+    return points
+
 class Layout:
-    def __init__(self):
-        self.inp = constants.node_layout
-        self.node_pos = {}
-        for i in range(len(self.inp)):
-            for j in range(len(self.inp[i])):
-                c = self.inp[i][j]
-                node_name = f"{c}{c}{c}"
-                self.node_pos[node_name] = (i,j)
+    def __init__(self, inp=None, radio_range_m=None, spacing_m=GRID_SPACING_M, positions=None):
+        # inp: rows of node names; default is constants.node_layout where letter X is node "XXX"
+        # radio_range_m: None keeps the 8-connectivity of the grid, else nodes within this many metres hear each other
+        # positions: {name: (x_m, y_m)} instead of a grid, see from_latlong()
+        self.radio_range_m = radio_range_m
+        self.node_pos = {}      # grid (row, col), or metres when radio_range_m is set
+        if positions is not None:
+            self.inp = None
+            self.node_pos = dict(positions)
+        else:
+            if inp is None:
+                inp = [[f"{c}{c}{c}" for c in row] for row in constants.node_layout]
+            self.inp = inp
+            scale = 1 if radio_range_m is None else spacing_m
+            for i in range(len(self.inp)):
+                for j in range(len(self.inp[i])):
+                    node_name = self.inp[i][j]
+                    self.node_pos[node_name] = (i*scale, j*scale)
+        self.adjacency = None   # name -> list of neighbour names, built once on first use
+
+    @classmethod
+    def from_latlong(cls, path, radio_range_m, names=None):
+        # Input: path: lat-long.txt, radio_range_m: float, names: list of node names (default P1, P2, ...); Output: Layout
+        points = load_latlong(path)
+        if names is None:
+            names = [f"P{i+1}" for i in range(len(points))]
+        lat0 = sum(p[0] for p in points) / len(points)
+        lon0 = sum(p[1] for p in points) / len(points)
+        k = math.cos(math.radians(lat0))
+        # equirectangular around the centroid, well under a metre off haversine at field scale
+        positions = {}
+        for name, (lat, lon) in zip(names, points):
+            positions[name] = (EARTH_RADIUS_M * math.radians(lat - lat0),
+                               EARTH_RADIUS_M * math.radians(lon - lon0) * k)
+        return cls(radio_range_m=radio_range_m, positions=positions)
 
     def print_layout(self):
         print(self.node_pos)
@@ -22,18 +71,49 @@ class Layout:
             return False
         (ax,ay) = self.node_pos[a]
         (bx,by) = self.node_pos[b]
-        return abs(ax-bx)<=1 and abs(ay-by) <= 1
+        if self.radio_range_m is None:
+            return abs(ax-bx)<=1 and abs(ay-by) <= 1
+        return math.hypot(ax-bx, ay-by) <= self.radio_range_m
 
     def list_nodes(self):
         return self.node_pos.keys()
 
+    def build_adjacency(self):
+        # Input: None; Output: dict name -> neighbours, from a grid index with cells one radio range wide
+        cell = 1 if self.radio_range_m is None else self.radio_range_m
+        buckets = {}
+        for n, (x, y) in self.node_pos.items():
+            buckets.setdefault((math.floor(x / cell), math.floor(y / cell)), []).append(n)
+        order = {n: i for i, n in enumerate(self.node_pos)}
+        adjacency = {}
+        for a, (x, y) in self.node_pos.items():
+            cx, cy = math.floor(x / cell), math.floor(y / cell)
+            neighbours = []
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for n in buckets.get((cx+dx, cy+dy), ()):
+                        if self.is_neighbour(a, n):
+                            neighbours.append(n)
+            neighbours.sort(key=order.get)   # layout order, as the full scan gave
+            adjacency[a] = neighbours
+        self.adjacency = adjacency
+        return adjacency
+
     def get_neighbours(self, a):
-        neighbours = []
-        ns = self.list_nodes()
-        for n in ns:
-            if self.is_neighbour(a, n):
-                neighbours.append(n)
-        return neighbours
+        # Output: the cached list, do not modify it
+        if a not in self.node_pos:
+            print(f"{a} not found in layout")
+            return []
+        if self.adjacency is None:
+            self.build_adjacency()
+        return self.adjacency[a]
+
+def grid_layout(n, cols=None):
+    # Input: n: int nodes, cols: int or None (square-ish); Output: rows of node names "N000", "N001", ...
+    if cols is None:
+        cols = max(1, int(n ** 0.5 + 0.999))
+    names = [f"N{i:03d}" for i in range(n)]
+    return [names[i:i+cols] for i in range(0, n, cols)]
 
 def main():
     l = Layout()
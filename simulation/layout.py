@@ -1,21 +1,74 @@
+import math
+import re
+
 import constants
 
+GRID_SPACING_M = 100        # metres between grid cells when a radio range is given
+EARTH_RADIUS_M = 6371000
+
+def dms_to_decimal(dms):
+    """Converts a DMS string such as 34°09'25.7"N to decimal degrees (negative for S / W)."""
+    m = re.match(r"(\d+)°(\d+)'([\d.]+)\"([NSEW])", dms)
+    d = int(m.group(1)) + int(m.group(2))/60 + float(m.group(3))/3600
+    return -d if m.group(4) in 'SW' else d
+
+def load_latlong(path):
+    """
+    Reads a lat-long.txt file (lines like: point 1 : 34°09'19.3"N 74°55'58.6"E),
+    as in netrajaal/test/distance-graph, into a list of (lat, lon).
+    """
+    points = []
+    with open(path, 'r') as f:
+        for line in f:
+            if ':' in line:
+                lat_str, lon_str = line.split(':', 1)[1].strip().split()
+                points.append((dms_to_decimal(lat_str), dms_to_decimal(lon_str)))
+    return points
+
 class Layout:
-    def __init__(self):
+    def __init__(self, radio_range_m=None, spacing_m=GRID_SPACING_M, positions=None):
         """
         Initializes the layout from the grid defined in constants.
-        Node positions are stored as (row, col) tuples.
+        Node positions are stored as (row, col) tuples, or in metres when
+        radio_range_m is given: nodes then hear each other within that range
+        instead of in the 8 surrounding cells. positions ({name: (x_m, y_m)})
+        replaces the grid, see from_latlong().
         """
         self.inp = constants.node_layout
+        self.radio_range_m = radio_range_m
         self.node_pos = {}
-        for r, row_list in enumerate(self.inp):
-            for c, char in enumerate(row_list):
-                node_name = f"{char}{char}{char}"
-                self.node_pos[node_name] = (r, c)
+        scale = 1 if radio_range_m is None else spacing_m
+        if positions is not None:
+            self.node_pos = dict(positions)
+        else:
+            for r, row_list in enumerate(self.inp):
+                for c, char in enumerate(row_list):
+                    node_name = f"{char}{char}{char}"
+                    self.node_pos[node_name] = (r * scale, c * scale)
         
-        self.node_pos[constants.CENTRAL_NODE_ID] = (4, 5)
+            self.node_pos[constants.CENTRAL_NODE_ID] = (4 * scale, 5 * scale)
         
         self.gateway_nodes = ["JJJ", "KKK"]
+        self.adjacency = None   # node -> list of neighbours, built once on first use
+
+    @classmethod
+    def from_latlong(cls, path, radio_range_m, names=None):
+        """
+        Builds a layout from real GPS positions. names defaults to P1, P2, ...
+        in file order. Positions are metres on an equirectangular projection
+        around the centroid, well under a metre off haversine at field scale.
+        """
+        points = load_latlong(path)
+        if names is None:
+            names = [f"P{i+1}" for i in range(len(points))]
+        lat0 = sum(p[0] for p in points) / len(points)
+        lon0 = sum(p[1] for p in points) / len(points)
+        k = math.cos(math.radians(lat0))
+        positions = {}
+        for name, (lat, lon) in zip(names, points):
+            positions[name] = (EARTH_RADIUS_M * math.radians(lat - lat0),
+                               EARTH_RADIUS_M * math.radians(lon - lon0) * k)
+        return cls(radio_range_m=radio_range_m, positions=positions)
 
     def get_all_nodes(self):
         """
@@ -44,6 +97,8 @@ class Layout:
             
         (ar, ac) = self.node_pos[a]
         (br, bc) = self.node_pos[b]
+        if self.radio_range_m is not None:
+            return math.hypot(ar - br, ac - bc) <= self.radio_range_m and a != b
         # Nodes are neighbours if their row/col distance is at most 1
         return abs(ar - br) <= 1 and abs(ac - bc) <= 1 and a != b
 
@@ -51,11 +106,35 @@ class Layout:
         """Returns a list of all node IDs."""
         return list(self.node_pos.keys())
 
+    def build_adjacency(self):
+        """
+        Builds the neighbour list of every node once. Nodes are bucketed in a
+        grid with cells one radio range wide, so each node is only tested
+        against the nodes of the 9 cells around it; the gateway links of the
+        central node are added on top.
+        """
+        cell = 1 if self.radio_range_m is None else self.radio_range_m
+        buckets = {}
+        for n, (r, c) in self.node_pos.items():
+            buckets.setdefault((math.floor(r / cell), math.floor(c / cell)), []).append(n)
+        order = {n: i for i, n in enumerate(self.node_pos)}
+        adjacency = {}
+        for a, (r, c) in self.node_pos.items():
+            br, bc = math.floor(r / cell), math.floor(c / cell)
+            candidates = set()
+            for dr in (-1, 0, 1):
+                for dc in (-1, 0, 1):
+                    candidates.update(buckets.get((br + dr, bc + dc), ()))
+            if a == constants.CENTRAL_NODE_ID:
+                candidates.update(g for g in self.gateway_nodes if g in self.node_pos)
+            elif a in self.gateway_nodes and constants.CENTRAL_NODE_ID in self.node_pos:
+                candidates.add(constants.CENTRAL_NODE_ID)
+            adjacency[a] = sorted((n for n in candidates if self.is_neighbour(a, n)), key=order.get)
+        self.adjacency = adjacency
+        return adjacency
+
     def get_neighbours(self, a):
-        """Returns a list of all neighbours for a given node 'a'."""
-        neighbours = []
-        all_nodes = self.list_nodes()
-        for n in all_nodes:
-            if self.is_neighbour(a, n):
-                neighbours.append(n)
-        return neighbours
\ No newline at end of file
+        """Returns the cached list of neighbours of node 'a' (do not modify it)."""
+        if self.adjacency is None:
+            self.build_adjacency()
+        return self.adjacency.get(a, [])
@@ -0,0 +1,33 @@
+# Run with: python -m pytest test_lora_frames.py
+from lora_frames import take_frames, DEFAULT_FREQ_OFFSET
+
+def frame(sender, payload, rssi=None):
+    out = bytearray([sender >> 8, sender & 0xff, DEFAULT_FREQ_OFFSET, len(payload)]) + payload
+    if rssi is not None:
+        out.append(256 + rssi)
+    return out
+
+def test_back_to_back():
+    buf = frame(3, b"H123;hello") + frame(258, b"A456;ok")
+    assert take_frames(buf) == [(3, b"H123;hello", None), (258, b"A456;ok", None)]
+    assert buf == bytearray()
+
+def test_split_frame_waits_for_rest():
+    data = frame(3, b"I789;chunk-data", rssi=-80)
+    buf = bytearray(data[:6])
+    assert take_frames(buf, rssi_byte=True) == []
+    assert buf == data[:6]
+    buf.extend(data[6:])
+    assert take_frames(buf, rssi_byte=True) == [(3, b"I789;chunk-data", -80)]
+    assert buf == bytearray()
+
+def test_misaligned_bytes_are_skipped():
+    # stray bytes, one of them a plausible length, in front of a real frame
+    buf = bytearray(b"\x07\x05\x10") + frame(3, b"H123;hello")
+    assert take_frames(buf) == [(3, b"H123;hello", None)]
+    assert buf == bytearray()
+
+def test_other_freq_offset_is_not_a_header():
+    buf = bytearray([0, 3, DEFAULT_FREQ_OFFSET + 1, 4]) + b"abcd"
+    assert take_frames(buf) == []
+    assert len(buf) < 4